@@ -1,20 +1,27 @@
 import streamlit as st
 import datetime
 import os
+import sys
 import json
+import subprocess
 import time
-import re
-import urllib.parse
-from dataclasses import dataclass
-from typing import List, Dict, Tuple, Optional, Set
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 
-from google import genai
-from google.genai import types
+from parsing import ParsePool, available_html_parsers
+from fetching import HttpCache
+from extraction import ExtractionCache
+from event_store import EventStore
+from dedup import NearDuplicateDetector
+from metrics import STAGE_LABELS, RunProfiler, to_json, to_prometheus
+from result_files import DISPLAY_COLUMNS, EXPORT_FORMATS, HAS_PYARROW, ResultTable, ResultWriter, export_path
+from crawler import (
+    DATA_DIR, PRESET_URLS, CrawlConfig, CrawlEngine, ResultStore, WatermarkStore,
+    build_targets, make_genai_client,
+)
 
 # ============================================================
 # Streamlit config
@@ -27,314 +34,46 @@ st.markdown("""
 """)
 
 # ============================================================
-# Site rules
+# Shared resources（再実行・セッションをまたいで使い回す）
 # ============================================================
-@dataclass(frozen=True)
-class SiteRule:
-    name: str
-    match_netloc: str
-    article_path_allow: re.Pattern
-    listing_next_hint_tokens: Tuple[str, ...] = ("次へ", "次の", "もっと見る", "Next", "NEXT", "More", "MORE")
-    # listingに混ざりがちな不要パス
-    deny_path_prefixes: Tuple[str, ...] = ("/ranking", "/tag", "/tags", "/category", "/categories", "/login", "/signup", "/account")
-    # 本文抽出の優先セレクタ
-    content_selectors: Tuple[str, ...] = ("article", "main", "div.article", "div#main", "div.content")
-
-SITE_RULES: List[SiteRule] = [
-    SiteRule(
-        name="PRTIMES",
-        match_netloc="prtimes.jp",
-        article_path_allow=re.compile(r"^/main/html/rd/p/"),
-        deny_path_prefixes=(
-            "/ranking", "/company", "/categories", "/category", "/tag", "/tags",
-            "/gourmet", "/entertainment", "/fashion", "/beauty", "/sports", "/technology", "/topics",
-        ),
-        content_selectors=("article", "main", "div.main-contents", "div#main", "div.body", "div.content")
-    ),
-    SiteRule(
-        name="AtPress",
-        match_netloc="atpress.ne.jp",
-        article_path_allow=re.compile(r"^/news/\d+"),
-        deny_path_prefixes=("/ranking", "/tag", "/tags", "/category", "/categories", "/login", "/signup", "/account"),
-        content_selectors=("article", "main", "div#main", "div.newsDetail", "div.content")
-    ),
-]
-
-def get_site_rule(url: str) -> Optional[SiteRule]:
-    netloc = urllib.parse.urlparse(url).netloc.lower()
-    for rule in SITE_RULES:
-        if rule.match_netloc in netloc:
-            return rule
-    return None
+@st.cache_resource
+def get_parse_pool(processes: int, parser: str) -> ParsePool:
+    # プロセス起動は重いので、設定が同じ間は再実行をまたいで使い回す
+    return ParsePool(workers=processes, parser=parser)
+
+@st.cache_resource
+def get_http_cache() -> HttpCache:
+    return HttpCache(os.path.join(DATA_DIR, "http_cache.sqlite3"))
+
+@st.cache_resource
+def get_extraction_cache() -> ExtractionCache:
+    return ExtractionCache(os.path.join(DATA_DIR, "extraction_cache.sqlite3"))
+
+@st.cache_resource
+def get_watermark_store() -> WatermarkStore:
+    return WatermarkStore(os.path.join(DATA_DIR, "watermarks.sqlite3"))
+
+@st.cache_resource
+def get_event_store() -> EventStore:
+    return EventStore(os.path.join(DATA_DIR, "events.sqlite3"))
+
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    return ResultStore(DATA_DIR)
+
+@st.cache_resource(max_entries=8)
+def get_result_table(path: str, mtime: float) -> ResultTable:
+    # 同じ結果ファイル（同じ更新時刻）は全セッションで1つを共有する
+    return ResultTable(path)
 
 # ============================================================
-# Utils
+# Session state
 # ============================================================
-def normalize_date(text: str) -> str:
-    if not text or not isinstance(text, str):
-        return ""
-    def rep_ymd(m):
-        return f"{m.group(1)}年{m.group(2).zfill(2)}月{m.group(3).zfill(2)}日"
-    text = re.sub(r"(\d{4})年(\d{1,2})月(\d{1,2})日", rep_ymd, text)
-    text = re.sub(r"(\d{4})/(\d{1,2})/(\d{1,2})", lambda m: f"{m.group(1)}/{m.group(2).zfill(2)}/{m.group(3).zfill(2)}", text)
-    return text.strip()
-
-def normalize_string(text) -> str:
-    if not isinstance(text, str):
-        return ""
-    t = text.replace(" ", "").replace("　", "")
-    t = t.replace("（", "").replace("）", "").replace("(", "").replace(")", "")
-    return t.lower().strip()
-
-def safe_json_parse(json_str: str) -> List[Dict]:
-    if not json_str or not isinstance(json_str, str):
-        return []
-    s = json_str.replace("```json", "").replace("```", "").strip()
-
-    l = s.find("[")
-    r = s.rfind("]")
-    if l != -1 and r != -1 and r > l:
-        cand = s[l:r+1]
-        try:
-            obj = json.loads(cand)
-            return obj if isinstance(obj, list) else []
-        except:
-            pass
-
-    l = s.find("{")
-    r = s.rfind("}")
-    if l != -1 and r != -1 and r > l:
-        cand = s[l:r+1]
-        try:
-            obj = json.loads(cand)
-            return [obj] if isinstance(obj, dict) else []
-        except:
-            pass
-
-    return []
-
-def is_valid_href(href: str) -> bool:
-    if not href:
-        return False
-    h = href.strip()
-    if h.startswith("#"):
-        return False
-    if h.lower().startswith("javascript:"):
-        return False
-    return True
-
-def same_domain(url_a: str, url_b: str) -> bool:
-    try:
-        return urllib.parse.urlparse(url_a).netloc == urllib.parse.urlparse(url_b).netloc
-    except:
-        return False
-
-def fetch_html(session: requests.Session, url: str, timeout=(5, 20), max_retries=2) -> Optional[str]:
-    for attempt in range(max_retries + 1):
-        try:
-            r = session.get(url, timeout=timeout)
-            if r.status_code == 200 and r.text:
-                return r.text
-            if r.status_code in (429, 503) and attempt < max_retries:
-                time.sleep(1.2 * (attempt + 1))
-                continue
-            return None
-        except requests.RequestException:
-            if attempt < max_retries:
-                time.sleep(1.0 * (attempt + 1))
-                continue
-            return None
-    return None
-
-def clean_soup(soup: BeautifulSoup) -> None:
-    # 確実に消したいタグ
-    for t in soup.find_all(["script", "style", "nav", "footer", "iframe", "header", "noscript", "svg"]):
-        try:
-            t.decompose()
-        except Exception:
-            pass
-
-    exclude_tokens = ["sidebar", "ranking", "recommend", "widget", "ad", "bread", "breadcrumb", "banner"]
-
-    # find_all(True)で全tag。壊れ要素耐性をつける
-    for t in soup.find_all(True):
-        if not isinstance(t, Tag):
-            continue
-        attrs = getattr(t, "attrs", None)
-        if not isinstance(attrs, dict):
-            continue
-
-        cls_list = attrs.get("class") or []
-        if not isinstance(cls_list, (list, tuple)):
-            cls_list = [str(cls_list)]
-        cls = " ".join(map(str, cls_list)).lower()
-
-        if any(tok in cls for tok in exclude_tokens):
-            try:
-                t.decompose()
-            except Exception:
-                pass
-
-def extract_main_text(soup: BeautifulSoup, rule: Optional[SiteRule]) -> str:
-    """本文を(できれば)main/articleから抽出、だめなら全部のテキスト"""
-    if rule:
-        for sel in rule.content_selectors:
-            try:
-                node = soup.select_one(sel)
-                if node:
-                    return node.get_text("\n", strip=True)
-            except Exception:
-                continue
-    return soup.get_text("\n", strip=True)
-
-def split_text_into_chunks(text: str, chunk_size=8000, overlap=400):
-    if not text:
-        return
-    start = 0
-    n = len(text)
-    while start < n:
-        end = min(start + chunk_size, n)
-        yield text[start:end]
-        start = max(end - overlap, end)
-
-def find_next_page_url(soup: BeautifulSoup, current_url: str, rule: Optional[SiteRule]) -> Optional[str]:
-    # 1) rel=next
-    link_next = soup.find("link", rel="next")
-    if link_next and link_next.get("href") and is_valid_href(link_next["href"]):
-        joined = urllib.parse.urljoin(current_url, link_next["href"])
-        if same_domain(joined, current_url):
-            return joined
-
-    # 2) a[rel=next]
-    a_next = soup.find("a", rel=lambda v: v and "next" in str(v).lower(), href=True)
-    if a_next and is_valid_href(a_next["href"]):
-        joined = urllib.parse.urljoin(current_url, a_next["href"])
-        if same_domain(joined, current_url):
-            return joined
-
-    # 3) テキストヒント
-    tokens = rule.listing_next_hint_tokens if rule else ("次へ", "次の", "もっと見る", "Next", "More")
-    for a in soup.find_all("a", href=True):
-        try:
-            txt = a.get_text(strip=True)
-        except Exception:
-            continue
-        if any(t in txt for t in tokens):
-            href = a.get("href")
-            if href and is_valid_href(href):
-                joined = urllib.parse.urljoin(current_url, href)
-                if same_domain(joined, current_url):
-                    return joined
-    return None
-
-def is_article_url(url: str, rule: Optional[SiteRule]) -> bool:
-    if not rule:
-        return True  # unknown site: allow (汎用運用)
-    pu = urllib.parse.urlparse(url)
-    path = pu.path or ""
-    low = path.lower()
-
-    if any(low.startswith(p) for p in rule.deny_path_prefixes):
-        return False
-
-    return bool(rule.article_path_allow.search(path))
-
-def extract_article_links_from_listing(
-    soup: BeautifulSoup,
-    current_url: str,
-    rule: Optional[SiteRule],
-    link_limit: int = 80
-) -> List[str]:
-    """一覧ページから記事URLのみ厳密抽出（サイトルール適用）"""
-    base = urllib.parse.urlparse(current_url)
-    out: List[str] = []
-    seen: Set[str] = set()
-
-    for a in soup.find_all("a", href=True):
-        href = a.get("href")
-        if not is_valid_href(href):
-            continue
-        url = urllib.parse.urljoin(current_url, href)
-        pu = urllib.parse.urlparse(url)
-
-        if pu.netloc != base.netloc:
-            continue
-
-        # 最終ゲート：記事URL判定
-        if not is_article_url(url, rule):
-            continue
-
-        if url not in seen:
-            seen.add(url)
-            out.append(url)
-        if len(out) >= link_limit:
-            break
-
-    return out
-
-def ai_extract_events_from_text(
-    client: genai.Client,
-    model_name: str,
-    temperature: float,
-    text: str,
-    today: datetime.date,
-) -> List[Dict]:
-    all_items: List[Dict] = []
-    for chunk in split_text_into_chunks(text, chunk_size=8000, overlap=400):
-        if not chunk or len(chunk) < 120:
-            continue
-
-        prompt = f"""
-以下のWebページ本文から、イベント・ニュース情報をJSON配列で漏れなく抽出してください。
-【現在日付: {today}】
-
-[抽出ルール]
-- 本文に含まれるイベント（展示、催事、キャンペーン、募集、発表会、セミナー等）や、日時・期間・場所が書かれている情報を可能な限り抽出。
-- 省略厳禁。ただし「企業フッタ・問い合わせ先テンプレ」などの非イベント定型文は無理に拾わない。
-- date_info は本文の表記のままでも良いが、可能なら YYYY年MM月DD日 / YYYY/MM/DD / 期間表現（例: 2025年01月01日〜2025年02月01日）。
-- 出力は必ずJSONのみ（説明文は禁止）。
-
-[JSON形式]
-[
-  {{
-    "name": "タイトル",
-    "place": "場所（不明なら空文字）",
-    "date_info": "日付や期間（不明なら空文字）",
-    "description": "概要（短めに）"
-  }}
-]
-
-本文:
-{chunk}
-"""
-        try:
-            res = client.models.generate_content(
-                model=model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=float(temperature)
-                )
-            )
-            extracted = safe_json_parse(res.text)
-            if isinstance(extracted, list):
-                for item in extracted:
-                    if not item or not isinstance(item, dict):
-                        continue
-                    name = str(item.get("name") or "").strip()
-                    if not name:
-                        continue
-                    out = {
-                        "name": name,
-                        "place": str(item.get("place") or "").strip(),
-                        "date_info": normalize_date(str(item.get("date_info") or "").strip()),
-                        "description": str(item.get("description") or "").strip(),
-                    }
-                    all_items.append(out)
-        except Exception:
-            continue
-
-    return all_items
+# 結果はファイル（result_files）に置き、セッションにはそのパスだけを持つ
+if "result_file" not in st.session_state:
+    st.session_state.result_file = None
+if "last_update" not in st.session_state:
+    st.session_state.last_update = None
 
 # ============================================================
 # Sidebar UI
@@ -342,13 +81,6 @@ def ai_extract_events_from_text(
 with st.sidebar:
     st.header("1. 対象サイト")
 
-    PRESET_URLS = {
-        "PRTIMES (グルメ)": "https://prtimes.jp/gourmet/",
-        "PRTIMES (エンタメ)": "https://prtimes.jp/entertainment/",
-        "AtPress (グルメ)": "https://www.atpress.ne.jp/news/food",
-        "AtPress (新着)": "https://www.atpress.ne.jp/news",
-    }
-
     selected_presets = st.multiselect(
         "プリセットから選択",
         options=list(PRESET_URLS.keys()),
@@ -360,280 +92,382 @@ with st.sidebar:
 
     st.divider()
     st.header("2. 探索設定")
+    discovery = st.selectbox(
+        "記事URLの集め方", ["auto", "listing"],
+        format_func={"auto": "フィード/サイトマップ優先（無ければ一覧巡回）", "listing": "常に一覧ページを巡回"}.get,
+        help="サイトルールにフィードが登録されているか、URL欄にRSS/Atom/サイトマップのURLを指定した場合に使われる",
+    )
+    feed_max_age_days = st.slider("フィードから集める記事の新しさ（日、0 = 制限なし）", 0, 365, 30)
     max_pages = st.slider("一覧の最大ページ数（ページ送り回数）", 1, 30, 6)
     link_limit_per_page = st.slider("1ページあたり収集する記事URL上限", 10, 300, 80, step=10)
     max_articles_total = st.slider("総記事数の上限（安全策）", 20, 2000, 400, step=20)
-    sleep_sec = st.slider("アクセス間隔（秒）", 0.0, 2.0, 0.5, step=0.1)
+    incremental = st.checkbox("差分モード（抽出済み記事だけのページで一覧巡回を停止し、抽出済み記事は再解析しない）", value=False)
+    resume = st.checkbox(
+        "中断したクロールを途中から再開する", value=True,
+        help="同じ対象・探索設定で途中経過が残っていれば、処理済みの記事は取得・抽出し直さない。オフにすると途中経過を破棄する",
+    )
+    checkpoint_max_age_hours = st.number_input(
+        "途中経過の有効期限（時間、0 = 無制限）", min_value=0.0, max_value=24.0 * 30, value=12.0, step=1.0,
+        help="これより古い途中経過からは再開しない（古い一覧のまま再開すると、その後の新着を取りこぼすため）",
+    )
+    sleep_sec = st.slider("同一ホストへのアクセス間隔（秒）", 0.0, 2.0, 0.5, step=0.1)
+    host_max_in_flight = st.slider("同一ホストへの同時接続数", 1, 8, 2)
+    use_http_cache = st.checkbox("HTTPキャッシュを使う（記事は再取得せず、一覧は条件付き再検証）", value=True)
+    fetch_workers = st.slider("記事取得の並列数", 1, 16, 4)
+    listing_workers = st.slider(
+        "一覧を同時に巡回するサイト数", 1, 8, 4,
+        help="対象サイトの一覧を並行して辿る。記事URLが最大記事数に達したら全サイトの巡回を止める",
+    )
+    max_response_mb = st.slider(
+        "1ページの最大サイズ（MB、超えたら受信を打ち切る）", 1, 32, 8,
+        help="展開後のサイズ。巨大な一覧や誤って配信されたバイナリで時間とメモリを使い切らないための上限",
+    )
+    parse_workers = st.slider("本文解析の並列数", 1, 8, 2)
+    parse_processes = st.slider(
+        "解析プロセス数（0 = プロセスを使わずスレッド内で解析）", 0, os.cpu_count() or 1, min(4, os.cpu_count() or 1),
+        help="BeautifulSoup の解析は GIL に縛られるため、別プロセスに出すと複数コアを使える",
+    )
+    _parsers = available_html_parsers()
+    html_parser = st.selectbox(
+        "HTMLパーサ", _parsers, index=0,
+        help="lxml は高速だが、壊れたHTMLの解釈が html.parser と異なる場合がある",
+    )
+    llm_workers = st.slider("AI抽出の並列数", 1, 16, 4)
+    profile_run = st.checkbox(
+        "cProfile で関数ごとの所要時間も計測する（調査用・実行が遅くなる）", value=False,
+        help="解析プロセス内の処理は計測されない（解析プロセス数 0 にするとスレッド内で解析され計測対象になる）",
+    )
 
     st.divider()
     st.header("3. Gemini設定")
     model_name = st.text_input("モデル名", value="gemini-2.0-flash")
     temperature = st.slider("temperature（0推奨）", 0.0, 1.0, 0.0, step=0.1)
+    use_extraction_cache = st.checkbox("AI抽出結果をキャッシュする（同一本文は再問い合わせしない）", value=True)
+    llm_rpm = st.number_input("1分あたりのリクエスト上限（RPM）", 1, 10000, 60)
+    llm_tpm = st.number_input("1分あたりのトークン上限（TPM）", 1000, 10_000_000, 1_000_000, step=1000)
+    llm_max_retries = st.slider("AI呼び出しの最大リトライ回数（429/5xx）", 0, 8, 4)
+    use_batching = st.checkbox("短い記事をまとめて1回のAI呼び出しで抽出する（バッチ化）", value=True)
+    batch_max_chars = st.slider("バッチ1回あたりの最大文字数", 4000, 30000, 12000, step=1000)
+    batch_max_items = st.slider("バッチ1回あたりの最大記事数", 2, 20, 8)
+    structured_extraction = st.checkbox(
+        "構造化データ（JSON-LD / microdata）でイベントが読める記事はAIに送らない", value=True,
+        help="schema.org の Event やサイトルールの項目セレクタから名前・日付・会場を直接読む",
+    )
+    relevance_filter = st.checkbox("日付・会場・イベント語の乏しい記事はAIに送らない（関連性フィルタ）", value=True)
+    relevance_threshold = st.slider(
+        "関連性フィルタのしきい値", 0.0, 1.0, 0.3, step=0.05,
+        help="日付表記・会場語・イベント語の出現から 0〜1 で採点し、これ未満の記事は抽出をスキップする",
+    )
 
     st.divider()
-    st.header("4. 既存CSVによる重複除外")
-    uploaded_file = st.file_uploader("過去CSV（重複除外用）", type="csv")
+    st.header("4. 過去イベントとの重複除外")
+    dedup_against_store = st.checkbox("保存済みイベントと重複するものを除外", value=True)
+    near_dup = st.checkbox("表記揺れ・場所欠落の近似重複もまとめる", value=True)
+    near_dup_threshold = st.slider("近似重複とみなすイベント名の類似度", 0.5, 1.0, 0.8, step=0.05)
+    content_dedup = st.checkbox("本文が同じ記事（転載・別URLの同一リリース）はAI抽出を1回にする", value=True)
+    uploaded_file = st.file_uploader("過去CSVをイベントストアに取り込む（初回のみでOK）", type="csv")
+
+    st.divider()
+    st.header("5. 共有クロール結果")
+    result_store = get_result_store()
+    past_runs = result_store.list_runs()
+    if past_runs:
+        run_labels = {
+            r["run_id"]: f'{r["finished_at"]} | {r["count"]}件 | {", ".join(r["targets"])}' for r in past_runs
+        }
+        selected_run = st.selectbox("保存済みの結果", list(run_labels), format_func=run_labels.get)
+        if st.button("この結果を表示"):
+            run = result_store.load(selected_run)
+            if run:
+                st.session_state.result_file = result_store.items_path(selected_run) if run["count"] else None
+                st.session_state.last_update = run["finished_at"]
+                st.session_state.run_metrics = run.get("metrics")
+                st.session_state.run_profile = None
+    else:
+        st.caption("保存済みの結果はまだありません（CLI / バックグラウンド実行の結果もここに並びます）。")
 
 # ============================================================
-# Load existing fingerprints
+# Import past CSV into the event store
 # ============================================================
-existing_fingerprints: Set[Tuple[str, str]] = set()
-if uploaded_file is not None:
+event_store = get_event_store()
+if uploaded_file is not None and st.session_state.get("imported_csv_id") != uploaded_file.file_id:
     try:
-        existing_df = pd.read_csv(uploaded_file)
-        name_col = next((c for c in existing_df.columns if "イベント名" in c or c.lower() in ["name", "title"]), None)
-        place_col = next((c for c in existing_df.columns if "場所" in c or c.lower() in ["place", "location"]), None)
-
-        if name_col:
-            for _, row in existing_df.iterrows():
-                n = normalize_string(row.get(name_col, ""))
-                p = normalize_string(row.get(place_col, "")) if place_col else ""
-                if n:
-                    existing_fingerprints.add((n, p))
-            st.sidebar.success(f"📚 {len(existing_fingerprints)}件の既存データをロード")
+        imported = event_store.import_dataframe(pd.read_csv(uploaded_file))
+        if imported is not None:
+            if near_dup:
+                with st.spinner("近似重複照合用の索引を作成中…"):
+                    event_store.index_missing_bands(NearDuplicateDetector(near_dup_threshold))
+            st.session_state.imported_csv_id = uploaded_file.file_id
+            st.sidebar.success(f"📚 {imported}件の過去イベントを取り込みました")
         else:
-            st.sidebar.warning("CSVにイベント名列が見つかりませんでした（重複除外なしで続行）。")
+            st.sidebar.warning("CSVにイベント名列が見つかりませんでした（取り込みなしで続行）。")
     except Exception as e:
         st.sidebar.error(f"CSV読込エラー: {e}")
-
-# ============================================================
-# Session state
-# ============================================================
-if "extracted_data" not in st.session_state:
-    st.session_state.extracted_data = None
-if "last_update" not in st.session_state:
-    st.session_state.last_update = None
+st.sidebar.caption(f"イベントストア: {event_store.count()}件")
 
 # ============================================================
 # Main
 # ============================================================
-if st.button("一括読み込み開始", type="primary"):
-    # API key
+def to_display_frame(items: List[Dict]) -> pd.DataFrame:
+    df = pd.DataFrame(items)
+    if "also_source_urls" in df.columns:
+        df["also_source_urls"] = df["also_source_urls"].map(
+            lambda v: "\n".join(v) if isinstance(v, list) else (v if isinstance(v, str) else "")
+        )
+    display_df = df.rename(columns=DISPLAY_COLUMNS)
+    cols = [c for c in DISPLAY_COLUMNS.values() if c in display_df.columns]
+    return display_df[cols]
+
+def read_file_bytes(path: str) -> bytes:
+    # st.download_button はファイルオブジェクトを渡しても全体を bytes にしてメモリに置くので、ここで読む。
+    # ダウンロードの間はエクスポート1件分がメモリに載る（大きな結果はサーバ上のファイルを直接使う）
+    with open(path, "rb") as f:
+        return f.read()
+
+def render_metrics_panel(metrics: Dict, profile: Optional[Dict] = None) -> None:
+    stages = metrics.get("stages", {})
+    with st.expander("📊 計測（段階ごとの所要時間・カウンタ）"):
+        if stages:
+            stage_df = pd.DataFrame([
+                {"段階": STAGE_LABELS.get(name, name), "回数": s["count"], "合計(秒)": s["total_s"],
+                 "p50(ms)": s["p50_ms"], "p95(ms)": s["p95_ms"], "最大(ms)": s["max_ms"]}
+                for name, s in stages.items()
+            ])
+            st.dataframe(stage_df, use_container_width=True, hide_index=True)
+        counters = metrics.get("counters", {})
+        if counters:
+            st.dataframe(
+                pd.DataFrame([{"カウンタ": k, "値": v} for k, v in sorted(counters.items())]),
+                use_container_width=True, hide_index=True,
+            )
+        col_json, col_prom, col_prof = st.columns(3)
+        col_json.download_button("📥 JSON", to_json(metrics).encode("utf-8"), "crawl_metrics.json", "application/json")
+        col_prom.download_button(
+            "📥 Prometheus", to_prometheus(metrics).encode("utf-8"), "crawl_metrics.prom", "text/plain",
+        )
+        if profile:
+            col_prof.download_button("📥 cProfile (.prof)", profile["data"], "crawl.prof", "application/octet-stream")
+            st.code(profile["top"], language="text")
+
+config = CrawlConfig(
+    targets=build_targets(selected_presets, custom_urls_text.splitlines() if custom_urls_text else []),
+    discovery=discovery,
+    feed_max_age_days=float(feed_max_age_days),
+    max_pages=max_pages,
+    link_limit_per_page=link_limit_per_page,
+    max_articles_total=max_articles_total,
+    incremental=incremental,
+    resume=resume,
+    checkpoint_max_age_hours=float(checkpoint_max_age_hours),
+    dedup_against_store=dedup_against_store,
+    near_dup=near_dup,
+    near_dup_threshold=near_dup_threshold,
+    content_dedup=content_dedup,
+    structured_extraction=structured_extraction,
+    relevance_filter=relevance_filter,
+    relevance_threshold=relevance_threshold,
+    host_interval_sec=sleep_sec,
+    host_max_in_flight=host_max_in_flight,
+    use_http_cache=use_http_cache,
+    fetch_workers=fetch_workers,
+    listing_workers=listing_workers,
+    max_response_bytes=max_response_mb * 1024 * 1024,
+    parse_workers=parse_workers,
+    parse_processes=parse_processes,
+    html_parser=html_parser,
+    model_name=model_name,
+    temperature=temperature,
+    llm_workers=llm_workers,
+    llm_rpm=int(llm_rpm),
+    llm_tpm=int(llm_tpm),
+    llm_max_retries=llm_max_retries,
+    use_extraction_cache=use_extraction_cache,
+    use_batching=use_batching,
+    batch_max_chars=batch_max_chars,
+    batch_max_items=batch_max_items,
+)
+
+col_run, col_bg, col_cancel = st.columns([1, 1, 1])
+run_clicked = col_run.button("一括読み込み開始", type="primary")
+bg_clicked = col_bg.button("バックグラウンドで実行（タブを閉じても継続）")
+# 実行中に押すとスクリプトが再実行され、前の実行はコールバック内で打ち切られる（CrawlEngine がワーカーを止める）
+cancel_clicked = col_cancel.button("⏹ 中止（取得済みの結果は残す）")
+
+if st.session_state.get("crawl_running"):
+    st.session_state.crawl_running = False
+    partial_file = st.session_state.result_file
+    partial = len(ResultTable(partial_file)) if partial_file and os.path.exists(partial_file) else 0
+    if cancel_clicked:
+        st.info(f"⏹ 中止しました。それまでに抽出した {partial} 件を表示しています。")
+    else:
+        st.warning(f"実行が途中で終了しました。それまでに抽出した {partial} 件を表示しています。")
+
+if run_clicked or bg_clicked:
+    # API key（TREND_APP_FAKE_LLM=1 ならフェイククライアントでAPIを使わない）
+    use_fake_llm = bool(os.environ.get("TREND_APP_FAKE_LLM"))
     api_key = None
     try:
         api_key = st.secrets["GEMINI_API_KEY"]
     except Exception:
         api_key = os.environ.get("GEMINI_API_KEY")
 
-    if not api_key:
+    if not api_key and not use_fake_llm:
         st.error("⚠️ GEMINI_API_KEY が設定されていません（st.secrets または環境変数）。")
         st.stop()
 
-    # targets
-    targets = []
-    for label in selected_presets:
-        targets.append({"url": PRESET_URLS[label], "label": label})
-
-    if custom_urls_text:
-        for u in custom_urls_text.splitlines():
-            u = u.strip()
-            if u.startswith("http"):
-                domain = urllib.parse.urlparse(u).netloc
-                targets.append({"url": u, "label": f"カスタム ({domain})"})
-
-    unique_targets = {t["url"]: t for t in targets}
-    targets = list(unique_targets.values())
-
-    if not targets:
+    if not config.targets:
         st.error("URLを指定してください。")
         st.stop()
 
-    today = datetime.date.today()
-    client = genai.Client(api_key=api_key)
-
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-    })
-
+if bg_clicked:
+    # crawler.py を別プロセスで起動し、結果は共有クロール結果（ResultStore）に保存させる
+    job_dir = os.path.join(DATA_DIR, "jobs")
+    os.makedirs(job_dir, exist_ok=True)
+    job_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    job_config = os.path.join(job_dir, f"{job_id}.json")
+    with open(job_config, "w", encoding="utf-8") as f:
+        json.dump(config.to_dict(), f, ensure_ascii=False)
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawler.py"),
+           "--config", job_config, "--data-dir", DATA_DIR]
+    env = dict(os.environ)
+    if api_key:
+        env["GEMINI_API_KEY"] = api_key
+    log_path = os.path.join(job_dir, f"{job_id}.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env, start_new_session=True)
+    st.info(f"🛰 バックグラウンド実行を開始しました（ログ: {log_path}）。完了後、サイドバーの「共有クロール結果」から表示できます。")
+
+if run_clicked:
     status = st.empty()
     progress = st.progress(0.0)
+    live_table = st.empty()
 
-    # --------------------------------------------------------
-    # 1) Collect article URLs from listings
-    # --------------------------------------------------------
-    collected: List[Tuple[str, str]] = []  # (url, source_label)
-    collected_seen: Set[str] = set()
-    visited_listing: Set[str] = set()
-
-    total_units = max(len(targets) * max_pages, 1)
-    done_units = 0
-
-    for target in targets:
-        base_url = target["url"]
-        label = target["label"]
-        current_url = base_url
-        rule = get_site_rule(current_url)
-
-        for page_num in range(1, max_pages + 1):
-            done_units += 1
-            progress.progress(min(done_units / total_units, 1.0))
-
-            if current_url in visited_listing:
-                status.warning(f"🔁 一覧URL再訪のため停止: {current_url}")
-                break
-            visited_listing.add(current_url)
-
-            status.info(f"📄 一覧取得: {label} | {page_num}/{max_pages}\n{current_url}")
-
-            html = fetch_html(session, current_url)
-            if not html:
-                status.warning(f"アクセス不可: {current_url}")
-                break
-
-            soup = BeautifulSoup(html, "html.parser")
-
-            # 次ページ
-            next_url = find_next_page_url(soup, current_url, rule)
-
-            # 記事URL抽出（厳密）
-            links = extract_article_links_from_listing(soup, current_url, rule, link_limit=link_limit_per_page)
-
-            # 収集
-            add_count = 0
-            for u in links:
-                if u not in collected_seen:
-                    collected_seen.add(u)
-                    collected.append((u, label))
-                    add_count += 1
-
-            status.info(f"🔗 記事URL収集: +{add_count}件（累計 {len(collected)}件）")
-
-            if len(collected) >= max_articles_total:
-                break
-
-            if not next_url:
-                break
-
-            current_url = next_url
-            time.sleep(sleep_sec)
-
-        if len(collected) >= max_articles_total:
-            break
+    # 途中経過は記事ごとにファイルへ追記する（中止・再実行されても残る）
+    result_store = get_result_store()
+    run_id = result_store.new_run_id()
+    writer = ResultWriter(result_store.live_path(run_id))
+    st.session_state.result_file = writer.path
+    st.session_state.last_update = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    st.session_state.crawl_running = True
+    last_render = [0.0]
+    # 実行中の表は直近の分だけ（全件は完了後にページ単位で表示する）
+    recent: deque = deque(maxlen=100)
+
+    def on_status(level: str, message: str) -> None:
+        getattr(status, level)(message)
+
+    def on_items(items: List[Dict]) -> None:
+        writer.write(items)
+        recent.extend(items)
+        # 件数が増えても再描画が詰まらないよう、表の更新は1秒に1回まで
+        now = time.monotonic()
+        if now - last_render[0] >= 1.0:
+            last_render[0] = now
+            with live_table.container():
+                st.caption(f"抽出済み {writer.count} 件（直近 {len(recent)} 件を表示）")
+                st.dataframe(to_display_frame(list(recent)[::-1]), use_container_width=True, hide_index=True)
+
+    engine = CrawlEngine(
+        config,
+        make_genai_client(api_key),
+        data_dir=DATA_DIR,
+        event_store=event_store,
+        http_cache=get_http_cache() if config.use_http_cache else None,
+        extraction_cache=get_extraction_cache() if config.use_extraction_cache else None,
+        watermarks=get_watermark_store() if config.incremental else None,
+        parse_pool=get_parse_pool(config.parse_processes, config.html_parser),
+        on_status=on_status,
+        on_progress=lambda frac: progress.progress(frac),
+        on_items=on_items,
+    )
+    # 中止ボタン等で再実行されスクリプトが途中で打ち切られても、追記先は閉じて書いた分を確定させる
+    try:
+        if profile_run:
+            with RunProfiler() as profiler:
+                result = engine.run()
+            prof_dir = os.path.join(DATA_DIR, "profiles")
+            os.makedirs(prof_dir, exist_ok=True)
+            prof_path = os.path.join(prof_dir, datetime.datetime.now().strftime("%Y%m%d-%H%M%S.prof"))
+            profiler.dump(prof_path)
+            with open(prof_path, "rb") as f:
+                st.session_state.run_profile = {"data": f.read(), "top": profiler.top_text(40)}
+        else:
+            result = engine.run()
+            st.session_state.run_profile = None
+    finally:
+        st.session_state.crawl_running = False
+        writer.close()
+    result_store.save(result, config, run_id=run_id)
+    st.session_state.result_file = result_store.items_path(run_id)
+    progress.empty()
+    live_table.empty()
+    st.session_state.run_metrics = result.metrics
+    render_metrics_panel(result.metrics, st.session_state.run_profile)
 
-    collected = collected[:max_articles_total]
+    stats = result.stats
+    summary = "\n".join(stats.summary_lines())
 
-    if not collected:
-        progress.empty()
+    if result.outcome == "no_new_articles":
+        status.info("🆕 新着記事はありませんでした（差分モード）。")
+        st.session_state.result_file = None
+        st.stop()
+    if result.outcome == "no_articles":
         status.error("一覧ページから記事URLを取得できませんでした。")
-        st.session_state.extracted_data = None
+        st.session_state.result_file = None
         st.stop()
 
-    # --------------------------------------------------------
-    # 2) Extract events from article pages
-    # --------------------------------------------------------
-    status.info(f"🧠 記事ページ解析開始（総 {len(collected)} 件）")
-    extracted_all: List[Dict] = []
-
-    # 重複除外を高速化
-    run_fingerprints: Set[Tuple[str, str]] = set()  # (name_norm, place_norm)
-
-    skipped_duplicate_csv = 0
-    skipped_duplicate_run = 0
-    failed_articles = 0
-    non_article_skipped = 0
-
-    for i, (article_url, label) in enumerate(collected, start=1):
-        progress.progress(min(i / max(len(collected), 1), 1.0))
-        status.info(f"🧠 記事解析 {i}/{len(collected)}: {article_url}")
-
-        rule = get_site_rule(article_url)
-
-        # 最終ゲート：記事URLでなければ解析しない
-        if not is_article_url(article_url, rule):
-            non_article_skipped += 1
-            continue
-
-        html = fetch_html(session, article_url)
-        if not html:
-            failed_articles += 1
-            continue
-
-        soup = BeautifulSoup(html, "html.parser")
-        clean_soup(soup)
-        text = extract_main_text(soup, rule)
-
-        # AI抽出
-        items = ai_extract_events_from_text(client, model_name, temperature, text, today)
-
-        for item in items:
-            n = normalize_string(item.get("name", ""))
-            p = normalize_string(item.get("place", ""))
-
-            if not n:
-                continue
-
-            fp = (n, p)
-
-            if fp in existing_fingerprints:
-                skipped_duplicate_csv += 1
-                continue
-
-            if fp in run_fingerprints:
-                skipped_duplicate_run += 1
-                continue
-
-            run_fingerprints.add(fp)
-
-            item["source_label"] = label
-            item["source_url"] = article_url
-            extracted_all.append(item)
-
-        time.sleep(sleep_sec)
-
-    progress.empty()
-
-    if not extracted_all:
-        status.warning(
-            f"抽出結果が0件でした。\n"
-            f"- 記事失敗: {failed_articles}件\n"
-            f"- 非記事URLスキップ: {non_article_skipped}件\n"
-            f"- CSV除外: {skipped_duplicate_csv}件"
-        )
-        st.session_state.extracted_data = None
+    if not result.items:
+        status.warning(f"抽出結果が0件でした。\n{summary}")
+        st.session_state.result_file = None
         st.stop()
 
-    st.session_state.extracted_data = extracted_all
-    st.session_state.last_update = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    st.session_state.last_update = result.finished_at
 
-    status.success(
-        f"🎉 完了！新規 {len(extracted_all)} 件\n"
-        f"- CSV除外: {skipped_duplicate_csv}件\n"
-        f"- 今回重複除外: {skipped_duplicate_run}件\n"
-        f"- 非記事URLスキップ: {non_article_skipped}件\n"
-        f"- 記事失敗: {failed_articles}件"
-    )
+    if result.outcome == "cancelled":
+        status.info(f"⏹ 中止しました。新規 {len(result.items)} 件\n{summary}")
+    else:
+        status.success(f"🎉 完了！新規 {len(result.items)} 件\n{summary}")
+    if stats.near_duplicate_merges:
+        with st.expander(f"🔗 近似重複としてまとめたイベント（{stats.merged_near_duplicates}件）"):
+            st.dataframe(pd.DataFrame(stats.near_duplicate_merges), use_container_width=True, hide_index=True)
+    if stats.drop_reasons:
+        with st.expander(f"⚠️ AI抽出に失敗して破棄したチャンク（{stats.dropped_chunks}件）"):
+            for reason in stats.drop_reasons:
+                st.text(reason)
 
 # ============================================================
 # Result rendering
 # ============================================================
-if st.session_state.extracted_data:
-    df = pd.DataFrame(st.session_state.extracted_data)
-
-    st.markdown(f"**取得件数: {len(df)}**（更新: {st.session_state.last_update}）")
-
-    display_df = df.rename(columns={
-        "date_info": "期間",
-        "name": "イベント名",
-        "place": "場所",
-        "description": "概要",
-        "source_label": "情報源",
-        "source_url": "URL"
-    })
-
-    desired_cols = ["期間", "イベント名", "場所", "概要", "情報源", "URL"]
-    cols = [c for c in desired_cols if c in display_df.columns]
-    display_df = display_df[cols]
-
-    if "期間" in display_df.columns:
-        try:
-            display_df = display_df.sort_values("期間", na_position="last")
-        except:
-            pass
+# 実行直後は上で表示済み（ダウンロード等の再実行後もここで表示を残す）
+if not run_clicked and st.session_state.get("run_metrics"):
+    render_metrics_panel(st.session_state.run_metrics, st.session_state.get("run_profile"))
+
+result_file = st.session_state.result_file
+if result_file and os.path.exists(result_file):
+    table = get_result_table(result_file, os.path.getmtime(result_file))
+
+    st.markdown(f"**取得件数: {len(table)}**（更新: {st.session_state.last_update}）")
+
+    col_kw, col_src, col_sort, col_size = st.columns([3, 3, 2, 1])
+    keyword = col_kw.text_input("絞り込み（イベント名・場所・概要）")
+    sources = col_src.multiselect("情報源", table.sources())
+    sort = col_sort.selectbox(
+        "並び順", ["date", "arrival"], format_func={"date": "期間（開始日順）", "arrival": "取得順"}.get,
+    )
+    page_size = col_size.selectbox("表示件数", [50, 100, 200, 500], index=1)
+
+    rows, matched = table.query(keyword, sources, sort, page=1, page_size=page_size)
+    pages = max((matched + page_size - 1) // page_size, 1)
+    # 条件が変わったら1ページ目に戻す（キーに条件を含める）
+    page = st.number_input(
+        f"ページ（全 {pages} ページ / {matched} 件）", 1, pages, 1,
+        key=f"result_page:{result_file}:{keyword}:{sources}:{sort}:{page_size}",
+    )
+    if page > 1:
+        rows, _ = table.query(keyword, sources, sort, page=int(page), page_size=page_size)
 
     st.dataframe(
-        display_df,
+        to_display_frame(rows) if rows else pd.DataFrame(columns=list(DISPLAY_COLUMNS.values())),
         use_container_width=True,
         column_config={
             "URL": st.column_config.LinkColumn("元記事", display_text="🔗 Link"),
@@ -642,5 +476,13 @@ if st.session_state.extracted_data:
         hide_index=True
     )
 
-    csv_bytes = display_df.to_csv(index=False).encode("utf-8_sig")
-    st.download_button("📥 CSVダウンロード", csv_bytes, "events_full.csv", "text/csv")
+    # エクスポートは押されたときに作り、結果ファイルが変わるまではディスク上のものを使い回す
+    formats = [fmt for fmt in ("csv", "parquet", "jsonl") if fmt != "parquet" or HAS_PYARROW]
+    for col, fmt in zip(st.columns(len(formats)), formats):
+        col.download_button(
+            f"📥 {fmt.upper()}ダウンロード",
+            lambda fmt=fmt: read_file_bytes(export_path(result_file, fmt)),
+            f"events_full.{fmt}",
+            EXPORT_FORMATS[fmt],
+        )
+    st.caption(f"結果ファイル（サーバ上）: `{result_file}`。ダウンロードは1回分をメモリに読むため、非常に大きな結果はこのファイルを直接使ってください")
@@ -0,0 +1,411 @@
+"""オフラインのベンチマーク（ローカルのフィクスチャサイト + フェイク LLM で phase 1 + phase 2 を通し計測）
+
+PR TIMES 風（127.0.0.1）と @Press 風（localhost）の一覧・記事HTMLを生成してローカルHTTPサーバで配信し、
+応答遅延と 429 を任意の割合で混ぜる。Gemini は fake_llm.FakeGenaiClient に差し替える。
+段階ごと（fetch_html / clean_soup / parse_article_page / extract_structured_events /
+extract_article_links_from_listing / ai_extract_events_from_text / LLM呼び出し / 重複判定）の所要時間の p50・p95、記事スループット、
+ピークメモリを表示し、--json で保存した前回の結果と --compare で比較できる。
+
+    python bench.py --articles 200 --latency-ms 30 --rate-429 0.02 --llm-latency-ms 300 --json bench.json
+    python bench.py --articles 200 --compare bench.json
+"""
+import argparse
+import dataclasses
+import functools
+import http.server
+import json
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import crawler
+import event_store
+import extraction
+import parsing
+from crawler import CrawlConfig, CrawlEngine
+from dedup import NearDuplicateDetector
+from fake_llm import FakeGenaiClient
+from site_rules import SITE_RULES, register_site_rules
+
+# ============================================================
+# Fixture site
+# ============================================================
+_VENUES = ("東京ビッグサイト", "渋谷ヒカリエ", "大阪・梅田スカイビル", "名古屋栄 オアシス21", "横浜赤レンガ倉庫", "福岡天神 特設会場")
+_THEMES = ("いちごスイーツ", "クラフトビール", "北海道物産", "チョコレート", "ご当地ラーメン", "台湾グルメ", "日本酒", "パン")
+_SHOPS = ("パティスリー", "ベーカリー", "ブルワリー", "酒蔵", "珈琲店", "食堂", "ビストロ", "茶房", "製麺所", "菓子舗")
+_ITEMS = ("タルト", "パフェ", "プリン", "ドーナツ", "IPA", "ラガー", "純米吟醸", "塩ラーメン", "魯肉飯", "クロワッサン")
+_AREAS = ("札幌", "仙台", "金沢", "京都", "神戸", "広島", "高知", "熊本", "那覇", "函館", "松本", "長崎")
+_FILLER = (
+    "{area}の{shop}「{name}」が{item}（税込{price}円）を{n}食限定で販売します。",
+    "{area}から初出店の{shop}「{name}」は、{item}など{n}種類をご用意します。",
+    "{shop}「{name}」の店主による{item}の実演を{hour}時から行います。",
+    "{area}産の素材を使った{item}は、会場限定の{price}円でお楽しみいただけます。",
+    "来場者先着{n}名様に、{shop}「{name}」の{item}引換券をプレゼントします。",
+)
+_CHROME = (
+    "<header><nav><a href='/'>トップ</a><a href='/ranking/'>ランキング</a><a href='/login'>ログイン</a></nav></header>"
+    "<aside class='sidebar'><div class='ranking'>{ranking}</div><div class='ad-banner'>広告</div></aside>"
+)
+
+class FixtureSite:
+    """記事・一覧HTMLの生成（同じ seed なら同じ内容）。一部は本文重複（転載）・イベント無関係・
+    JSON-LD（schema.org Event）付きの記事にする"""
+
+    def __init__(self, articles_per_site: int, per_page: int = 20, seed: int = 0,
+                 duplicate_ratio: float = 0.1, irrelevant_ratio: float = 0.2, structured_ratio: float = 0.2):
+        self.n = articles_per_site
+        self.per_page = per_page
+        rng = random.Random(seed)
+        bounds = (
+            ("duplicate", duplicate_ratio),
+            ("irrelevant", duplicate_ratio + irrelevant_ratio),
+            ("structured", duplicate_ratio + irrelevant_ratio + structured_ratio),
+        )
+        self._kind = [
+            next((kind for kind, bound in bounds if r < bound), "event")
+            for r in (rng.random() for _ in range(articles_per_site))
+        ]
+        self._seed = seed
+
+    def article_path(self, site: str, i: int) -> str:
+        if site == "prtimes":
+            return f"/main/html/rd/p/{i + 1:09d}.{1000 + i % 7:09d}.html"
+        return f"/news/{100000 + i}"
+
+    def listing_path(self, site: str, page: int) -> str:
+        base = "/gourmet/" if site == "prtimes" else "/news/food"
+        return base if page == 1 else f"{base}?page={page}"
+
+    def listing_html(self, site: str, page: int) -> str:
+        start = (page - 1) * self.per_page
+        idxs = range(start, min(start + self.per_page, self.n))
+        cards = "".join(
+            f"<li class='item'><a href='{self.article_path(site, i)}'><img src='/img/{i}.jpg'>"
+            f"<h3>リリース {i}</h3></a><a href='/company/{i % 50}'>企業</a></li>" for i in idxs
+        )
+        nxt = f"<a href='{self.listing_path(site, page + 1)}'>次へ</a>" if start + self.per_page < self.n else ""
+        ranking = "".join(f"<a href='{self.article_path(site, j)}'>人気{j}</a>" for j in range(5))
+        return (
+            f"<html><head><title>一覧</title></head><body>{_CHROME.format(ranking=ranking)}"
+            f"<main><ul class='list'>{cards}</ul><div class='pager'>{nxt}</div></main>"
+            f"<footer>© fixture</footer><script>var x = 1;</script></body></html>"
+        )
+
+    def _body(self, site: str, i: int) -> str:
+        rng = random.Random(f"{self._seed}:{site}:{i}")
+        theme, venue = rng.choice(_THEMES), rng.choice(_VENUES)
+        month, day = rng.randint(1, 12), rng.randint(1, 25)
+        if self._kind[i] == "irrelevant":
+            paras = [f"株式会社フィクスチャ{i}は、2025年{month}月期の決算を発表しました。"] + [
+                f"{rng.choice(_AREAS)}事業の売上高は前年同期比{rng.randint(1, 30)}%増の{rng.randint(10, 999)}億円となりました。"
+                for _ in range(8)
+            ]
+        else:
+            paras = [f"「{theme}フェア{i}」を2025年{month}月{day}日（土）から{venue}で開催します。"] + [
+                rng.choice(_FILLER).format(
+                    area=rng.choice(_AREAS), shop=rng.choice(_SHOPS), item=rng.choice(_ITEMS),
+                    name="".join(rng.choice("あかさたなはまやらわ") for _ in range(4)),
+                    price=rng.randint(3, 30) * 100, n=rng.randint(10, 300), hour=rng.randint(10, 18),
+                )
+                for _ in range(12)
+            ] + [f"会期：2025年{month}月{day}日〜{month}月{day + 3}日"]
+        return "".join(f"<p>{p}</p>" for p in paras)
+
+    def article_html(self, site: str, i: int) -> str:
+        # 転載記事：PR TIMES 風は直前の記事と同じ本文（別URL）、@Press 風は同じ番号の PR TIMES 風の記事が
+        # 実際に配信している本文（= PR TIMES 風の直前の記事の本文）。番号 i が転載なら両サイトと直前の記事で同じ本文になる
+        body_site, src = site, i
+        if self._kind[i] == "duplicate":
+            body_site, src = "prtimes", max(i - 1, 0)
+        ranking = "".join(f"<a href='{self.article_path(site, j)}'>人気{j}</a>" for j in range(5))
+        container = "div class='main-contents'" if site == "prtimes" else "div class='newsDetail'"
+        ld = self._jsonld(body_site, src) if self._kind[src] == "structured" else ""
+        return (
+            f"<html><head><title>記事{i}</title><script>gtag()</script>{ld}</head><body>{_CHROME.format(ranking=ranking)}"
+            f"<{container}><article><h1>リリース {body_site}-{src}</h1><time>2025-01-01</time>{self._body(body_site, src)}</article></div>"
+            f"<footer>© fixture</footer></body></html>"
+        )
+
+    def _jsonld(self, site: str, i: int) -> str:
+        # _body と同じ乱数列で、本文冒頭と同じイベントを記述する
+        rng = random.Random(f"{self._seed}:{site}:{i}")
+        theme, venue = rng.choice(_THEMES), rng.choice(_VENUES)
+        month, day = rng.randint(1, 12), rng.randint(1, 25)
+        event = {
+            "@context": "https://schema.org",
+            "@type": "Event",
+            "name": f"{theme}フェア{i}",
+            "startDate": f"2025-{month:02d}-{day:02d}",
+            "endDate": f"2025-{month:02d}-{day + 3:02d}",
+            "location": {"@type": "Place", "name": venue},
+            "description": f"{venue}で{theme}フェアを開催します。",
+        }
+        return f"<script type='application/ld+json'>{json.dumps(event, ensure_ascii=False)}</script>"
+
+def make_handler(site: FixtureSite, latency: float, rate_429: float, seed: int):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    article_ids = {
+        s: {site.article_path(s, i): i for i in range(site.n)} for s in ("prtimes", "atpress")
+    }
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                throttle = rng.random() < rate_429
+            if latency > 0:
+                time.sleep(latency)
+            if throttle:
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            s = "prtimes" if self.headers.get("Host", "").startswith("127.0.0.1") else "atpress"
+            path = self.path
+            body = None
+            if path in article_ids[s]:
+                body = site.article_html(s, article_ids[s][path])
+            else:
+                for page in range(1, site.n // site.per_page + 2):
+                    if path == site.listing_path(s, page):
+                        body = site.listing_html(s, page)
+                        break
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+# ============================================================
+# Stage timers
+# ============================================================
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - t)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, xs in self.samples.items():
+            xs = sorted(xs)
+            out[stage] = {
+                "count": len(xs),
+                "total_s": round(sum(xs), 4),
+                "p50_ms": round(_percentile(xs, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(xs, 0.95) * 1000, 3),
+            }
+        return out
+
+def _percentile(sorted_xs: List[float], q: float) -> float:
+    if not sorted_xs:
+        return 0.0
+    k = (len(sorted_xs) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_xs) - 1)
+    return sorted_xs[lo] + (sorted_xs[hi] - sorted_xs[lo]) * (k - lo)
+
+# (モジュール, 属性名, 段階名)。crawler は from-import しているので両方差し替える
+_INSTRUMENTED = (
+    (crawler, "fetch_html", "fetch_html"),
+    (parsing, "clean_soup", "clean_soup"),
+    (parsing, "parse_article_page", "parse_article_page"),
+    (parsing, "extract_structured_events", "extract_structured_events"),
+    (parsing, "extract_article_links_from_listing", "extract_article_links_from_listing"),
+    (crawler, "ai_extract_events_from_text", "ai_extract_events_from_text"),
+    (extraction, "ai_extract_events_from_text", "ai_extract_events_from_text"),
+    (extraction.LLMEngine, "generate_json", "llm_call"),
+    (event_store.EventStore, "contains", "dedup.store_contains"),
+    (event_store.EventStore, "find_near_duplicate", "dedup.store_near"),
+    (NearDuplicateDetector, "find", "dedup.run_near"),
+    (CrawlEngine, "collect_article_urls", "phase1.collect_article_urls"),
+    (CrawlEngine, "extract_events", "phase2.extract_events"),
+)
+
+def instrument(timer: StageTimer) -> Callable[[], None]:
+    """計測用に関数を差し替え、元に戻す関数を返す"""
+    originals = []
+    for owner, name, stage in _INSTRUMENTED:
+        fn = getattr(owner, name)
+        originals.append((owner, name, fn))
+        setattr(owner, name, timer.wrap(stage, fn))
+
+    def restore() -> None:
+        for owner, name, fn in reversed(originals):
+            setattr(owner, name, fn)
+    return restore
+
+# ============================================================
+# Run
+# ============================================================
+def run_benchmark(args) -> Dict:
+    site = FixtureSite(args.articles // 2, per_page=args.per_page, seed=args.seed)
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_handler(site, args.latency_ms / 1000, args.rate_429, args.seed)
+    )
+    server.daemon_threads = True
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 実サイトと同じ記事URL判定・本文セレクタを、ローカルのホスト名に割り当てる
+    prtimes_rule, atpress_rule = SITE_RULES[0], SITE_RULES[1]
+    register_site_rules([
+        dataclasses.replace(prtimes_rule, match_netloc="127.0.0.1", min_interval_sec=None, max_in_flight=None,
+                            listing_page_param="page"),
+        dataclasses.replace(atpress_rule, match_netloc="localhost", min_interval_sec=None, max_in_flight=None,
+                            listing_page_param="page"),
+    ])
+
+    max_pages = site.n // site.per_page + 1
+    config = CrawlConfig(
+        targets=[
+            {"url": f"http://127.0.0.1:{port}{site.listing_path('prtimes', 1)}", "label": "PRTIMES風"},
+            {"url": f"http://localhost:{port}{site.listing_path('atpress', 1)}", "label": "AtPress風"},
+        ],
+        max_pages=max_pages,
+        # サイドバーのランキング内リンクも数えられるので、その分だけ多めに取る
+        link_limit_per_page=site.per_page + 10,
+        max_articles_total=args.articles,
+        host_interval_sec=args.host_interval,
+        host_max_in_flight=args.host_in_flight,
+        fetch_workers=args.fetch_workers,
+        parse_workers=args.parse_workers,
+        llm_workers=args.llm_workers,
+        llm_rpm=100_000,
+        llm_tpm=1_000_000_000,
+        use_batching=not args.no_batching,
+        checkpoint=False,
+        html_parser=args.parser,
+    )
+    client = FakeGenaiClient(latency=args.llm_latency_ms / 1000, jitter=args.llm_latency_ms / 4000, seed=args.seed)
+
+    data_dir = tempfile.mkdtemp(prefix="trend-bench-")
+    timer = StageTimer()
+    restore = instrument(timer)
+    if args.tracemalloc:
+        tracemalloc.start()
+    try:
+        engine = CrawlEngine(config, client, data_dir=data_dir, on_status=lambda level, msg: None)
+        t0 = time.perf_counter()
+        result = engine.run()
+        wall = time.perf_counter() - t0
+    finally:
+        restore()
+        server.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    stages = timer.summary()
+    phase2 = stages.get("phase2.extract_events", {}).get("total_s", 0.0)
+    collected = result.stats.collected
+    ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = ru / (1024 * 1024) if sys.platform == "darwin" else ru / 1024
+    return {
+        "params": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+        "wall_s": round(wall, 3),
+        "articles": collected,
+        "events": len(result.items),
+        "articles_per_s": round(collected / wall, 3) if wall else 0.0,
+        "phase2_articles_per_s": round(collected / phase2, 3) if phase2 else 0.0,
+        "llm_calls": client.calls,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "tracemalloc_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+        "stages": stages,
+        "summary": result.stats.summary_lines(),
+    }
+
+def print_report(report: Dict, baseline: Optional[Dict] = None) -> None:
+    def delta(cur: float, base: Optional[float]) -> str:
+        if not base:
+            return ""
+        return f" ({(cur - base) / base * 100:+.1f}%)"
+
+    b = baseline or {}
+    print(f"wall: {report['wall_s']}s{delta(report['wall_s'], b.get('wall_s'))}"
+          f" | 記事 {report['articles']} 件 / イベント {report['events']} 件 / LLM呼び出し {report['llm_calls']} 回")
+    print(f"throughput: {report['articles_per_s']} articles/s{delta(report['articles_per_s'], b.get('articles_per_s'))}"
+          f" | phase2 {report['phase2_articles_per_s']} articles/s"
+          f"{delta(report['phase2_articles_per_s'], b.get('phase2_articles_per_s'))}")
+    mem = f"peak RSS: {report['peak_rss_mb']} MB{delta(report['peak_rss_mb'], b.get('peak_rss_mb'))}"
+    if report.get("tracemalloc_peak_mb") is not None:
+        mem += f" | tracemalloc peak: {report['tracemalloc_peak_mb']} MB"
+    print(mem)
+    print()
+    print(f"{'stage':<38}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'total s':>10}")
+    base_stages = b.get("stages", {})
+    for stage, s in sorted(report["stages"].items()):
+        bs = base_stages.get(stage, {})
+        print(f"{stage:<38}{s['count']:>8}{s['p50_ms']:>12.3f}{s['p95_ms']:>12.3f}{s['total_s']:>10.3f}"
+              f"{delta(s['p50_ms'], bs.get('p50_ms'))}")
+    print()
+    for line in report["summary"]:
+        print(line)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="オフラインのクロール性能ベンチマーク")
+    ap.add_argument("--articles", type=int, default=200, help="記事数（2サイトに半分ずつ）")
+    ap.add_argument("--per-page", type=int, default=20, help="一覧1ページあたりの記事数")
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="フィクスチャサーバの応答遅延")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="429 を返す割合（0〜1）")
+    ap.add_argument("--llm-latency-ms", type=float, default=300.0, help="フェイク LLM の応答遅延")
+    ap.add_argument("--host-interval", type=float, default=0.0, help="同一ホストへのアクセス間隔（秒）")
+    ap.add_argument("--host-in-flight", type=int, default=4)
+    ap.add_argument("--fetch-workers", type=int, default=8)
+    ap.add_argument("--parse-workers", type=int, default=2)
+    ap.add_argument("--llm-workers", type=int, default=8)
+    ap.add_argument("--parser", default="html.parser")
+    ap.add_argument("--no-batching", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tracemalloc", action="store_true", help="Python のメモリ確保量も計測する（遅くなる）")
+    ap.add_argument("--json", help="結果を JSON で保存する")
+    ap.add_argument("--compare", help="以前に --json で保存した結果と比較する")
+    args = ap.parse_args(argv)
+
+    report = run_benchmark(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
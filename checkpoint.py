@@ -0,0 +1,120 @@
+"""クロールの途中経過（チェックポイント）の永続化（SQLite）
+
+一覧収集で得た記事URL（フロンティア）・記事ごとの処理状況・採用したイベント・集計を
+一定間隔で書き出し、プロセス再起動や Streamlit の再実行のあとに同じ条件で実行すると
+処理済みの記事を取得・抽出し直さずに続きから再開できる。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# 再開してよい「同じクロール」かどうかを決める設定（取得・抽出の性能設定は変えて再開してよい）
+CHECKPOINT_KEY_FIELDS = (
+    "targets", "discovery", "feed_max_age_days", "max_pages", "link_limit_per_page", "max_articles_total", "incremental",
+)
+
+@dataclass
+class Checkpoint:
+    key: str
+    collected: List[Tuple[str, str]]  # (url, source_label)
+    collected_target: Dict[str, str]  # url -> 一覧URL
+    done: Dict[str, str]  # url -> ArticleResult.status
+    items: List[Dict]  # 採用済みイベント（採用順）
+    stats: Dict
+    updated_at: float
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " key TEXT PRIMARY KEY, stats TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint_frontier ("
+                " key TEXT NOT NULL, seq INTEGER NOT NULL, url TEXT NOT NULL, label TEXT NOT NULL,"
+                " target TEXT NOT NULL, status TEXT, PRIMARY KEY (key, url))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint_items ("
+                " key TEXT NOT NULL, seq INTEGER NOT NULL, item TEXT NOT NULL, PRIMARY KEY (key, seq))"
+            )
+
+    @staticmethod
+    def make_key(config: Dict) -> str:
+        scope = {k: config.get(k) for k in CHECKPOINT_KEY_FIELDS}
+        raw = json.dumps(scope, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def start(self, key: str, collected: List[Tuple[str, str]], collected_target: Dict[str, str], stats: Dict) -> None:
+        """一覧収集が終わった時点のフロンティアを書き出す（同じキーの古い途中経過は捨てる）"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO checkpoints (key, stats, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(stats, ensure_ascii=False), now, now),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_frontier (key, seq, url, label, target, status)"
+                " VALUES (?, ?, ?, ?, ?, NULL)",
+                [(key, i, u, lb, collected_target.get(u, "")) for i, (u, lb) in enumerate(collected)],
+            )
+
+    def record(self, key: str, statuses: List[Tuple[str, str]], items: List[Dict], stats: Dict) -> None:
+        """処理済み記事の状態・新たに採用したイベント・集計を1トランザクションで追記する"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE checkpoint_frontier SET status = ? WHERE key = ? AND url = ?",
+                [(status, key, url) for url, status in statuses],
+            )
+            row = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) FROM checkpoint_items WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO checkpoint_items (key, seq, item) VALUES (?, ?, ?)",
+                [(key, row[0] + 1 + i, json.dumps(item, ensure_ascii=False)) for i, item in enumerate(items)],
+            )
+            self._conn.execute(
+                "UPDATE checkpoints SET stats = ?, updated_at = ? WHERE key = ?",
+                (json.dumps(stats, ensure_ascii=False), time.time(), key),
+            )
+
+    def load(self, key: str) -> Optional[Checkpoint]:
+        with self._lock:
+            head = self._conn.execute("SELECT stats, updated_at FROM checkpoints WHERE key = ?", (key,)).fetchone()
+            if head is None:
+                return None
+            frontier = self._conn.execute(
+                "SELECT url, label, target, status FROM checkpoint_frontier WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+            items = self._conn.execute(
+                "SELECT item FROM checkpoint_items WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+        return Checkpoint(
+            key=key,
+            collected=[(u, lb) for u, lb, _, _ in frontier],
+            collected_target={u: t for u, _, t, _ in frontier},
+            done={u: st for u, _, _, st in frontier if st is not None},
+            items=[json.loads(r[0]) for r in items],
+            stats=json.loads(head[0]),
+            updated_at=head[1],
+        )
+
+    def discard(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._delete(key)
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM checkpoint_frontier WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM checkpoint_items WHERE key = ?", (key,))
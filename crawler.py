@@ -0,0 +1,1141 @@
+"""クロールエンジン（一覧収集 → 記事解析・AI抽出 → 重複除外）とコマンドライン実行
+
+Streamlit に依存しないので、cron 等からヘッドレスに実行できる。結果は ResultStore
+（DATA_DIR/runs）に書き出し、Streamlit UI はそれを読み込んで表示する。
+
+    python crawler.py --preset "PRTIMES (グルメ)" --max-pages 3
+    python crawler.py --config job.json
+"""
+import argparse
+import datetime
+import json
+import os
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, Future
+from dataclasses import dataclass, field, asdict, fields
+from typing import List, Dict, Tuple, Optional, Set, Callable, Iterator
+
+import pandas as pd
+
+from site_rules import canonicalize_url, get_site_rule, is_article_url
+from parsing import ParsedArticle, ParsePool, listing_page_url
+from fetching import MAX_RESPONSE_BYTES, HostScheduler, HttpCache, fetch_html, make_session
+from extraction import (
+    LLMEngine, ExtractionCache, ExtractionBatcher, ExtractionIncomplete,
+    ai_extract_events_from_text, normalize_extracted_items, normalize_string,
+)
+from event_store import EventStore
+from dedup import ContentIndex, NearDuplicateDetector
+from relevance import RelevanceFilter
+from checkpoint import Checkpoint, CheckpointStore
+from feeds import discover_feed_links, feed_urls_for
+from metrics import RunMetrics, RunProfiler, to_json, to_prometheus
+from result_files import write_result_file
+
+# 永続データ（HTTPキャッシュ・抽出キャッシュ・クロール結果等）の置き場所
+DATA_DIR = os.environ.get("TREND_APP_DATA_DIR", ".appdata")
+
+PRESET_URLS = {
+    "PRTIMES (グルメ)": "https://prtimes.jp/gourmet/",
+    "PRTIMES (エンタメ)": "https://prtimes.jp/entertainment/",
+    "AtPress (グルメ)": "https://www.atpress.ne.jp/news/food",
+    "AtPress (新着)": "https://www.atpress.ne.jp/news",
+}
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+)
+
+def build_targets(presets: List[str], custom_urls: List[str]) -> List[Dict[str, str]]:
+    targets = []
+    for label in presets:
+        if label in PRESET_URLS:
+            targets.append({"url": PRESET_URLS[label], "label": label})
+
+    for u in custom_urls:
+        u = u.strip()
+        if u.startswith("http"):
+            domain = urllib.parse.urlparse(u).netloc
+            targets.append({"url": u, "label": f"カスタム ({domain})"})
+
+    unique_targets = {t["url"]: t for t in targets}
+    return list(unique_targets.values())
+
+def make_genai_client(api_key: Optional[str]):
+    """Gemini クライアントを作る（TREND_APP_FAKE_LLM=1 ならAPIを使わないフェイク）"""
+    if os.environ.get("TREND_APP_FAKE_LLM"):
+        from fake_llm import FakeGenaiClient
+        return FakeGenaiClient()
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+# ============================================================
+# Incremental crawl watermark
+# ============================================================
+class WatermarkStore:
+    """ターゲット（一覧URL）ごとに抽出済み記事URLを記録する（差分クロール用）"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS known_articles ("
+                " target TEXT NOT NULL, url TEXT NOT NULL, extracted_at REAL NOT NULL,"
+                " PRIMARY KEY (target, url))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_known_articles_url ON known_articles (url)")
+
+    def _select(self, sql: str, params: List[str], urls: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        # SQLite の変数上限を超えないよう分割
+        for i in range(0, len(urls), 500):
+            part = urls[i:i + 500]
+            marks = ",".join("?" * len(part))
+            with self._lock:
+                rows = self._conn.execute(sql.format(marks=marks), params + part).fetchall()
+            found.update(r[0] for r in rows)
+        return found
+
+    def known_for_target(self, target: str, urls: List[str]) -> Set[str]:
+        return self._select("SELECT url FROM known_articles WHERE target = ? AND url IN ({marks})", [target], urls)
+
+    def extracted_urls(self, urls: List[str]) -> Set[str]:
+        return self._select("SELECT DISTINCT url FROM known_articles WHERE url IN ({marks})", [], urls)
+
+    def mark_extracted(self, target: str, url: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO known_articles (target, url, extracted_at) VALUES (?, ?, ?)",
+                (target, url, time.time()),
+            )
+
+# ============================================================
+# Article pipeline (fetch -> parse/clean -> AI extraction)
+# ============================================================
+@dataclass
+class ArticleResult:
+    url: str
+    label: str
+    # extract_failed は AI 抽出で破棄したチャンクがあったもの（抽出済み・処理済みとして記録しない）
+    status: str  # "ok" | "failed" | "extract_failed" | "non_article" | "irrelevant" | "cancelled"
+    items: List[Dict] = field(default_factory=list)
+    # 本文の代表キー（同じ本文の記事は同じキー）。duplicate は先行記事の抽出結果を流用したもの
+    content_key: str = ""
+    duplicate: bool = False
+    # 構造化データ（JSON-LD 等）から抽出したもの（AI 抽出していない）
+    structured: bool = False
+
+def run_article_pipeline(
+    jobs: List[Tuple[str, str]],
+    fetch_stage: Callable[[str], Optional[str]],
+    parse_stage: Callable[[str, str], ParsedArticle],
+    extract_stage: Callable[[str], List[Dict]],
+    fetch_workers: int = 4,
+    parse_workers: int = 2,
+    llm_workers: int = 4,
+    relevance_stage: Optional[Callable[[str], bool]] = None,
+    cancel: Optional[threading.Event] = None,
+    content_index: Optional[ContentIndex] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> Iterator[ArticleResult]:
+    """記事を段階ごとの並列数上限つきで処理し、結果は jobs と同じ順序で返す
+
+    parse_stage が構造化データからイベントを読めた記事は、関連性判定も AI 抽出もせずそれを使う。
+    relevance_stage が False を返した記事は AI 抽出に回さない（LLM の枠も使わない）。
+    cancel がセットされたら新しい記事は投入せず、処理中の記事も次の段階に進む前に打ち切る（"cancelled"）。
+    AI 抽出まで終わっていた記事は "ok" のまま返し、投入済みの記事の結果は最後まで返す。
+    content_index を渡すと、本文が同じ（ほぼ同じ）記事は AI 抽出せず、最初の記事の抽出結果を待って流用する。
+    """
+    cancel = cancel or threading.Event()
+    fetch_sem = threading.Semaphore(max(1, fetch_workers))
+    parse_sem = threading.Semaphore(max(1, parse_workers))
+    llm_sem = threading.Semaphore(max(1, llm_workers))
+
+    def run_one(url: str, label: str) -> ArticleResult:
+        rule = get_site_rule(url)
+        # 最終ゲート：記事URLでなければ解析しない
+        if not is_article_url(url, rule):
+            return ArticleResult(url, label, "non_article")
+        try:
+            with fetch_sem:
+                if cancel.is_set():
+                    return ArticleResult(url, label, "cancelled")
+                html = fetch_stage(url)
+            if not html:
+                return ArticleResult(url, label, "failed")
+            with parse_sem:
+                if cancel.is_set():
+                    return ArticleResult(url, label, "cancelled")
+                parsed = parse_stage(html, url)
+            text = parsed.text
+            if not parsed.events and relevance_stage is not None and not relevance_stage(text):
+                return ArticleResult(url, label, "irrelevant")
+        except Exception:
+            return ArticleResult(url, label, "failed")
+
+        if content_index is None:
+            key, owned = "", None
+        else:
+            t = time.perf_counter()
+            key, owned, is_owner = content_index.find_or_add(text, Future)
+            if metrics is not None:
+                metrics.observe("content_dedup", time.perf_counter() - t)
+            if not is_owner:
+                # 先行記事の抽出待ち（LLM の枠は使わない）。items は記事ごとに書き換えるので複製する
+                try:
+                    items = owned.result()
+                except CancelledError:
+                    return ArticleResult(url, label, "cancelled", content_key=key)
+                except ExtractionIncomplete:
+                    return ArticleResult(url, label, "extract_failed", content_key=key)
+                except Exception:
+                    return ArticleResult(url, label, "failed", content_key=key)
+                return ArticleResult(url, label, "ok", [dict(i) for i in items], content_key=key, duplicate=True)
+
+        items: List[Dict] = []
+        try:
+            if parsed.events:
+                items = [dict(i) for i in parsed.events]
+            else:
+                with llm_sem:
+                    if cancel.is_set():
+                        # 抽出前に中止：同じ本文を待つ記事も中止扱いにする
+                        if owned is not None:
+                            owned.cancel()
+                        return ArticleResult(url, label, "cancelled", content_key=key)
+                    items = extract_stage(text)
+        except ExtractionIncomplete as e:
+            if owned is not None:
+                owned.set_exception(e)
+            return ArticleResult(url, label, "extract_failed", content_key=key)
+        except BaseException as e:
+            if owned is not None:
+                owned.set_exception(e)
+            return ArticleResult(url, label, "failed", content_key=key)
+        if owned is not None:
+            owned.set_result([dict(i) for i in items])
+        return ArticleResult(url, label, "ok", items, content_key=key, structured=bool(parsed.events))
+
+    # 全ステージが埋まる分だけスレッドを用意し、先読みは一定数に抑える（HTML保持量の上限）
+    total_workers = max(1, fetch_workers) + max(1, parse_workers) + max(1, llm_workers)
+    window = total_workers * 2
+
+    pool = ThreadPoolExecutor(max_workers=total_workers, thread_name_prefix="article")
+    pending: deque = deque()
+    it = iter(jobs)
+    try:
+        for url, label in it:
+            pending.append(pool.submit(run_one, url, label))
+            if len(pending) >= window:
+                break
+        while pending:
+            fut: Future = pending.popleft()
+            result = fut.result()
+            nxt = next(it, None) if not cancel.is_set() else None
+            if nxt is not None:
+                pending.append(pool.submit(run_one, *nxt))
+            yield result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# ============================================================
+# Crawl engine
+# ============================================================
+@dataclass
+class CrawlConfig:
+    # {"url", "label"}。"min_interval_sec" / "max_in_flight" があればそのホストのアクセス間隔・同時接続数を上書きする
+    targets: List[Dict[str, str]] = field(default_factory=list)
+    # 探索（discovery: "auto" = フィードがあればフィード、なければ一覧巡回 / "listing" = 常に一覧巡回）
+    discovery: str = "auto"
+    feed_max_age_days: float = 30.0
+    max_pages: int = 6
+    link_limit_per_page: int = 80
+    max_articles_total: int = 400
+    incremental: bool = False
+    # 途中経過を一定間隔で保存し、同じ条件（対象・探索設定）の次回実行で続きから再開する
+    checkpoint: bool = True
+    checkpoint_interval_sec: float = 10.0
+    resume: bool = True
+    # これより古い途中経過は再開せず捨てる（時間。0 = 無制限）。古い一覧で再開すると、その後の新着を取りこぼす
+    checkpoint_max_age_hours: float = 12.0
+    # 過去に保存したイベント（EventStore）と重複するものを除外する
+    dedup_against_store: bool = True
+    # 表記揺れ・場所欠落の近似重複をまとめる（イベント名の類似度しきい値）
+    near_dup: bool = True
+    near_dup_threshold: float = 0.8
+    # イベントの手がかり（日付・会場・イベント語）が乏しい記事は AI に送らない
+    relevance_filter: bool = True
+    relevance_threshold: float = 0.3
+    # JSON-LD・microdata・サイト別セレクタでイベントが読める記事は AI に送らない
+    structured_extraction: bool = True
+    # 本文が同じ（転載・別URLの同一リリース）記事は AI 抽出を1回にし、掲載URLを追記する
+    content_dedup: bool = True
+    content_dedup_max_distance: int = 3
+    # 取得
+    host_interval_sec: float = 0.5
+    host_max_in_flight: int = 2
+    use_http_cache: bool = True
+    fetch_workers: int = 4
+    # これを超えるページは受信を打ち切って失敗扱い（展開後のバイト数）
+    max_response_bytes: int = MAX_RESPONSE_BYTES
+    # 一覧収集で同時に巡回するターゲット数。listing_prefetch はページ番号の分かるサイトで次ページを先読みする
+    listing_workers: int = 4
+    listing_prefetch: bool = True
+    # 解析
+    parse_workers: int = 2
+    parse_processes: int = 0
+    html_parser: str = "html.parser"
+    # AI抽出
+    model_name: str = "gemini-2.0-flash"
+    temperature: float = 0.0
+    llm_workers: int = 4
+    llm_rpm: int = 60
+    llm_tpm: int = 1_000_000
+    llm_max_retries: int = 4
+    use_extraction_cache: bool = True
+    use_batching: bool = True
+    batch_max_chars: int = 12000
+    batch_max_items: int = 8
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "CrawlConfig":
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in d.items() if k in names})
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+@dataclass
+class CrawlStats:
+    collected: int = 0
+    skipped_known: int = 0
+    skipped_duplicate_store: int = 0
+    merged_near_duplicates: int = 0
+    skipped_duplicate_run: int = 0
+    non_article_skipped: int = 0
+    skipped_irrelevant: int = 0
+    duplicate_content_articles: int = 0
+    structured_articles: int = 0
+    failed_articles: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    batching: bool = False
+    batch_calls: int = 0
+    batched_articles: int = 0
+    batch_fallbacks: int = 0
+    llm_calls: int = 0
+    llm_retries: int = 0
+    dropped_chunks: int = 0
+    drop_reasons: List[str] = field(default_factory=list)
+    # 近似重複としてまとめたもの（kept_* が残した側、dropped_* が除外した側）
+    near_duplicate_merges: List[Dict] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "CrawlStats":
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in d.items() if k in names})
+
+    def summary_lines(self) -> List[str]:
+        batch = (
+            f"- バッチ抽出: {self.batch_calls}回で{self.batched_articles}記事（個別フォールバック {self.batch_fallbacks}件）"
+            if self.batching else "- バッチ抽出: 無効"
+        )
+        return [
+            f"- 過去イベント除外: {self.skipped_duplicate_store}件",
+            f"- 今回重複除外: {self.skipped_duplicate_run}件",
+            f"- 近似重複として統合: {self.merged_near_duplicates}件",
+            f"- 非記事URLスキップ: {self.non_article_skipped}件",
+            f"- 関連性フィルタで抽出スキップ: {self.skipped_irrelevant}件",
+            f"- 本文が重複する記事: {self.duplicate_content_articles}件（抽出結果を流用し掲載URLを追記）",
+            f"- 構造化データから抽出（AI不使用）: {self.structured_articles}件",
+            f"- 記事失敗: {self.failed_articles}件",
+            f"- 抽出済み記事スキップ: {self.skipped_known}件",
+            f"- AI抽出キャッシュ: ヒット {self.cache_hits}件 / ミス {self.cache_misses}件",
+            batch,
+            f"- AI呼び出し: {self.llm_calls}回（リトライ {self.llm_retries}回 / 失敗で破棄したチャンク {self.dropped_chunks}件）",
+        ]
+
+@dataclass
+class CrawlResult:
+    items: List[Dict]
+    stats: CrawlStats
+    # "ok" | "no_articles"（一覧から記事URLが取れない） | "no_new_articles"（差分モードで新着なし）
+    # | "cancelled"（中止。items はそれまでに抽出できた分）
+    outcome: str
+    started_at: str
+    finished_at: str
+    # RunMetrics.to_dict()（段階ごとの所要時間・カウンタ。再開した場合は今回の実行分のみ）
+    metrics: Dict = field(default_factory=dict)
+
+def _print_status(level: str, message: str) -> None:
+    print(f"[{level}] {message}", file=sys.stderr, flush=True)
+
+class CrawlEngine:
+    """一覧収集（phase 1）→ 記事解析・AI抽出（phase 2）→ 重複除外 を行う
+
+    進捗は on_status(level, message) / on_progress(0.0〜1.0) で、記事ごとに採用したイベントは on_items(items) で
+    通知する（いずれも run() を呼んだスレッドから呼ばれる）。cancel() は別スレッドやシグナルハンドラから呼んでよく、
+    run() はそれまでの結果を outcome="cancelled" で返す。コールバックが例外を投げた場合も処理中のワーカーは止める。
+    キャッシュ類を渡さなければ data_dir 配下に自前で開く。
+    """
+
+    def __init__(
+        self,
+        config: CrawlConfig,
+        client,
+        data_dir: str = DATA_DIR,
+        event_store: Optional[EventStore] = None,
+        http_cache: Optional[HttpCache] = None,
+        extraction_cache: Optional[ExtractionCache] = None,
+        watermarks: Optional[WatermarkStore] = None,
+        parse_pool: Optional[ParsePool] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        relevance_classifier: Optional[Callable[[str], float]] = None,
+        on_status: Callable[[str, str], None] = _print_status,
+        on_progress: Callable[[float], None] = lambda frac: None,
+        on_items: Callable[[List[Dict]], None] = lambda items: None,
+    ):
+        self.config = config
+        self.data_dir = data_dir
+        self.event_store = event_store or EventStore(os.path.join(data_dir, "events.sqlite3"))
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_items = on_items
+        self._cancel = threading.Event()
+        self.metrics = RunMetrics()
+
+        cfg = config
+        self.http_cache = (http_cache or HttpCache(os.path.join(data_dir, "http_cache.sqlite3"))) \
+            if cfg.use_http_cache else None
+        self.extraction_cache = (extraction_cache or ExtractionCache(os.path.join(data_dir, "extraction_cache.sqlite3"))) \
+            if cfg.use_extraction_cache else None
+        self.watermarks = (watermarks or WatermarkStore(os.path.join(data_dir, "watermarks.sqlite3"))) \
+            if cfg.incremental else None
+        self.checkpoints = (checkpoints or CheckpointStore(os.path.join(data_dir, "checkpoints.sqlite3"))) \
+            if cfg.checkpoint else None
+        self._owns_parse_pool = parse_pool is None
+        self.parse_pool = parse_pool or ParsePool(workers=cfg.parse_processes, parser=cfg.html_parser)
+
+        self.today = datetime.date.today()
+        self.llm = LLMEngine(
+            client, cfg.model_name, cfg.temperature,
+            rpm=cfg.llm_rpm, tpm=cfg.llm_tpm, max_concurrency=cfg.llm_workers, max_retries=cfg.llm_max_retries,
+        )
+        self.llm.metrics = self.metrics
+        self.batcher = ExtractionBatcher(
+            self.llm, self.today, cache=self.extraction_cache,
+            max_batch_chars=cfg.batch_max_chars, max_batch_items=cfg.batch_max_items,
+        ) if cfg.use_batching else None
+        self.relevance = RelevanceFilter(cfg.relevance_threshold, classifier=relevance_classifier) \
+            if cfg.relevance_filter else None
+
+        # 間隔・同時接続数はホスト単位（別サイト同士は互いを待たない）
+        self.scheduler = HostScheduler(default_interval=cfg.host_interval_sec, default_max_in_flight=cfg.host_max_in_flight)
+        for target in cfg.targets:
+            if target.get("min_interval_sec") is not None or target.get("max_in_flight") is not None:
+                self.scheduler.configure(
+                    urllib.parse.urlparse(target["url"]).netloc,
+                    min_interval=target.get("min_interval_sec"),
+                    max_in_flight=target.get("max_in_flight"),
+                )
+        # 同一ホストへの同時接続がすべてプールに戻れるよう、ホストごとの接続数は実際の同時接続数の上限
+        # （SiteRule・ターゲット単位の上書き込み）の最大に合わせる。一覧の先読みも同じ上限の内側で動く
+        self.session = make_session(
+            USER_AGENT,
+            pool_maxsize=max([self.scheduler.default_max_in_flight] + [
+                self.scheduler.max_in_flight_for(urllib.parse.urlparse(t["url"]).netloc) for t in cfg.targets
+            ]),
+            pool_connections=max(10, 2 * len(cfg.targets)),
+        )
+        self.stats = CrawlStats(batching=self.batcher is not None)
+        # 今回の実行分を数えるための、抽出キャッシュのヒット・ミス数の起点（run() の開始時に取り直す）
+        self._cache_base = (self.extraction_cache.hits, self.extraction_cache.misses) \
+            if self.extraction_cache is not None else (0, 0)
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    # --------------------------------------------------------
+    # 1) Collect article URLs from listings
+    # --------------------------------------------------------
+    def collect_article_urls(self) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
+        """全ターゲットの一覧を並行に巡回し、記事URLを集める
+
+        ターゲットごとにワーカーがフィード→一覧ページの順に辿り、(ターゲット, ページ) ごとの結果を
+        共有のフロンティアに置く。重複を除いた記事URLが max_articles_total に達したら全ワーカーを止める。
+        返す順序はターゲット順・ページ順（並行に取っても従来と同じ並び）。進捗の通知は呼び出し元スレッドから行う。
+        """
+        cfg = self.config
+        targets = cfg.targets
+        lock = threading.Lock()
+        stop = threading.Event()
+        events: "queue.Queue[Tuple]" = queue.Queue()
+        # (ターゲット番号, ページ番号) -> 記事URL。フィードはページ番号 0
+        frontier: Dict[Tuple[int, int], List[str]] = {}
+        seen: Set[str] = set()
+        visited_listing: Set[str] = set()
+
+        since = None
+        if cfg.feed_max_age_days > 0:
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=cfg.feed_max_age_days)
+
+        def should_stop() -> bool:
+            return stop.is_set() or self.cancelled
+
+        def add_links(ti: int, page: int, links: List[str]) -> Tuple[int, int]:
+            """(新規件数, 累計件数)。上限に達したら全体を止める"""
+            with lock:
+                frontier[ti, page] = links
+                new = [u for u in links if u not in seen]
+                seen.update(new)
+                total = len(seen)
+            if total >= cfg.max_articles_total:
+                stop.set()
+            return len(new), total
+
+        def fetch(url: str) -> Optional[str]:
+            return fetch_html(
+                self.session, url, scheduler=self.scheduler, cache=self.http_cache, metrics=self.metrics,
+                max_bytes=cfg.max_response_bytes,
+            )
+
+        prefetcher = ThreadPoolExecutor(max_workers=max(1, len(targets)), thread_name_prefix="listing-prefetch") \
+            if cfg.listing_prefetch else None
+
+        def walk_feeds(ti: int, target: Dict[str, str]) -> bool:
+            """フィード・サイトマップから集められたら True（取れなければ一覧巡回へ）"""
+            base_url, label = target["url"], target["label"]
+            feeds = feed_urls_for(get_site_rule(base_url), base_url) if cfg.discovery == "auto" else []
+            if not feeds:
+                return False
+            events.put(("info", f"📰 フィードから記事URL収集: {label}\n" + "\n".join(feeds)))
+            with lock:
+                remaining = cfg.max_articles_total - len(seen)
+            links = discover_feed_links(
+                self.session, feeds, base_url, since=since,
+                limit=max(min(cfg.max_pages * cfg.link_limit_per_page, remaining), 0),
+                scheduler=self.scheduler, should_stop=should_stop,
+                cache=self.http_cache, metrics=self.metrics, max_bytes=cfg.max_response_bytes,
+            )
+            if links is None:
+                events.put(("warning", f"フィードを取得できないため一覧巡回に切り替え: {label}"))
+                return False
+            events.put(("progress", cfg.max_pages))
+            if self.watermarks is not None and links:
+                known = self.watermarks.known_for_target(base_url, links)
+                links = [u for u in links if u not in known]
+            added, total = add_links(ti, 0, links)
+            events.put(("info", f"🔗 記事URL収集（フィード）: {label} +{added}件（累計 {total}件）"))
+            return True
+
+        def walk_listing(ti: int, target: Dict[str, str]) -> None:
+            base_url, label = target["url"], target["label"]
+            rule = get_site_rule(base_url)
+            current_url = base_url
+            prefetched: Optional[Tuple[str, Future]] = None
+            pages_done = 0
+            try:
+                for page_num in range(1, cfg.max_pages + 1):
+                    if should_stop():
+                        break
+                    with lock:
+                        revisit = current_url in visited_listing
+                        visited_listing.add(current_url)
+                    if revisit:
+                        events.put(("warning", f"🔁 一覧URL再訪のため停止: {current_url}"))
+                        break
+                    pages_done += 1
+                    events.put(("progress", 1))
+                    events.put(("info", f"📄 一覧取得: {label} | {page_num}/{cfg.max_pages}\n{current_url}"))
+
+                    # 先読み済みのページ（予測URLが一覧の次ページリンクと一致したもの）はそれを使う
+                    if prefetched is not None and prefetched[0] == canonicalize_url(current_url):
+                        html = prefetched[1].result()
+                        self.metrics.incr("listing_prefetch_hits")
+                    else:
+                        if prefetched is not None:
+                            prefetched[1].cancel()
+                            self.metrics.incr("listing_prefetch_misses")
+                        html = fetch(current_url)
+                    prefetched = None
+
+                    # 次ページを先読み（解析・差分判定の間に取得を進める）
+                    predicted = listing_page_url(base_url, rule, page_num + 1) \
+                        if prefetcher is not None and page_num < cfg.max_pages else None
+                    if predicted is not None and not should_stop():
+                        prefetched = (canonicalize_url(predicted), prefetcher.submit(fetch, predicted))
+
+                    if not html:
+                        events.put(("warning", f"アクセス不可: {current_url}"))
+                        break
+
+                    # 記事URL抽出（厳密）と次ページ
+                    with self.metrics.timer("parse_listing"):
+                        links, next_url = self.parse_pool.parse_listing(html, current_url, link_limit=cfg.link_limit_per_page)
+
+                    # 差分モード：抽出済みの記事しか無いページに来たら以降は既知
+                    reached_known = False
+                    if self.watermarks is not None and links:
+                        known = self.watermarks.known_for_target(base_url, links)
+                        reached_known = len(known) == len(links)
+                        links = [u for u in links if u not in known]
+
+                    added, total = add_links(ti, page_num, links)
+                    events.put(("info", f"🔗 記事URL収集: {label} +{added}件（累計 {total}件）"))
+
+                    if reached_known:
+                        events.put(("info", f"⏹ 既知記事のみのため一覧巡回を停止: {label}"))
+                        break
+                    if not next_url:
+                        break
+                    current_url = next_url
+            finally:
+                if prefetched is not None:
+                    prefetched[1].cancel()
+                # 途中で止まったターゲットの残りページ分も進捗を進める
+                events.put(("progress", cfg.max_pages - pages_done))
+
+        def walk(ti: int, target: Dict[str, str]) -> None:
+            if should_stop():
+                events.put(("progress", cfg.max_pages))
+                return
+            if not walk_feeds(ti, target):
+                walk_listing(ti, target)
+
+        total_units = max(len(targets) * cfg.max_pages, 1)
+        done_units = 0
+        walkers = ThreadPoolExecutor(max_workers=max(1, min(cfg.listing_workers, len(targets) or 1)),
+                                     thread_name_prefix="listing")
+        try:
+            futures = [walkers.submit(walk, ti, target) for ti, target in enumerate(targets)]
+            pending = set(futures)
+            while pending or not events.empty():
+                # コールバックは呼び出し元スレッドで（Streamlit の描画はワーカーからできない）
+                try:
+                    kind, *payload = events.get(timeout=0.1)
+                except queue.Empty:
+                    pending = {f for f in pending if not f.done()}
+                    if self.cancelled:
+                        stop.set()
+                    continue
+                if kind == "progress":
+                    done_units += payload[0]
+                    self.on_progress(min(done_units / total_units, 1.0))
+                else:
+                    self.on_status(kind, payload[0])
+            for f in futures:
+                f.result()
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            walkers.shutdown(wait=True, cancel_futures=True)
+            if prefetcher is not None:
+                prefetcher.shutdown(wait=False, cancel_futures=True)
+
+        # ターゲット順・ページ順に並べ直す（同じ記事は先のターゲットのラベルで1件）
+        collected: List[Tuple[str, str]] = []  # (url, source_label)
+        collected_target: Dict[str, str] = {}  # url -> 一覧URL（差分モードの記録用）
+        for (ti, _page), links in sorted(frontier.items()):
+            target = targets[ti]
+            for u in links:
+                if u not in collected_target:
+                    collected_target[u] = target["url"]
+                    collected.append((u, target["label"]))
+        collected = collected[:cfg.max_articles_total]
+        return collected, {u: collected_target[u] for u, _ in collected}
+
+    # --------------------------------------------------------
+    # 2) Extract events from article pages
+    # --------------------------------------------------------
+    def _fetch_stage(self, url: str) -> Optional[str]:
+        with self.metrics.timer("fetch"):
+            return fetch_html(
+                self.session, url, scheduler=self.scheduler, cache=self.http_cache, metrics=self.metrics,
+                max_bytes=self.config.max_response_bytes,
+            )
+
+    def _parse_stage(self, html: str, url: str) -> ParsedArticle:
+        with self.metrics.timer("parse_article"):
+            parsed = self.parse_pool.parse_article(html, url, structured=self.config.structured_extraction)
+        self.metrics.incr("html_chars", len(html))
+        self.metrics.incr("text_chars", len(parsed.text or ""))
+        if parsed.events:
+            # AI 抽出と同じ形（日付表記の正規化）にそろえる
+            parsed.events = normalize_extracted_items(parsed.events)
+            self.metrics.incr("structured_events", len(parsed.events))
+        return parsed
+
+    def _relevance_stage(self, text: str) -> bool:
+        with self.metrics.timer("relevance"):
+            return self.relevance.is_relevant(text)
+
+    def _extract_stage(self, text: str) -> List[Dict]:
+        with self.metrics.timer("extract"):
+            if self.batcher is not None:
+                return self.batcher.extract(text)
+            return ai_extract_events_from_text(self.llm, text, self.today, cache=self.extraction_cache)
+
+    def extract_events(
+        self,
+        collected: List[Tuple[str, str]],
+        collected_target: Dict[str, str],
+        resume: Optional[Checkpoint] = None,
+    ) -> List[Dict]:
+        cfg = self.config
+        stats = self.stats
+        extracted_all: List[Dict] = []
+
+        # 重複除外を高速化
+        run_fingerprints: Set[Tuple[str, str]] = set()  # (name_norm, place_norm)
+        pending_store: List[Dict] = []
+        near = NearDuplicateDetector(cfg.near_dup_threshold) if cfg.near_dup else None
+
+        # 再開時：採用済みイベントを今回分として復元し、処理済み記事は飛ばす
+        done: Dict[str, str] = {}
+        if resume is not None:
+            done = resume.done
+            for item in resume.items:
+                run_fingerprints.add(self.event_store.fingerprint(item))
+                if near is not None:
+                    near.add(item)
+            extracted_all.extend(resume.items)
+            if resume.items:
+                self.on_items(list(resume.items))
+            # 前回はストアへの書き込み前に止まった可能性がある（既にあれば無視される）
+            self.event_store.add_many(resume.items)
+        if near is not None and cfg.dedup_against_store:
+            self.event_store.index_missing_bands(near)
+
+        key = resume.key if resume is not None else self._checkpoint_key()
+        ckpt_statuses: List[Tuple[str, str]] = []
+        ckpt_items: List[Dict] = []
+        last_ckpt = time.monotonic()
+
+        def save_checkpoint() -> None:
+            nonlocal ckpt_statuses, ckpt_items, last_ckpt
+            if self.checkpoints is not None and (ckpt_statuses or ckpt_items):
+                self.checkpoints.record(key, ckpt_statuses, ckpt_items, asdict(self._stats_with_run_counters()))
+            ckpt_statuses, ckpt_items = [], []
+            last_ckpt = time.monotonic()
+
+        jobs = [(u, lb) for u, lb in collected if u not in done]
+
+        # バッチ化時は1回の呼び出しに複数記事が乗るので、待機できる記事数を増やす
+        llm_slots = cfg.llm_workers * cfg.batch_max_items if self.batcher is not None else cfg.llm_workers
+
+        results = run_article_pipeline(
+            jobs, self._fetch_stage, self._parse_stage, self._extract_stage,
+            fetch_workers=cfg.fetch_workers,
+            parse_workers=max(cfg.parse_workers, cfg.parse_processes),
+            llm_workers=llm_slots,
+            relevance_stage=self._relevance_stage if self.relevance is not None else None,
+            cancel=self._cancel,
+            content_index=ContentIndex(cfg.content_dedup_max_distance) if cfg.content_dedup else None,
+            metrics=self.metrics,
+        )
+        # 本文キー → その本文の最初の記事で採用したイベント（重複記事のURLを追記する先）
+        content_items: Dict[str, List[Dict]] = {}
+
+        # 結果は収集順に届くので、重複判定は従来どおり先着優先
+        try:
+            for i, result in enumerate(results, start=len(done) + 1):
+                # 中止後も、投入済みで抽出まで終わった記事は採用する（中止された記事は未処理のまま残す）
+                if result.status == "cancelled":
+                    continue
+                if time.monotonic() - last_ckpt >= cfg.checkpoint_interval_sec:
+                    save_checkpoint()
+                self.on_progress(min(i / max(len(collected), 1), 1.0))
+                self.on_status("info", f"🧠 記事解析 {i}/{len(collected)}: {result.url}")
+
+                # AI 抽出が途中で失敗した記事は処理済みにしない（再開・次回の差分実行で取り直す）
+                if result.status == "extract_failed":
+                    stats.failed_articles += 1
+                    continue
+                ckpt_statuses.append((result.url, result.status))
+
+                if result.status == "non_article":
+                    stats.non_article_skipped += 1
+                    continue
+                if result.status == "failed":
+                    stats.failed_articles += 1
+                    continue
+
+                # 関連性フィルタで落とした記事も処理済みとして記録する（差分モードで再取得しない）
+                if self.watermarks is not None:
+                    self.watermarks.mark_extracted(collected_target.get(result.url, ""), result.url)
+
+                if result.status == "irrelevant":
+                    stats.skipped_irrelevant += 1
+                    continue
+
+                if result.content_key and result.content_key in content_items:
+                    stats.duplicate_content_articles += 1
+                    for item in content_items[result.content_key]:
+                        if result.url != item.get("source_url") and result.url not in item["also_source_urls"]:
+                            item["also_source_urls"].append(result.url)
+                    continue
+
+                t_dedup = time.perf_counter()
+                if result.structured:
+                    stats.structured_articles += 1
+                accepted: List[Dict] = []
+                for item in result.items:
+                    n = normalize_string(item.get("name", ""))
+                    p = normalize_string(item.get("place", ""))
+
+                    if not n:
+                        continue
+
+                    fp = (n, p)
+
+                    if fp in run_fingerprints:
+                        stats.skipped_duplicate_run += 1
+                        continue
+
+                    # 今回分もストアに書き込み済みなので、今回重複の判定を先に行う
+                    if cfg.dedup_against_store and self.event_store.contains(fp):
+                        stats.skipped_duplicate_store += 1
+                        continue
+
+                    item["source_label"] = result.label
+                    item["source_url"] = result.url
+                    item["also_source_urls"] = []
+
+                    if near is not None:
+                        scope, match = "run", near.find(item)
+                        if match is None and cfg.dedup_against_store:
+                            scope, match = "store", self.event_store.find_near_duplicate(item, near)
+                        if match is not None:
+                            kept, sim = match
+                            stats.merged_near_duplicates += 1
+                            stats.near_duplicate_merges.append({
+                                "scope": scope,
+                                "similarity": round(sim, 3),
+                                "kept_name": kept.get("name", ""),
+                                "kept_url": kept.get("source_url", ""),
+                                "dropped_name": item["name"],
+                                "dropped_url": result.url,
+                            })
+                            continue
+                        near.add(item)
+
+                    run_fingerprints.add(fp)
+                    accepted.append(item)
+                self.metrics.observe("dedup", time.perf_counter() - t_dedup)
+
+                if result.content_key:
+                    content_items[result.content_key] = accepted
+                extracted_all.extend(accepted)
+                pending_store.extend(accepted)
+                ckpt_items.extend(accepted)
+                if accepted:
+                    self.on_items(accepted)
+
+                if len(pending_store) >= 50:
+                    self._flush_to_store(pending_store, near)
+                    pending_store = []
+        finally:
+            # 中止・例外時も、採用済みの分はストアに残す（次回の重複判定に使う）
+            results.close()
+            self._flush_to_store(pending_store, near)
+            save_checkpoint()
+        return extracted_all
+
+    def _flush_to_store(self, items: List[Dict], near: Optional[NearDuplicateDetector]) -> None:
+        self.event_store.add_many(items)
+        if near is not None:
+            self.event_store.index_missing_bands(near)
+
+    def _stats_with_run_counters(self) -> CrawlStats:
+        """集計に今回の実行分の AI 呼び出し・キャッシュ・バッチの回数を足したもの（self.stats は変えない）
+
+        self.stats は再開時に前回までの分から始まる。途中経過にもこれを保存するので、再開後も通算になる。
+        """
+        stats = CrawlStats.from_dict(asdict(self.stats))
+        cache = self.extraction_cache
+        if cache is not None:
+            hits0, misses0 = self._cache_base
+            stats.cache_hits += cache.hits - hits0
+            stats.cache_misses += cache.misses - misses0
+        if self.batcher is not None:
+            stats.batch_calls += self.batcher.batch_calls
+            stats.batched_articles += self.batcher.batched_articles
+            stats.batch_fallbacks += self.batcher.fallbacks
+        stats.llm_calls += self.llm.calls
+        stats.llm_retries += self.llm.retries
+        stats.dropped_chunks += self.llm.dropped_chunks
+        stats.drop_reasons.extend(self.llm.drop_reasons)
+        return stats
+
+    def _checkpoint_key(self) -> str:
+        return CheckpointStore.make_key(self.config.to_dict())
+
+    def _load_checkpoint(self) -> Optional[Checkpoint]:
+        if self.checkpoints is None:
+            return None
+        key = self._checkpoint_key()
+        if not self.config.resume:
+            self.checkpoints.discard(key)
+            return None
+        ckpt = self.checkpoints.load(key)
+        if ckpt is None or not ckpt.collected:
+            return None
+        max_age = self.config.checkpoint_max_age_hours
+        if max_age > 0 and time.time() - ckpt.updated_at > max_age * 3600:
+            self.checkpoints.discard(key)
+            saved_at = datetime.datetime.fromtimestamp(ckpt.updated_at).strftime("%Y-%m-%d %H:%M:%S")
+            self.on_status("info", f"🗑 途中経過（{saved_at}）は {max_age:g} 時間より古いため破棄し、最初から実行します")
+            return None
+        self.stats = CrawlStats.from_dict(ckpt.stats)
+        self.stats.batching = self.batcher is not None
+        saved_at = datetime.datetime.fromtimestamp(ckpt.updated_at).strftime("%Y-%m-%d %H:%M:%S")
+        self.on_status(
+            "info",
+            f"♻️ 前回の途中経過（{saved_at}）から再開: 処理済み {len(ckpt.done)}/{len(ckpt.collected)} 件・"
+            f"抽出済み {len(ckpt.items)} 件",
+        )
+        return ckpt
+
+    def run(self) -> CrawlResult:
+        started_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cache = self.extraction_cache
+        self._cache_base = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        try:
+            resume = self._load_checkpoint()
+            if resume is not None:
+                collected, collected_target = resume.collected, resume.collected_target
+            else:
+                with self.metrics.timer("phase1"):
+                    collected, collected_target = self.collect_article_urls()
+
+                # 差分モード：他ターゲット経由で抽出済みの記事も除く
+                if self.watermarks is not None and collected:
+                    done = self.watermarks.extracted_urls([u for u, _ in collected])
+                    self.stats.skipped_known = len(done)
+                    collected = [(u, lb) for u, lb in collected if u not in done]
+                self.stats.collected = len(collected)
+
+                if self.checkpoints is not None and collected and not self.cancelled:
+                    self.checkpoints.start(
+                        self._checkpoint_key(), collected, collected_target, asdict(self._stats_with_run_counters()),
+                    )
+
+            if self.cancelled:
+                outcome = "cancelled"
+                items: List[Dict] = []
+            elif not collected:
+                outcome = "no_new_articles" if self.watermarks is not None else "no_articles"
+                items = []
+            else:
+                self.on_status("info", f"🧠 記事ページ解析開始（総 {len(collected)} 件）")
+                with self.metrics.timer("phase2"):
+                    items = self.extract_events(collected, collected_target, resume=resume)
+                outcome = "cancelled" if self.cancelled else "ok"
+            # 最後まで終わったら途中経過は不要（中止・例外時は残して次回再開する）
+            if self.checkpoints is not None and outcome != "cancelled":
+                self.checkpoints.discard(self._checkpoint_key())
+        except BaseException:
+            # UI の再実行（中止ボタン）等で抜けたときも、動いているワーカーを止める
+            self.cancel()
+            raise
+        finally:
+            if self._owns_parse_pool:
+                self.parse_pool.close()
+
+        stats = self._stats_with_run_counters()
+        finished_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return CrawlResult(
+            items=items, stats=stats, outcome=outcome, started_at=started_at, finished_at=finished_at,
+            metrics=self.metrics.to_dict(),
+        )
+
+# ============================================================
+# Result store
+# ============================================================
+class ResultStore:
+    """クロール結果の保存先（data_dir/runs）。ヘッドレス実行が書き、UI は読むだけ
+
+    実行ごとに、メタ情報・設定・集計の JSON と、イベント一覧のファイル（result_files、Parquet か JSON Lines）を置く。
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.root = os.path.join(data_dir, "runs")
+        os.makedirs(self.root, exist_ok=True)
+        self._index = os.path.join(self.root, "index.jsonl")
+
+    @staticmethod
+    def new_run_id() -> str:
+        return datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+    def live_path(self, run_id: str) -> str:
+        """実行中の結果の追記先（result_files.ResultWriter）"""
+        return os.path.join(self.root, f"{run_id}.live.jsonl")
+
+    def save(self, result: CrawlResult, config: CrawlConfig, run_id: Optional[str] = None) -> str:
+        run_id = run_id or self.new_run_id()
+        items_file = os.path.basename(write_result_file(os.path.join(self.root, run_id), result.items))
+        live = self.live_path(run_id)
+        if os.path.exists(live):
+            os.remove(live)
+        meta = {
+            "run_id": run_id,
+            "started_at": result.started_at,
+            "finished_at": result.finished_at,
+            "outcome": result.outcome,
+            "count": len(result.items),
+            "targets": [t["label"] for t in config.targets],
+        }
+        payload = dict(
+            meta, config=config.to_dict(), stats=asdict(result.stats), metrics=result.metrics, items_file=items_file,
+        )
+        path = os.path.join(self.root, f"{run_id}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with open(self._index, "a", encoding="utf-8") as f:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        return run_id
+
+    def list_runs(self, limit: int = 50) -> List[Dict]:
+        if not os.path.exists(self._index):
+            return []
+        with open(self._index, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return list(reversed(rows))[:limit]
+
+    def load(self, run_id: str) -> Optional[Dict]:
+        path = os.path.join(self.root, f"{os.path.basename(run_id)}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def items_path(self, run_id: str) -> Optional[str]:
+        """イベント一覧ファイルのパス。items を JSON に直接持っていた古い形式の結果はここで書き出す"""
+        payload = self.load(run_id)
+        if payload is None:
+            return None
+        if payload.get("items_file"):
+            return os.path.join(self.root, payload["items_file"])
+        return write_result_file(os.path.join(self.root, os.path.basename(run_id)), payload.get("items") or [])
+
+# ============================================================
+# CLI
+# ============================================================
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="イベント情報クローラ（ヘッドレス実行）")
+    ap.add_argument("--config", help="CrawlConfig の JSON ファイル（以降のオプションで上書き）")
+    ap.add_argument("--preset", action="append", default=[], choices=list(PRESET_URLS), help="プリセット（複数可）")
+    ap.add_argument("--url", action="append", default=[], help="一覧URL（複数可）")
+    ap.add_argument("--discovery", choices=["auto", "listing"], help="記事URLの集め方（auto = フィード優先）")
+    ap.add_argument("--max-pages", type=int)
+    ap.add_argument("--max-articles", type=int)
+    ap.add_argument("--incremental", action="store_true", help="差分モード")
+    ap.add_argument("--no-resume", action="store_true", help="途中経過があっても破棄して最初から実行する")
+    ap.add_argument("--model", help="Gemini モデル名")
+    ap.add_argument("--import-csv", help="過去CSVをイベントストアに取り込んでから実行（重複除外に使う）")
+    ap.add_argument("--no-store-dedup", action="store_true", help="過去イベントとの重複除外をしない")
+    ap.add_argument("--near-dup-threshold", type=float, help="近似重複のしきい値（0 で無効）")
+    ap.add_argument("--relevance-threshold", type=float, help="関連性フィルタのしきい値（0 で無効）")
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--metrics-out", help="段階ごとの計測値の書き出し先（.prom なら Prometheus 形式、それ以外は JSON）")
+    ap.add_argument("--profile", help="cProfile の結果（pstats 形式）の書き出し先。snakeviz 等で開ける")
+    ap.add_argument("--quiet", action="store_true", help="進捗を表示しない")
+    args = ap.parse_args(argv)
+
+    cfg_dict: Dict = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            cfg_dict = json.load(f)
+    config = CrawlConfig.from_dict(cfg_dict)
+    if args.preset or args.url:
+        config.targets = build_targets(args.preset, args.url)
+    if args.discovery:
+        config.discovery = args.discovery
+    if args.max_pages is not None:
+        config.max_pages = args.max_pages
+    if args.max_articles is not None:
+        config.max_articles_total = args.max_articles
+    if args.incremental:
+        config.incremental = True
+    if args.no_resume:
+        config.resume = False
+    if args.model:
+        config.model_name = args.model
+    if args.no_store_dedup:
+        config.dedup_against_store = False
+    if args.near_dup_threshold is not None:
+        config.near_dup = args.near_dup_threshold > 0
+        config.near_dup_threshold = args.near_dup_threshold
+    if args.relevance_threshold is not None:
+        config.relevance_filter = args.relevance_threshold > 0
+        config.relevance_threshold = args.relevance_threshold
+
+    if not config.targets:
+        ap.error("--preset / --url / --config のいずれかで対象を指定してください")
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key and not os.environ.get("TREND_APP_FAKE_LLM"):
+        print("GEMINI_API_KEY が設定されていません。", file=sys.stderr)
+        return 2
+
+    event_store = EventStore(os.path.join(args.data_dir, "events.sqlite3"))
+    if args.import_csv:
+        imported = event_store.import_dataframe(pd.read_csv(args.import_csv))
+        if imported is None:
+            print("CSVにイベント名列が見つかりませんでした（取り込みなしで続行）。", file=sys.stderr)
+
+    engine = CrawlEngine(
+        config, make_genai_client(api_key), data_dir=args.data_dir, event_store=event_store,
+        on_status=(lambda level, msg: None) if args.quiet else _print_status,
+    )
+
+    # Ctrl+C（SIGINT）/ SIGTERM ではそこまでの結果を保存して終える。2回目の Ctrl+C は通常どおり中断
+    def _request_cancel(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        _print_status("warning", "中止を受け付けました。処理中の記事を打ち切り、取得済みの結果を保存します")
+        engine.cancel()
+    signal.signal(signal.SIGINT, _request_cancel)
+    signal.signal(signal.SIGTERM, _request_cancel)
+
+    if args.profile:
+        with RunProfiler() as profiler:
+            result = engine.run()
+        profiler.dump(args.profile)
+    else:
+        result = engine.run()
+    run_id = ResultStore(args.data_dir).save(result, config)
+
+    if args.metrics_out:
+        if args.metrics_out.endswith(".prom"):
+            text = to_prometheus(result.metrics, labels={"outcome": result.outcome})
+        else:
+            text = to_json(dict(result.metrics, run_id=run_id))
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    print(f"run_id={run_id} outcome={result.outcome} 新規 {len(result.items)} 件")
+    for line in result.stats.summary_lines():
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""イベントの近似重複検出（文字 n-gram の MinHash + LSH によるブロッキング）
+
+全件総当たりではなく、イベント名の MinHash 署名をバンドに分けたキーが一致したものだけを
+候補として比較するので、件数が増えてもほぼ線形で済む。バンドキーはバンド番号と署名値を
+固定長で詰めたバイト列の blake2b（64bit）なので、プロセスや Python のバージョンをまたいでも同じ値になり、
+EventStore に保存して過去分との照合にも使える（キーの作り方を変えたら BAND_KEY_VERSION を上げる）。
+
+記事本文そのものの重複（転載・同一リリースの別URL）は ContentIndex で、本文の完全一致ハッシュと
+SimHash のハミング距離で判定する。
+"""
+import hashlib
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from extraction import normalize_string
+
+_MERSENNE_PRIME = (1 << 31) - 1
+# 保存済みバンドキーの形式。EventStore はこれが変わったら索引を作り直す
+BAND_KEY_VERSION = 1
+_NUMBER_RE = re.compile(r"\d+")
+_DATE_PATTERNS = (
+    re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})日"),
+    re.compile(r"(\d{4})/(\d{1,2})/(\d{1,2})"),
+    re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"),
+)
+
+def char_ngrams(text: str, n: int = 2) -> Set[str]:
+    t = normalize_string(text)
+    if len(t) <= n:
+        return {t} if t else set()
+    return {t[i:i + n] for i in range(len(t) - n + 1)}
+
+def date_keys(date_info: str) -> Set[str]:
+    """date_info に含まれる日付を YYYY-MM-DD の集合にする（表記揺れ吸収用）"""
+    keys: Set[str] = set()
+    for pat in _DATE_PATTERNS:
+        for y, m, d in pat.findall(date_info or ""):
+            keys.add(f"{y}-{int(m):02d}-{int(d):02d}")
+    return keys
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class MinHashLSH:
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm は bands で割り切れる必要があります")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, grams: Set[str]) -> np.ndarray:
+        hs = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # (a*h + b) mod p。a, b < 2^31, h < 2^32 なので uint64 に収まる
+        return ((self._a[:, None] * hs[None, :] + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def _keys_from_signature(self, sig: List[int]) -> List[int]:
+        # 署名値は 2^31 未満なので uint32 で詰める。SQLite の INTEGER に入るよう符号付き 64bit にする
+        r = self.rows
+        packed = np.asarray(sig, dtype="<u4").tobytes()
+        return [
+            int.from_bytes(
+                hashlib.blake2b(band.to_bytes(4, "little") + packed[band * r * 4:(band + 1) * r * 4], digest_size=8).digest(),
+                "little", signed=True,
+            )
+            for band in range(self.bands)
+        ]
+
+    def band_keys(self, grams: Set[str]) -> List[int]:
+        if not grams:
+            return []
+        return self._keys_from_signature(self.signature(grams).tolist())
+
+    def band_keys_many(self, grams_list: List[Set[str]]) -> List[List[int]]:
+        """大量件数向け。全件の n-gram ハッシュをまとめて計算し、件ごとの最小値を reduceat で取る"""
+        out: List[List[int]] = [[] for _ in grams_list]
+        idxs = [i for i, g in enumerate(grams_list) if g]
+        if not idxs:
+            return out
+        lengths = np.array([len(grams_list[i]) for i in idxs])
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        hs = np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for i in idxs for g in grams_list[i]),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        sigs = np.minimum.reduceat((self._a[:, None] * hs[None, :] + self._b[:, None]) % _MERSENNE_PRIME, offsets, axis=1)
+        for col, i in enumerate(idxs):
+            out[i] = self._keys_from_signature(sigs[:, col].tolist())
+        return out
+
+class NearDuplicateDetector:
+    """イベント名の類似度がしきい値以上で、場所・日付が矛盾しないものを同一イベントとみなす
+
+    場所・日付は片方が空なら矛盾なし扱い（媒体によって場所が抜けるケースを拾うため）。
+    名前に含まれる数字（回数・年など）が食い違うものは別イベントとする。
+    バンド構成は固定（保存済みのキーと互換を保つため）で、しきい値に応じて
+    「何バンド一致したら候補にするか」を変えて候補数を絞る。
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16, place_threshold: float = 0.5):
+        self.threshold = threshold
+        self.place_threshold = place_threshold
+        self.lsh = MinHashLSH(num_perm=num_perm, bands=bands)
+        # 類似度 s のペアが一致するバンド数の期待値は bands * s^rows。余裕を見て 0.85 掛けの値で足切り
+        self.min_shared_bands = max(1, math.floor(bands * (threshold * 0.85) ** self.lsh.rows))
+        self._records: List[Tuple[Dict, Set[str]]] = []
+        self._buckets: Dict[int, List[int]] = {}
+
+    def band_keys(self, item: Dict) -> List[int]:
+        return self.lsh.band_keys(char_ngrams(item.get("name", "")))
+
+    def similarity(self, a: Dict, b: Dict, a_grams: Optional[Set[str]] = None, b_grams: Optional[Set[str]] = None) -> Optional[float]:
+        """重複とみなせるなら名前の類似度、そうでなければ None"""
+        if a_grams is None:
+            a_grams = char_ngrams(a.get("name", ""))
+        if b_grams is None:
+            b_grams = char_ngrams(b.get("name", ""))
+        sim = jaccard(a_grams, b_grams)
+        if sim < self.threshold:
+            return None
+        # 「第1回」と「第2回」、年違いなどは文字上は似ていても別イベント
+        na, nb = set(_NUMBER_RE.findall(a.get("name", ""))), set(_NUMBER_RE.findall(b.get("name", "")))
+        if na and nb and na != nb:
+            return None
+        pa, pb = normalize_string(a.get("place", "")), normalize_string(b.get("place", ""))
+        if pa and pb and pa != pb and jaccard(char_ngrams(pa), char_ngrams(pb)) < self.place_threshold:
+            return None
+        da, db = date_keys(a.get("date_info", "")), date_keys(b.get("date_info", ""))
+        if da and db and not (da & db):
+            return None
+        return sim
+
+    def best_match(self, item: Dict, candidates: List[Dict]) -> Optional[Tuple[Dict, float]]:
+        grams = char_ngrams(item.get("name", ""))
+        best: Optional[Tuple[Dict, float]] = None
+        for cand in candidates:
+            sim = self.similarity(item, cand, a_grams=grams)
+            if sim is not None and (best is None or sim > best[1]):
+                best = (cand, sim)
+        return best
+
+    def _lookup(self, grams: Set[str], keys: List[int]) -> List[int]:
+        shared = Counter(i for k in keys for i in self._buckets.get(k, ()))
+        return sorted(i for i, n in shared.items() if n >= self.min_shared_bands)
+
+    def _best(self, item: Dict, grams: Set[str], idxs: List[int]) -> Optional[Tuple[Dict, float]]:
+        best: Optional[Tuple[Dict, float]] = None
+        for i in idxs:
+            cand, cand_grams = self._records[i]
+            sim = self.similarity(item, cand, a_grams=grams, b_grams=cand_grams)
+            if sim is not None and (best is None or sim > best[1]):
+                best = (cand, sim)
+        return best
+
+    def _insert(self, item: Dict, grams: Set[str], keys: List[int]) -> None:
+        idx = len(self._records)
+        self._records.append((item, grams))
+        for k in keys:
+            self._buckets.setdefault(k, []).append(idx)
+
+    def find(self, item: Dict) -> Optional[Tuple[Dict, float]]:
+        grams = char_ngrams(item.get("name", ""))
+        return self._best(item, grams, self._lookup(grams, self.lsh.band_keys(grams)))
+
+    def add(self, item: Dict) -> None:
+        grams = char_ngrams(item.get("name", ""))
+        self._insert(item, grams, self.lsh.band_keys(grams))
+
+# ============================================================
+# Article body fingerprint (exact hash + SimHash)
+# ============================================================
+_WS_RE = re.compile(r"\s+")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+def normalize_body(text: str) -> str:
+    return _WS_RE.sub("", text or "").lower()
+
+def simhash(body: str, n: int = 3) -> int:
+    """文字 n-gram 集合の SimHash（64bit）。body は normalize_body 済みを想定"""
+    grams = {body[i:i + n] for i in range(len(body) - n + 1)}
+    if not grams:
+        return 0
+    hs = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams),
+        dtype=np.uint64, count=len(grams),
+    )
+    bits = ((hs[:, None] >> _BIT_SHIFTS[None, :]) & np.uint64(1)).astype(np.int32)
+    votes = bits.sum(axis=0) * 2 - len(hs)
+    return int(sum(1 << i for i in np.nonzero(votes > 0)[0].tolist()))
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class ContentIndex:
+    """記事本文の重複判定（スレッドセーフ）。最初に登録した記事の値を、同じ本文の後続記事に返す
+
+    完全一致は本文ハッシュで、ほぼ同一（転載時の前後の定型文違い等）は SimHash のハミング距離
+    max_distance 以下で判定する。64bit を 16bit×4 のブロックに分けて索引するので、
+    max_distance <= 3 なら候補の取りこぼしはない（鳩の巣原理）。短い本文は定型文だけで近くなるので完全一致のみ。
+    """
+
+    def __init__(self, max_distance: int = 3, min_chars: int = 200):
+        self.max_distance = max_distance
+        self.min_chars = min_chars
+        self._lock = threading.Lock()
+        self._exact: Dict[str, Tuple[str, Any]] = {}
+        self._blocks: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+        self._values: Dict[str, Any] = {}
+
+    @staticmethod
+    def _block_keys(sh: int) -> List[Tuple[int, int]]:
+        return [(i, (sh >> (16 * i)) & 0xFFFF) for i in range(4)]
+
+    def find_or_add(self, text: str, make_value: Callable[[], Any]) -> Tuple[str, Any, bool]:
+        """(代表キー, 値, 新規登録したか) を返す。重複なら最初の記事の値とキー"""
+        body = normalize_body(text)
+        digest = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        near = self.max_distance > 0 and len(body) >= self.min_chars
+        sh = simhash(body) if near else 0
+        with self._lock:
+            hit = self._exact.get(digest)
+            if hit is not None:
+                return hit[0], hit[1], False
+            if near:
+                for bk in self._block_keys(sh):
+                    for other, key in self._blocks.get(bk, ()):
+                        if hamming(sh, other) <= self.max_distance:
+                            self._exact[digest] = (key, self._values[key])
+                            return key, self._values[key], False
+            value = make_value()
+            self._exact[digest] = (digest, value)
+            self._values[digest] = value
+            if near:
+                for bk in self._block_keys(sh):
+                    self._blocks.setdefault(bk, []).append((sh, digest))
+            return digest, value, True
@@ -0,0 +1,149 @@
+"""抽出済みイベントの永続ストア（SQLite）
+
+(name, place) の正規化指紋にインデックスを張り、過去分との重複判定を
+集合の読み込みではなく索引引きで行う。クロールはここへ直接書き込む。
+近似重複の照合用に、イベント名の LSH バンドキーも索引つきで保存する。
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from extraction import normalize_string
+from dedup import BAND_KEY_VERSION, NearDuplicateDetector, char_ngrams
+
+EVENT_FIELDS = ("name", "place", "date_info", "description", "source_label", "source_url")
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """normalize_string の列版（iterrows を使わずまとめて正規化）"""
+    s = s.where(s.map(lambda v: isinstance(v, str)), "").astype(str)
+    s = s.str.replace(r"[ 　（）()]", "", regex=True)
+    return s.str.lower().str.strip()
+
+class EventStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " id INTEGER PRIMARY KEY,"
+                " name_norm TEXT NOT NULL, place_norm TEXT NOT NULL,"
+                " name TEXT, place TEXT, date_info TEXT, description TEXT,"
+                " source_label TEXT, source_url TEXT, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_events_fingerprint ON events (name_norm, place_norm)"
+            )
+            cols = {r[1] for r in self._conn.execute("PRAGMA table_info(events)")}
+            if "bands_indexed" not in cols:
+                self._conn.execute("ALTER TABLE events ADD COLUMN bands_indexed INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS event_bands (band_key INTEGER NOT NULL, event_id INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_event_bands_key ON event_bands (band_key)")
+            # バンドキーの形式が変わったら（旧形式は hash() 由来で Python のバージョンに依存）索引を作り直す
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < BAND_KEY_VERSION:
+                self._conn.execute("DELETE FROM event_bands")
+                self._conn.execute("UPDATE events SET bands_indexed = 0")
+                self._conn.execute(f"PRAGMA user_version = {BAND_KEY_VERSION}")
+
+    @staticmethod
+    def fingerprint(item: Dict) -> Tuple[str, str]:
+        return normalize_string(item.get("name", "")), normalize_string(item.get("place", ""))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def contains(self, fp: Tuple[str, str]) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM events WHERE name_norm = ? AND place_norm = ? LIMIT 1", fp
+            ).fetchone()
+        return row is not None
+
+    def _insert_rows(self, rows: List[Tuple]) -> int:
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO events"
+                " (name_norm, place_norm, name, place, date_info, description, source_label, source_url, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def add_many(self, items: Iterable[Dict]) -> int:
+        """未登録のものだけ追加し、追加件数を返す"""
+        now = time.time()
+        rows: List[Tuple] = []
+        for item in items:
+            n, p = self.fingerprint(item)
+            if not n:
+                continue
+            rows.append((n, p, *(str(item.get(k) or "") for k in EVENT_FIELDS), now))
+        if not rows:
+            return 0
+        return self._insert_rows(rows)
+
+    def import_dataframe(self, df: pd.DataFrame) -> Optional[int]:
+        """過去CSV（表示用の日本語列名 or name/place 列）を取り込む。イベント名列が無ければ None"""
+        name_col = next((c for c in df.columns if "イベント名" in c or c.lower() in ["name", "title"]), None)
+        place_col = next((c for c in df.columns if "場所" in c or c.lower() in ["place", "location"]), None)
+        if not name_col:
+            return None
+
+        col_map = {"期間": "date_info", "概要": "description", "情報源": "source_label", "URL": "source_url"}
+        out = pd.DataFrame({"name": df[name_col], "place": df[place_col] if place_col else ""})
+        for src, dst in col_map.items():
+            if src in df.columns:
+                out[dst] = df[src]
+        out["name_norm"] = normalize_series(out["name"])
+        out["place_norm"] = normalize_series(out["place"]) if place_col else ""
+        out = out[out["name_norm"] != ""].drop_duplicates(["name_norm", "place_norm"])
+
+        now = time.time()
+        rows = [
+            (r["name_norm"], r["place_norm"], *(str(r.get(k) if pd.notna(r.get(k)) else "") for k in EVENT_FIELDS), now)
+            for r in out.to_dict("records")
+        ]
+        return self._insert_rows(rows)
+
+    def index_missing_bands(self, detector: NearDuplicateDetector, batch_size: int = 10_000) -> int:
+        """まだバンドキーを持たないイベントに付与する（取り込み直後や旧DBの移行時）"""
+        done = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, name FROM events WHERE bands_indexed = 0 LIMIT ?", (batch_size,)
+                ).fetchall()
+            if not rows:
+                return done
+            keys_list = detector.lsh.band_keys_many([char_ngrams(name or "") for _, name in rows])
+            bands = [(k, eid) for (eid, _), keys in zip(rows, keys_list) for k in keys]
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT INTO event_bands (band_key, event_id) VALUES (?, ?)", bands)
+                self._conn.executemany("UPDATE events SET bands_indexed = 1 WHERE id = ?", [(eid,) for eid, _ in rows])
+            done += len(rows)
+
+    def find_near_duplicate(self, item: Dict, detector: NearDuplicateDetector) -> Optional[Tuple[Dict, float]]:
+        keys = detector.band_keys(item)
+        if not keys:
+            return None
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT e.name, e.place, e.date_info, e.source_url FROM events e JOIN ("
+                f" SELECT event_id FROM event_bands WHERE band_key IN ({marks})"
+                f" GROUP BY event_id HAVING COUNT(*) >= ?) c ON c.event_id = e.id",
+                (*keys, detector.min_shared_bands),
+            ).fetchall()
+        candidates = [dict(zip(("name", "place", "date_info", "source_url"), r)) for r in rows]
+        return detector.best_match(item, candidates)
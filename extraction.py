@@ -0,0 +1,618 @@
+"""Gemini によるイベント抽出（プロンプト・キャッシュ・バッチ化・レート制御）"""
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+import requests
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from metrics import RunMetrics
+
+# ============================================================
+# Utils
+# ============================================================
+DATE_YMD_RE = re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})日")
+DATE_SLASH_RE = re.compile(r"(\d{4})/(\d{1,2})/(\d{1,2})")
+
+def normalize_date(text: str) -> str:
+    if not text or not isinstance(text, str):
+        return ""
+    def rep_ymd(m):
+        return f"{m.group(1)}年{m.group(2).zfill(2)}月{m.group(3).zfill(2)}日"
+    text = DATE_YMD_RE.sub(rep_ymd, text)
+    text = DATE_SLASH_RE.sub(lambda m: f"{m.group(1)}/{m.group(2).zfill(2)}/{m.group(3).zfill(2)}", text)
+    return text.strip()
+
+def normalize_string(text) -> str:
+    if not isinstance(text, str):
+        return ""
+    t = text.replace(" ", "").replace("　", "")
+    t = t.replace("（", "").replace("）", "").replace("(", "").replace(")", "")
+    return t.lower().strip()
+
+def safe_json_parse(json_str: str) -> List[Dict]:
+    if not json_str or not isinstance(json_str, str):
+        return []
+    s = json_str.replace("```json", "").replace("```", "").strip()
+
+    l = s.find("[")
+    r = s.rfind("]")
+    if l != -1 and r != -1 and r > l:
+        cand = s[l:r+1]
+        try:
+            obj = json.loads(cand)
+            return obj if isinstance(obj, list) else []
+        except:
+            pass
+
+    l = s.find("{")
+    r = s.rfind("}")
+    if l != -1 and r != -1 and r > l:
+        cand = s[l:r+1]
+        try:
+            obj = json.loads(cand)
+            return [obj] if isinstance(obj, dict) else []
+        except:
+            pass
+
+    return []
+
+def estimate_tokens(text: str) -> int:
+    """おおよそのトークン数（ASCIIは4文字≒1、日本語等は1文字≒1）"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+CHUNK_MAX_TOKENS = 8000
+CHUNK_OVERLAP_TOKENS = 400
+
+_SENTENCE_END_RE = re.compile(r"(?<=[。．！？!?])|(?<=\n)")
+
+def _split_segments(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """段落（改行）・文（。！？）単位に分割。上限を超える1文は文字数で切る
+
+    文字数で切った断片は、それ自体が上限いっぱいで次のチャンクに持ち越せないので、
+    max_tokens - overlap_tokens 刻みで切って隣どうしを overlap_tokens 分重ねておく。
+    """
+    segments: List[str] = []
+    for seg in _SENTENCE_END_RE.split(text):
+        if not seg:
+            continue
+        if estimate_tokens(seg) <= max_tokens:
+            segments.append(seg)
+            continue
+        # 句点のない長文：ASCII 比率を考えて文字数の上限を見積もる
+        step = max(1, len(seg) * max_tokens // estimate_tokens(seg))
+        stride = max(1, step * (max_tokens - overlap_tokens) // max_tokens) if overlap_tokens < max_tokens else step
+        i = 0
+        while True:
+            segments.append(seg[i:i + step])
+            if i + step >= len(seg):
+                break
+            i += stride
+    return segments
+
+def split_text_into_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """文境界を保ったまま、推定トークン数が max_tokens 以下のチャンクに分ける。
+    次のチャンクの先頭には直前チャンク末尾の文を overlap_tokens まで重ねる（境界の告知を取りこぼさない）"""
+    if not text:
+        return
+    segments = _split_segments(text, max_tokens, overlap_tokens)
+    costs = [estimate_tokens(seg) for seg in segments]
+
+    start = 0
+    n = len(segments)
+    while start < n:
+        end = start
+        used = 0
+        while end < n and (end == start or used + costs[end] <= max_tokens):
+            used += costs[end]
+            end += 1
+        yield "".join(segments[start:end])
+        if end >= n:
+            break
+
+        # 末尾から overlap_tokens に収まる分だけ戻る（必ず1文以上前進し、次の文が入る余地は残す）
+        back = end
+        carried = 0
+        budget = min(overlap_tokens, max_tokens - costs[end])
+        while back - 1 > start and carried + costs[back - 1] <= budget:
+            back -= 1
+            carried += costs[back]
+        start = back
+
+# ============================================================
+# LLM engine (rate limit / retry)
+# ============================================================
+class TokenBucket:
+    """1分あたりの上限で補充されるトークンバケット（スレッドセーフ）"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self._lock:
+                self._refill_locked()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 5.0))
+
+    def debit(self, amount: float) -> None:
+        """事後に判明した消費分を差し引く（残高はマイナスになり得る）"""
+        with self._lock:
+            self._refill_locked()
+            self._tokens -= float(amount)
+
+class LLMCallError(Exception):
+    pass
+
+class ExtractionIncomplete(Exception):
+    """リトライしても失敗して破棄したチャンクがある（その記事は抽出済みとして記録せず、次回に取り直す）"""
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+def is_retryable_llm_error(e: Exception) -> bool:
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    msg = str(e).upper()
+    if "RESOURCE_EXHAUSTED" in msg or "UNAVAILABLE" in msg or "DEADLINE_EXCEEDED" in msg:
+        return True
+    # 接続断・タイムアウト等（google-genai は httpx で通信する）。ステータスの無い API エラーも一時的なものとみなす
+    return isinstance(e, (
+        ConnectionError, TimeoutError, requests.RequestException, httpx.TransportError, genai_errors.APIError,
+    ))
+
+class LLMEngine:
+    """Gemini 呼び出しの共通窓口。RPM/TPM 制限・同時実行数・指数バックオフ付きリトライを担う
+
+    client は ``client.models.generate_content(model=..., contents=..., config=...)`` を持てば何でもよい
+    （テスト用のフェイクに差し替え可能）。
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name: str,
+        temperature: float,
+        rpm: int = 60,
+        tpm: int = 1_000_000,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.client = client
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._sem = threading.Semaphore(max(1, max_concurrency))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.dropped_chunks = 0
+        self.drop_reasons: List[str] = []
+        # CrawlEngine が実行ごとに差し込む（None なら計測しない）
+        self.metrics: Optional[RunMetrics] = None
+
+    def generate_json(self, prompt: str) -> str:
+        """JSON応答テキストを返す。リトライしても失敗したら LLMCallError"""
+        prompt_tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            self._rpm.acquire(1)
+            self._tpm.acquire(prompt_tokens)
+            try:
+                with self._sem:
+                    with self._lock:
+                        self.calls += 1
+                    t = time.perf_counter()
+                    res = self.client.models.generate_content(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=types.GenerateContentConfig(
+                            response_mime_type="application/json",
+                            temperature=float(self.temperature)
+                        )
+                    )
+                text = res.text or ""
+                self._tpm.debit(estimate_tokens(text))
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.observe("llm_call", time.perf_counter() - t)
+                    metrics.incr("llm_calls")
+                    metrics.incr("llm_prompt_chars", len(prompt))
+                    metrics.incr("llm_prompt_tokens_est", prompt_tokens)
+                    metrics.incr("llm_response_chars", len(text))
+                return text
+            except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.incr("llm_errors")
+                if not is_retryable_llm_error(e) or attempt >= self.max_retries:
+                    raise LLMCallError(f"{type(e).__name__}: {e}") from e
+                with self._lock:
+                    self.retries += 1
+                # full jitter 付き指数バックオフ
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(random.uniform(delay / 2, delay))
+        raise LLMCallError("retry exhausted")
+
+    def record_drop(self, reason: str) -> None:
+        with self._lock:
+            self.dropped_chunks += 1
+            if len(self.drop_reasons) < 20:
+                self.drop_reasons.append(reason)
+
+# ============================================================
+# AI extraction
+# ============================================================
+# プロンプトや出力整形を変えたら上げる（抽出キャッシュのキーに含まれる）
+PROMPT_VERSION = "v1"
+
+def build_extraction_prompt(chunk: str, today: datetime.date) -> str:
+    return f"""
+以下のWebページ本文から、イベント・ニュース情報をJSON配列で漏れなく抽出してください。
+【現在日付: {today}】
+
+[抽出ルール]
+- 本文に含まれるイベント（展示、催事、キャンペーン、募集、発表会、セミナー等）や、日時・期間・場所が書かれている情報を可能な限り抽出。
+- 省略厳禁。ただし「企業フッタ・問い合わせ先テンプレ」などの非イベント定型文は無理に拾わない。
+- date_info は本文の表記のままでも良いが、可能なら YYYY年MM月DD日 / YYYY/MM/DD / 期間表現（例: 2025年01月01日〜2025年02月01日）。
+- 出力は必ずJSONのみ（説明文は禁止）。
+
+[JSON形式]
+[
+  {{
+    "name": "タイトル",
+    "place": "場所（不明なら空文字）",
+    "date_info": "日付や期間（不明なら空文字）",
+    "description": "概要（短めに）"
+  }}
+]
+
+本文:
+{chunk}
+"""
+
+def normalize_extracted_items(extracted: List[Dict]) -> List[Dict]:
+    out: List[Dict] = []
+    for item in extracted:
+        if not item or not isinstance(item, dict):
+            continue
+        name = str(item.get("name") or "").strip()
+        if not name:
+            continue
+        out.append({
+            "name": name,
+            "place": str(item.get("place") or "").strip(),
+            "date_info": normalize_date(str(item.get("date_info") or "").strip()),
+            "description": str(item.get("description") or "").strip(),
+        })
+    return out
+
+class ExtractionCache:
+    """AI抽出結果の永続キャッシュ（SQLite）。チャンク本文・モデル・temperature・プロンプト版でキー化"""
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " key TEXT PRIMARY KEY, items TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache (last_used)"
+            )
+
+    @staticmethod
+    def make_key(chunk: str, model_name: str, temperature: float) -> str:
+        # 空白の揺れだけで別キーにならないよう正規化してからハッシュ
+        norm = re.sub(r"\s+", " ", chunk).strip()
+        raw = "\x1f".join([PROMPT_VERSION, model_name, f"{float(temperature):.3f}", norm])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._conn.execute("SELECT items FROM extraction_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE extraction_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, items: List[Dict]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, items, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(items, ensure_ascii=False), time.time()),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        # 最終利用が古いものから上限超過分を削除（LRU）
+        self._conn.execute(
+            "DELETE FROM extraction_cache WHERE key IN ("
+            " SELECT key FROM extraction_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+def extract_chunk(engine: LLMEngine, chunk: str, today: datetime.date) -> Optional[List[Dict]]:
+    """1チャンク分のAI抽出。リトライしても失敗したら None（破棄として記録）"""
+    try:
+        text = engine.generate_json(build_extraction_prompt(chunk, today))
+    except LLMCallError as e:
+        engine.record_drop(str(e))
+        return None
+    return normalize_extracted_items(safe_json_parse(text))
+
+def merge_chunk_items(items: List[Dict]) -> List[Dict]:
+    """重なり部分で二重に抽出された同一イベント（名称+場所が一致）を1件にまとめる。
+    先に出た項目を残し、空欄だけ後の項目で埋める"""
+    merged: Dict[Tuple[str, str], Dict] = {}
+    for item in items:
+        key = (normalize_string(item.get("name")), normalize_string(item.get("place")))
+        kept = merged.get(key)
+        if kept is None:
+            merged[key] = dict(item)
+            continue
+        for field, value in item.items():
+            if value and not kept.get(field):
+                kept[field] = value
+    return list(merged.values())
+
+def ai_extract_events_from_text(
+    engine: LLMEngine,
+    text: str,
+    today: datetime.date,
+    cache: Optional[ExtractionCache] = None,
+) -> List[Dict]:
+    all_items: List[Dict] = []
+    chunks = 0
+    dropped = 0
+    metrics = engine.metrics
+    for chunk in split_text_into_chunks(text):
+        chunks += 1
+        if metrics is not None:
+            metrics.incr("chunks")
+        if not chunk or len(chunk) < 120:
+            if metrics is not None:
+                metrics.incr("chunks_too_short")
+            continue
+
+        key = ExtractionCache.make_key(chunk, engine.model_name, engine.temperature) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                if metrics is not None:
+                    metrics.incr("extraction_cache_hits")
+                all_items.extend(dict(item) for item in cached)
+                continue
+
+        items = extract_chunk(engine, chunk, today)
+        if items is None:
+            dropped += 1
+            continue
+
+        if key is not None:
+            cache.put(key, items)
+        all_items.extend(items)
+
+    # 取れたチャンクはキャッシュ済みなので、次回はそれ以外のチャンクだけ呼び出し直す
+    if dropped:
+        raise ExtractionIncomplete(f"{dropped}/{chunks} チャンクを破棄")
+    if chunks > 1:
+        return merge_chunk_items(all_items)
+    return all_items
+
+# ============================================================
+# Batched AI extraction (short articles)
+# ============================================================
+def build_batch_extraction_prompt(texts: List[Tuple[int, str]], today: datetime.date) -> str:
+    body = "\n\n".join(f"=== ARTICLE id={aid} ===\n{text}\n=== END id={aid} ===" for aid, text in texts)
+    return f"""
+以下は複数のWebページ本文です。各本文は「=== ARTICLE id=番号 ===」〜「=== END id=番号 ===」で区切られています。
+本文ごとに、イベント・ニュース情報をJSON配列で漏れなく抽出してください。
+【現在日付: {today}】
+
+[抽出ルール]
+- 本文に含まれるイベント（展示、催事、キャンペーン、募集、発表会、セミナー等）や、日時・期間・場所が書かれている情報を可能な限り抽出。
+- 省略厳禁。ただし「企業フッタ・問い合わせ先テンプレ」などの非イベント定型文は無理に拾わない。
+- 別の本文の情報を混ぜない。各要素の article_id には、その情報が書かれていた本文の番号を必ず入れる。
+- date_info は本文の表記のままでも良いが、可能なら YYYY年MM月DD日 / YYYY/MM/DD / 期間表現（例: 2025年01月01日〜2025年02月01日）。
+- 出力は必ず1つのJSON配列のみ（説明文は禁止）。
+
+[JSON形式]
+[
+  {{
+    "article_id": 0,
+    "name": "タイトル",
+    "place": "場所（不明なら空文字）",
+    "date_info": "日付や期間（不明なら空文字）",
+    "description": "概要（短めに）"
+  }}
+]
+
+{body}
+"""
+
+def parse_batch_response(text: str, ids: Set[int]) -> Optional[Dict[int, List[Dict]]]:
+    """バッチ応答を記事IDごとに振り分ける。解釈できなければ None（個別呼び出しへ）"""
+    parsed = safe_json_parse(text)
+    if not parsed:
+        stripped = (text or "").replace("```json", "").replace("```", "").strip()
+        if stripped != "[]":
+            return None
+    grouped: Dict[int, List[Dict]] = {aid: [] for aid in ids}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        try:
+            aid = int(item.get("article_id"))
+        except (TypeError, ValueError):
+            return None
+        if aid not in grouped:
+            return None
+        grouped[aid].append(item)
+    return {aid: normalize_extracted_items(items) for aid, items in grouped.items()}
+
+@dataclass
+class _BatchEntry:
+    aid: int
+    text: str
+    future: Future
+    batch_failed: bool = False
+
+class ExtractionBatcher:
+    """短い記事を文字数予算内で1プロンプトにまとめてAI抽出する（長い記事は従来どおり個別）"""
+
+    def __init__(
+        self,
+        engine: LLMEngine,
+        today: datetime.date,
+        cache: Optional[ExtractionCache] = None,
+        max_batch_chars: int = 12000,
+        max_batch_items: int = 8,
+        linger_sec: float = 0.5,
+    ):
+        self.engine = engine
+        self.today = today
+        self.cache = cache
+        self.max_batch_chars = max_batch_chars
+        self.max_batch_items = max(1, max_batch_items)
+        self.linger_sec = linger_sec
+        self.batch_calls = 0
+        self.batched_articles = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._pending: List[_BatchEntry] = []
+        self._pending_chars = 0
+        self._next_id = 0
+        self._timer: Optional[threading.Timer] = None
+
+    def extract(self, text: str) -> List[Dict]:
+        text = text or ""
+        if len(text) < 120:
+            return []
+        if len(text) > self.max_batch_chars // 2 or estimate_tokens(text) > CHUNK_MAX_TOKENS:
+            return ai_extract_events_from_text(self.engine, text, self.today, cache=self.cache)
+
+        key = ExtractionCache.make_key(text, self.engine.model_name, self.engine.temperature) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                if self.engine.metrics is not None:
+                    self.engine.metrics.incr("extraction_cache_hits")
+                return [dict(item) for item in cached]
+
+        fut: Future = Future()
+        flush_now = None
+        with self._lock:
+            entry = _BatchEntry(self._next_id, text, fut)
+            self._next_id += 1
+            self._pending.append(entry)
+            self._pending_chars += len(text)
+            if self._pending_chars >= self.max_batch_chars or len(self._pending) >= self.max_batch_items:
+                flush_now = self._take_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.linger_sec, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self._run_batch(flush_now)
+
+        items = fut.result()
+        if items is None:
+            # 単独だった記事・バッチ応答が解釈できなかった記事は個別に抽出
+            if entry.batch_failed:
+                with self._lock:
+                    self.fallbacks += 1
+            items = extract_chunk(self.engine, text, self.today)
+            if items is None:
+                raise ExtractionIncomplete("チャンクを破棄")
+        if key is not None:
+            self.cache.put(key, items)
+        return [dict(item) for item in items]
+
+    def _take_locked(self) -> List[_BatchEntry]:
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_from_timer(self) -> None:
+        with self._lock:
+            batch = self._take_locked()
+        if batch:
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_BatchEntry]) -> None:
+        if len(batch) == 1:
+            # 1件だけならバッチ用プロンプトにせず、呼び出し元で個別抽出
+            batch[0].future.set_result(None)
+            return
+        prompt = build_batch_extraction_prompt([(e.aid, e.text) for e in batch], self.today)
+        try:
+            text = self.engine.generate_json(prompt)
+        except LLMCallError as err:
+            # リトライしても失敗した呼び出し（クォータ・5xx 等）は個別に呼び直しても通らないので、全記事を失敗にする
+            with self._lock:
+                self.batch_calls += 1
+            if self.engine.metrics is not None:
+                self.engine.metrics.incr("llm_batch_calls")
+                self.engine.metrics.incr("llm_batch_items", len(batch))
+            for e in batch:
+                self.engine.record_drop(str(err))
+                e.future.set_exception(ExtractionIncomplete(f"バッチ抽出に失敗: {err}"))
+            return
+        # 応答が解釈できない・形が合わない場合だけ、呼び出し元で記事ごとに個別抽出する
+        grouped = parse_batch_response(text, {e.aid for e in batch})
+        with self._lock:
+            self.batch_calls += 1
+            if grouped is not None:
+                self.batched_articles += len(batch)
+        if self.engine.metrics is not None:
+            self.engine.metrics.incr("llm_batch_calls")
+            self.engine.metrics.incr("llm_batch_items", len(batch))
+        for e in batch:
+            e.batch_failed = grouped is None
+            e.future.set_result(grouped.get(e.aid, []) if grouped is not None else None)
@@ -0,0 +1,97 @@
+"""ローカル検証用の Gemini クライアント代替。
+
+``google.genai.Client`` と同じ ``client.models.generate_content(...)`` の形で呼べ、
+API を使わずに定型の JSON を返す。応答遅延やエラー（429/503）を擬似的に発生させられるので、
+LLMEngine の並列・リトライ挙動やベンチマークの確認に使う。
+
+    TREND_APP_FAKE_LLM=1 streamlit run app.py
+"""
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+_ARTICLE_RE = re.compile(r"=== ARTICLE id=(\d+) ===\n(.*?)\n=== END id=\1 ===", re.S)
+_DATE_RE = re.compile(r"\d{4}年\d{1,2}月\d{1,2}日|\d{4}/\d{1,2}/\d{1,2}")
+
+class FakeAPIError(Exception):
+    """google.genai.errors.APIError と同じく code 属性を持つ"""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+def _items_for_body(body: str) -> List[Dict]:
+    lines = [ln.strip() for ln in body.splitlines() if ln.strip()]
+    if not lines:
+        return []
+    m = _DATE_RE.search(body)
+    return [{
+        "name": lines[0][:80],
+        "place": "",
+        "date_info": m.group(0) if m else "",
+        "description": " ".join(lines[1:3])[:120],
+    }]
+
+def default_responder(prompt: str) -> str:
+    """本文の先頭行をイベント名とした1件を返す（バッチプロンプトなら記事ごとに1件）"""
+    articles = _ARTICLE_RE.findall(prompt)
+    if articles:
+        out = []
+        for aid, body in articles:
+            for item in _items_for_body(body):
+                item["article_id"] = int(aid)
+                out.append(item)
+        return json.dumps(out, ensure_ascii=False)
+    body = prompt.split("本文:", 1)[-1]
+    return json.dumps(_items_for_body(body), ensure_ascii=False)
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config=None) -> FakeResponse:
+        return self._owner._generate(contents)
+
+class FakeGenaiClient:
+    def __init__(
+        self,
+        latency: float = 0.3,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        error_codes=(429, 503),
+        responder: Optional[Callable[[str], str]] = None,
+        seed: Optional[int] = None,
+        scripted_errors: Sequence[Exception] = (),
+    ):
+        # scripted_errors は最初の呼び出しから順に投げる例外（httpx.ReadTimeout 等、リトライ確認用）
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.responder = responder or default_responder
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._scripted = list(scripted_errors)
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    def _generate(self, prompt: str) -> FakeResponse:
+        with self._lock:
+            self.calls += 1
+            scripted = self._scripted.pop(0) if self._scripted else None
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+            code = self._rng.choice(self.error_codes) if fail and self.error_codes else None
+        time.sleep(delay)
+        if scripted is not None:
+            raise scripted
+        if code is not None:
+            raise FakeAPIError(code, "simulated error")
+        return FakeResponse(self.responder(prompt))
@@ -0,0 +1,174 @@
+"""RSS/Atom フィード・サイトマップからの記事URL発見（一覧ページ巡回の代替）
+
+フィードも一覧・記事と同じ fetch_html で取得し（リトライ・Retry-After・サイズ上限・HTTPキャッシュ・計測）、
+XMLPullParser で要素ごとに読んで、必要な件数が集まった時点で解析をやめる。lastmod（pubDate / dc:date / updated 等）が古いもの、
+記事URLルールに合わないものはここで除く。サイトマップインデックスは新しい子サイトマップから辿る。
+"""
+import datetime
+import email.utils
+import urllib.parse
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Union
+
+import requests
+
+from site_rules import SiteRule, canonicalize_url, get_site_rule, is_article_url
+from fetching import MAX_RESPONSE_BYTES, HostScheduler, HttpCache, fetch_html
+from metrics import RunMetrics
+
+FEED_URL_SUFFIXES = (".xml", ".rdf", ".rss", ".atom", "/feed", "/rss", "/atom", "/feed/", "/rss/")
+
+# item（RSS 1.0/2.0）・entry（Atom）・url（sitemap）が記事、sitemap（sitemapindex）が子サイトマップ
+_ENTRY_TAGS = ("item", "entry", "url")
+_DATE_TAGS = ("lastmod", "pubDate", "date", "updated", "published", "modified")
+
+@dataclass
+class FeedEntry:
+    url: str
+    lastmod: Optional[datetime.datetime]
+    is_sitemap: bool = False
+
+def looks_like_feed_url(url: str) -> bool:
+    path = urllib.parse.urlparse(url).path.lower()
+    return path.endswith(FEED_URL_SUFFIXES) or "sitemap" in path
+
+def feed_urls_for(rule: Optional[SiteRule], listing_url: str) -> List[str]:
+    """SiteRule.feed_urls のうち、一覧URLのパスが前方一致するもの（プレフィックス "" は全一覧に適用）"""
+    if looks_like_feed_url(listing_url):
+        return [listing_url]
+    if rule is None:
+        return []
+    path = urllib.parse.urlparse(listing_url).path or "/"
+    return [urllib.parse.urljoin(listing_url, feed) for prefix, feed in rule.feed_urls if path.startswith(prefix)]
+
+def parse_feed_date(text: Optional[str]) -> Optional[datetime.datetime]:
+    """ISO 8601（sitemap / Atom / dc:date）と RFC 822（RSS 2.0 の pubDate）を UTC の aware datetime に"""
+    t = (text or "").strip()
+    if not t:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(t.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            dt = email.utils.parsedate_to_datetime(t)
+        except (TypeError, ValueError):
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+def _local(tag) -> str:
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+def _entry_from_element(elem: ET.Element) -> Optional[FeedEntry]:
+    kind = _local(elem.tag)
+    url = ""
+    lastmod = None
+    for child in elem:
+        name = _local(child.tag)
+        if name in ("link", "loc") and not url:
+            # Atom は <link href=... rel="alternate"/>、RSS / sitemap は本文がURL
+            rel = child.get("rel", "alternate")
+            href = child.get("href")
+            if href and rel == "alternate":
+                url = href.strip()
+            elif child.text and child.text.strip():
+                url = child.text.strip()
+        elif name in _DATE_TAGS and lastmod is None:
+            lastmod = parse_feed_date(child.text)
+    if not url:
+        # RSS 1.0 の item は rdf:about にもURLを持つ
+        url = next((v for k, v in elem.attrib.items() if _local(k) == "about"), "")
+    if not url:
+        return None
+    return FeedEntry(url, lastmod, is_sitemap=kind == "sitemap")
+
+def iter_feed_entries(chunks: Iterable[Union[str, bytes]]) -> Iterator[FeedEntry]:
+    """XML を受け取った分から順に解析し、記事・子サイトマップを1件ずつ返す（読み終えた要素は捨てる）"""
+    parser = ET.XMLPullParser(events=("end",))
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            name = _local(elem.tag)
+            if name in _ENTRY_TAGS or name == "sitemap":
+                entry = _entry_from_element(elem)
+                elem.clear()
+                if entry is not None:
+                    yield entry
+    parser.close()
+
+def discover_feed_links(
+    session: requests.Session,
+    feed_urls: List[str],
+    base_url: str,
+    since: Optional[datetime.datetime] = None,
+    limit: int = 400,
+    max_documents: int = 10,
+    scheduler: Optional[HostScheduler] = None,
+    timeout=(5, 20),
+    should_stop: Callable[[], bool] = lambda: False,
+    cache: Optional[HttpCache] = None,
+    metrics: Optional[RunMetrics] = None,
+    max_bytes: int = MAX_RESPONSE_BYTES,
+) -> Optional[List[str]]:
+    """フィード群から記事URLを新しい順（フィード内の並び順）で最大 limit 件集める。
+    どのフィードも取得・解析できなければ None（呼び出し側は一覧巡回に切り替える）"""
+    out: List[str] = []
+    seen: Set[str] = set()
+    queue: List[str] = list(feed_urls)
+    visited: Set[str] = set()
+    any_ok = False
+
+    while queue and len(out) < limit and len(visited) < max_documents and not should_stop():
+        feed_url = queue.pop(0)
+        if feed_url in visited:
+            continue
+        visited.add(feed_url)
+
+        text = fetch_html(
+            session, feed_url, timeout=timeout, scheduler=scheduler, cache=cache, metrics=metrics, max_bytes=max_bytes,
+        )
+        if text is None:
+            continue
+        children: List[FeedEntry] = []
+        try:
+            _read_feed(text, feed_url, base_url, since, limit, out, seen, children)
+        except ET.ParseError:
+            continue
+        any_ok = True
+
+        # サイトマップインデックス：更新の新しい子サイトマップから読む
+        children.sort(key=lambda e: e.lastmod or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), reverse=True)
+        queue = [urllib.parse.urljoin(feed_url, c.url) for c in children] + queue
+
+    return out if any_ok else None
+
+def _read_feed(
+    text: str,
+    feed_url: str,
+    base_url: str,
+    since: Optional[datetime.datetime],
+    limit: int,
+    out: List[str],
+    seen: Set[str],
+    children: List[FeedEntry],
+) -> None:
+    base_netloc = urllib.parse.urlsplit(base_url).netloc.lower()
+    for entry in iter_feed_entries([text]):
+        if since is not None and entry.lastmod is not None and entry.lastmod < since:
+            continue
+        if entry.is_sitemap:
+            children.append(entry)
+            continue
+        url = canonicalize_url(urllib.parse.urljoin(feed_url, entry.url))
+        if urllib.parse.urlparse(url).netloc != base_netloc:
+            continue
+        if not is_article_url(url, get_site_rule(url)):
+            continue
+        if url not in seen:
+            seen.add(url)
+            out.append(url)
+        if len(out) >= limit:
+            # 必要数が集まったら残りは解析しない
+            break
@@ -0,0 +1,386 @@
+"""HTTP取得（ホスト単位のアクセス制御・永続キャッシュ付き）"""
+import codecs
+import datetime
+import email.utils
+import importlib.util
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import RunMetrics
+from site_rules import SiteRule, get_site_rule, get_site_rule_for_netloc
+
+# ============================================================
+# Per-host politeness
+# ============================================================
+@dataclass
+class _HostState:
+    min_interval: float
+    max_in_flight: int
+    in_flight: int = 0
+    next_allowed: float = 0.0
+
+class HostScheduler:
+    """netloc 単位でアクセス間隔と同時接続数を制御する（別ホスト同士は並行可）"""
+
+    def __init__(self, default_interval: float = 0.5, default_max_in_flight: int = 2):
+        self.default_interval = max(0.0, float(default_interval))
+        self.default_max_in_flight = max(1, int(default_max_in_flight))
+        self._cond = threading.Condition()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _state(self, netloc: str) -> _HostState:
+        hs = self._hosts.get(netloc)
+        if hs is None:
+            rule = get_site_rule_for_netloc(netloc)
+            interval = rule.min_interval_sec if rule and rule.min_interval_sec is not None else self.default_interval
+            in_flight = rule.max_in_flight if rule and rule.max_in_flight else self.default_max_in_flight
+            hs = _HostState(min_interval=interval, max_in_flight=in_flight)
+            self._hosts[netloc] = hs
+        return hs
+
+    def configure(self, netloc: str, min_interval: Optional[float] = None, max_in_flight: Optional[int] = None) -> None:
+        """ターゲット単位の上書き設定"""
+        with self._cond:
+            hs = self._state(netloc.lower())
+            if min_interval is not None:
+                hs.min_interval = max(0.0, float(min_interval))
+            if max_in_flight is not None:
+                hs.max_in_flight = max(1, int(max_in_flight))
+            self._cond.notify_all()
+
+    def max_in_flight_for(self, netloc: str) -> int:
+        """そのホストに実際に適用される同時接続数（SiteRule・ターゲット単位の上書きを反映）"""
+        with self._cond:
+            return self._state(netloc.lower()).max_in_flight
+
+    def defer(self, url: str, seconds: float) -> None:
+        """Retry-After 等で指定された時間、同ホストへの新規リクエストを止める"""
+        netloc = urllib.parse.urlparse(url).netloc.lower()
+        with self._cond:
+            hs = self._state(netloc)
+            hs.next_allowed = max(hs.next_allowed, time.monotonic() + max(0.0, seconds))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, url: str):
+        netloc = urllib.parse.urlparse(url).netloc.lower()
+        with self._cond:
+            hs = self._state(netloc)
+            while True:
+                now = time.monotonic()
+                if hs.in_flight < hs.max_in_flight and now >= hs.next_allowed:
+                    break
+                timeout = hs.next_allowed - now if now < hs.next_allowed else None
+                self._cond.wait(timeout)
+            hs.in_flight += 1
+            hs.next_allowed = now + hs.min_interval
+        try:
+            yield
+        finally:
+            with self._cond:
+                hs.in_flight -= 1
+                self._cond.notify_all()
+
+def parse_retry_after(value: Optional[str], cap: float = 60.0) -> Optional[float]:
+    """Retry-After（秒数 or HTTP-date）を秒に変換"""
+    if not value:
+        return None
+    v = value.strip()
+    if v.isdigit():
+        return min(float(v), cap)
+    try:
+        dt = email.utils.parsedate_to_datetime(v)
+    except (TypeError, ValueError):
+        return None
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    delta = (dt - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(max(delta, 0.0), cap)
+
+# ============================================================
+# HTTP cache
+# ============================================================
+@dataclass
+class CachedResponse:
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+class HttpCache:
+    """fetch_html 用の永続HTTPキャッシュ（SQLite）。Streamlit の再実行・再起動をまたいで残る
+
+    記事の本文を丸ごと持つので、取得・再検証から max_age_days を過ぎたもの、max_entries を超えた古いものは
+    開いたときと一定件数の書き込みごとに削除する（消えた記事は次に必要になったとき取り直す）。
+    """
+
+    def __init__(self, path: str, max_age_days: float = 30.0, max_entries: int = 50_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS http_cache ("
+                " url TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+                " fetched_at REAL NOT NULL, validated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_validated_at ON http_cache (validated_at)")
+            self._evict()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, validated_at FROM http_cache WHERE url = ?", (url,)
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def put(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_cache (url, body, etag, last_modified, fetched_at, validated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict()
+
+    def touch(self, url: str) -> None:
+        """304 で再検証できたエントリの鮮度を更新"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE http_cache SET validated_at = ? WHERE url = ?", (time.time(), url))
+
+    def _evict(self) -> None:
+        # 期限切れを消し、なお上限を超える分は取得・再検証の古いものから削除
+        if self.max_age_days > 0:
+            self._conn.execute(
+                "DELETE FROM http_cache WHERE validated_at < ?", (time.time() - self.max_age_days * 86400,)
+            )
+        self._conn.execute(
+            "DELETE FROM http_cache WHERE url IN ("
+            " SELECT url FROM http_cache ORDER BY validated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+def cache_ttl_for(url: str) -> Optional[float]:
+    """URLごとのキャッシュ鮮度（秒）。None は不変（再検証不要）"""
+    rule = get_site_rule(url)
+    if rule is None:
+        return SiteRule.listing_cache_ttl_sec
+    if rule.article_path_allow.search(urllib.parse.urlparse(url).path or ""):
+        return rule.article_cache_ttl_sec
+    return rule.listing_cache_ttl_sec
+
+# ============================================================
+# Transport
+# ============================================================
+# これを超えるレスポンスは受信を打ち切って取得失敗扱いにする（巨大な一覧・誤ったバイナリ配信対策）
+MAX_RESPONSE_BYTES = 8 * 1024 * 1024
+
+_READ_CHUNK_BYTES = 64 * 1024
+
+def accept_encoding() -> str:
+    # br は urllib3 が brotli / brotlicffi で展開できるときだけ要求する
+    if importlib.util.find_spec("brotli") is not None or importlib.util.find_spec("brotlicffi") is not None:
+        return "gzip, deflate, br"
+    return "gzip, deflate"
+
+def make_session(user_agent: str, pool_maxsize: int = 10, pool_connections: int = 10) -> requests.Session:
+    """keep-alive の接続プールを並列数に合わせた Session
+
+    pool_maxsize はホストごとに保持する接続数（同一ホストへの同時接続数以上にしないと、
+    返却時に "Connection pool is full" で接続が捨てられ毎回 TCP/TLS をやり直す）。
+    pool_connections は保持するホスト数。リトライは fetch_html が行うので adapter では行わない。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(1, pool_connections), pool_maxsize=max(1, pool_maxsize), max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "User-Agent": user_agent,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Encoding": accept_encoding(),
+        "Accept-Language": "ja,en;q=0.8",
+    })
+    return session
+
+_CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# 日本語サイトの宣言は実際には拡張文字を含むことが多いので上位互換の codec で読む
+_ENCODING_ALIASES = {"shift_jis": "cp932", "shift-jis": "cp932", "sjis": "cp932", "x-sjis": "cp932",
+                     "windows-31j": "cp932", "euc-jp": "euc_jis_2004", "iso-8859-1": "cp1252"}
+
+def _lookup_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    name = _ENCODING_ALIASES.get(name.lower(), name.lower())
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def detect_encoding(content_type: Optional[str], body: bytes) -> Optional[str]:
+    """BOM → Content-Type の charset → 先頭の <meta charset> の順で決める（本文全体の推測はしない）"""
+    for bom, enc in _BOMS:
+        if body.startswith(bom):
+            return enc
+    m = _CHARSET_RE.search(content_type or "")
+    enc = _lookup_encoding(m.group(1)) if m else None
+    if enc is not None:
+        return enc
+    m = _META_CHARSET_RE.search(body[:4096])
+    return _lookup_encoding(m.group(1).decode("ascii", "ignore")) if m else None
+
+def decode_html(body: bytes, content_type: Optional[str] = None) -> str:
+    enc = detect_encoding(content_type, body)
+    if enc is not None:
+        return body.decode(enc, errors="replace")
+    # 宣言なし：まず UTF-8 として読み、だめなら日本語サイトで多い cp932
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("cp932", errors="replace")
+
+class ResponseTooLarge(Exception):
+    pass
+
+def read_body(r: requests.Response, max_bytes: int = MAX_RESPONSE_BYTES) -> bytes:
+    """展開後のサイズで max_bytes を超えた時点で受信を打ち切る（ResponseTooLarge）"""
+    length = r.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise ResponseTooLarge(f"Content-Length {length} > {max_bytes}")
+    buf = bytearray()
+    for chunk in r.iter_content(chunk_size=_READ_CHUNK_BYTES):
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise ResponseTooLarge(f"body > {max_bytes}")
+    return bytes(buf)
+
+@dataclass
+class _Fetched:
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes = b""
+
+# ============================================================
+# Fetch
+# ============================================================
+def fetch_html(
+    session: requests.Session,
+    url: str,
+    timeout=(5, 20),
+    max_retries=2,
+    scheduler: Optional[HostScheduler] = None,
+    cache: Optional[HttpCache] = None,
+    metrics: Optional[RunMetrics] = None,
+    max_bytes: int = MAX_RESPONSE_BYTES,
+) -> Optional[str]:
+    cached = cache.get(url) if cache is not None else None
+    headers: Dict[str, str] = {}
+    if cached is not None:
+        ttl = cache_ttl_for(url)
+        if ttl is None or time.time() - cached.validated_at < ttl:
+            if metrics is not None:
+                metrics.incr("http_cache_fresh")
+            return cached.body
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    for attempt in range(max_retries + 1):
+        try:
+            if scheduler is not None:
+                t_wait = time.perf_counter()
+                with scheduler.slot(url):
+                    if metrics is not None:
+                        metrics.observe("host_wait", time.perf_counter() - t_wait)
+                    r = _get(session, url, timeout, headers, metrics, max_bytes)
+            else:
+                r = _get(session, url, timeout, headers, metrics, max_bytes)
+            if r.status_code == 304 and cached is not None:
+                if metrics is not None:
+                    metrics.incr("http_not_modified")
+                cache.touch(url)
+                return cached.body
+            if r.status_code == 200 and r.body:
+                text = decode_html(r.body, r.headers.get("Content-Type"))
+                if cache is not None:
+                    cache.put(url, text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                return text
+            if r.status_code in (429, 503) and attempt < max_retries:
+                if metrics is not None:
+                    metrics.incr("http_429" if r.status_code == 429 else "http_503")
+                    metrics.incr("http_retries")
+                wait = parse_retry_after(r.headers.get("Retry-After"))
+                if wait is None:
+                    wait = 1.2 * (attempt + 1)
+                if scheduler is not None:
+                    # 同ホストの他スレッドもまとめて待たせる
+                    scheduler.defer(url, wait)
+                else:
+                    time.sleep(wait)
+                continue
+            return None
+        except ResponseTooLarge:
+            # 再試行しても大きさは変わらない
+            if metrics is not None:
+                metrics.incr("http_too_large")
+            return None
+        except requests.RequestException:
+            if metrics is not None:
+                metrics.incr("http_errors")
+            if attempt < max_retries:
+                if metrics is not None:
+                    metrics.incr("http_retries")
+                time.sleep(1.0 * (attempt + 1))
+                continue
+            return None
+    return None
+
+def _get(
+    session: requests.Session,
+    url: str,
+    timeout,
+    headers: Dict[str, str],
+    metrics: Optional[RunMetrics],
+    max_bytes: int,
+) -> _Fetched:
+    t = time.perf_counter()
+    # stream=True で受け取り、本文は上限つきで読む。読み切った接続だけが with を抜けるときプールに戻る
+    with session.get(url, timeout=timeout, headers=headers, stream=True) as r:
+        fetched = _Fetched(r.status_code, r.headers)
+        if r.status_code == 200:
+            fetched.body = read_body(r, max_bytes)
+        else:
+            # 304・404・429 等の本文も読み捨てる（読まずに閉じると接続ごと切られ、keep-alive が効かない）
+            try:
+                read_body(r, max_bytes)
+            except ResponseTooLarge:
+                pass
+        # 受信したバイト数（gzip 等は圧縮されたまま）。展開後の大きさは http_decoded_bytes
+        wire_bytes = r.raw.tell()
+    if metrics is not None:
+        metrics.observe("http_request", time.perf_counter() - t)
+        metrics.incr("http_requests")
+        metrics.incr("http_bytes", wire_bytes)
+        metrics.incr("http_decoded_bytes", len(fetched.body))
+    return fetched
@@ -0,0 +1,171 @@
+"""1回のクロールの計測値（段階ごとの所要時間・カウンタ）と cProfile フック
+
+取得（ネットワーク）・解析・AI 呼び出し・重複判定のどこが律速かを見るためのもの。
+段階の所要時間は p50 / p95 / 合計で、カウンタ（ダウンロードバイト数・リトライ回数・チャンク数・
+プロンプト/応答サイズ等）は合計で集計し、JSON と Prometheus のテキスト形式で書き出せる。
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# サンプルを全件持つと長時間の実行でメモリを食うので、段階ごとに上限を設ける（超えたら間引く）
+MAX_SAMPLES_PER_STAGE = 20_000
+
+STAGE_LABELS = {
+    "phase1": "一覧収集（phase 1）",
+    "phase2": "記事解析・AI抽出（phase 2）",
+    "host_wait": "ホスト間隔・同時接続数の待ち",
+    "http_request": "HTTPリクエスト（受信完了まで）",
+    "fetch": "記事取得（待ち・リトライ込み）",
+    "parse_listing": "一覧HTML解析",
+    "parse_article": "記事HTML解析・本文抽出",
+    "relevance": "関連性フィルタ",
+    "content_dedup": "本文重複判定",
+    "extract": "AI抽出（待ち込み）",
+    "llm_call": "Gemini 呼び出し（1回あたり）",
+    "dedup": "イベント重複判定（記事あたり）",
+}
+
+def _percentile(sorted_xs: List[float], q: float) -> float:
+    if not sorted_xs:
+        return 0.0
+    k = (len(sorted_xs) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_xs) - 1)
+    return sorted_xs[lo] + (sorted_xs[hi] - sorted_xs[lo]) * (k - lo)
+
+class RunMetrics:
+    """スレッドセーフな計測値の入れ物（CrawlEngine が1回の実行につき1つ持つ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._totals: Dict[str, float] = {}
+        self._max: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            xs = self._samples.setdefault(stage, [])
+            if len(xs) >= MAX_SAMPLES_PER_STAGE:
+                del xs[::2]
+            xs.append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+            self._max[stage] = max(self._max.get(stage, 0.0), seconds)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t)
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {k: sorted(v) for k, v in self._samples.items()}
+            counts, totals, maxes = dict(self._counts), dict(self._totals), dict(self._max)
+        return {
+            stage: {
+                "count": counts[stage],
+                "total_s": round(totals[stage], 4),
+                "p50_ms": round(_percentile(xs, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(xs, 0.95) * 1000, 3),
+                "max_ms": round(maxes[stage] * 1000, 3),
+            }
+            for stage, xs in snapshot.items()
+        }
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {"stages": self.stage_summary(), "counters": counters}
+
+def to_json(metrics: Dict) -> str:
+    return json.dumps(metrics, ensure_ascii=False, indent=2)
+
+def to_prometheus(metrics: Dict, prefix: str = "trend_crawl", labels: Optional[Dict[str, str]] = None) -> str:
+    """Prometheus のテキスト形式（node_exporter の textfile collector 等で読める）"""
+    base = dict(labels or {})
+
+    def fmt(extra: Dict[str, str]) -> str:
+        pairs = {**base, **extra}
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in pairs.values())
+        return "{" + ",".join(f'{k}="{v}"' for k, v in zip(pairs, escaped)) + "}"
+
+    lines = [
+        f"# HELP {prefix}_stage_seconds 段階ごとの所要時間",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for stage, s in sorted(metrics.get("stages", {}).items()):
+        lines.append(f"{prefix}_stage_seconds{fmt({'stage': stage, 'quantile': '0.5'})} {s['p50_ms'] / 1000:.6f}")
+        lines.append(f"{prefix}_stage_seconds{fmt({'stage': stage, 'quantile': '0.95'})} {s['p95_ms'] / 1000:.6f}")
+        lines.append(f"{prefix}_stage_seconds_sum{fmt({'stage': stage})} {s['total_s']:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{fmt({'stage': stage})} {s['count']}")
+    for name, value in sorted(metrics.get("counters", {}).items()):
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{fmt({})} {value}")
+    return "\n".join(lines) + "\n"
+
+# ============================================================
+# cProfile hook
+# ============================================================
+class RunProfiler:
+    """with の間、呼び出し元スレッドと新しく起動したスレッド（記事パイプラインのワーカー等）を cProfile で計測する
+
+    オーバーヘッドが大きいので調査したい1回だけに使う。解析プロセス（ParsePool）の中は計測されない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+
+    def _start_in_thread(self, frame, event, arg):
+        # threading.setprofile で新しいスレッドの最初のイベント時に呼ばれ、そのスレッド用の Profile に差し替える
+        prof = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(prof)
+        prof.enable()
+
+    def __enter__(self) -> "RunProfiler":
+        threading.setprofile(self._start_in_thread)
+        main = cProfile.Profile()
+        self._profiles.append(main)
+        main.enable()
+        self._main = main
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._main.disable()
+        threading.setprofile(None)
+
+    def stats(self) -> pstats.Stats:
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for prof in profiles[1:]:
+            stats.add(prof)
+        return stats
+
+    def dump(self, path: str) -> None:
+        self.stats().dump_stats(path)
+
+    def top_text(self, limit: int = 30, sort: str = "cumulative") -> str:
+        buf = io.StringIO()
+        stats = self.stats()
+        stats.stream = buf
+        stats.sort_stats(sort).print_stats(limit)
+        return buf.getvalue()
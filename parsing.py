@@ -0,0 +1,266 @@
+"""HTML解析（一覧ページの記事URL抽出・記事本文抽出）
+
+Streamlit に依存しないので、プロセスプールのワーカーからも import できる。
+"""
+import importlib.util
+import multiprocessing
+import urllib.parse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+
+from site_rules import SiteRule, canonicalize_url, get_site_rule, is_article_url
+from structured import extract_structured_events
+
+# ============================================================
+# Link utils
+# ============================================================
+def is_valid_href(href: str) -> bool:
+    if not href:
+        return False
+    h = href.strip()
+    if h.startswith("#"):
+        return False
+    if h.lower().startswith("javascript:"):
+        return False
+    return True
+
+def same_domain(url_a: str, url_b: str) -> bool:
+    try:
+        return urllib.parse.urlparse(url_a).netloc == urllib.parse.urlparse(url_b).netloc
+    except:
+        return False
+
+# ============================================================
+# Cleaning / main text
+# ============================================================
+# 確実に消したいタグ
+CLEAN_DROP_TAGS = ("script", "style", "nav", "footer", "iframe", "header", "noscript", "svg")
+# class にこれらを含む要素は除去（部分一致。"ad" は "header" 等にも当たるが従来挙動を維持）
+CLEAN_EXCLUDE_TOKENS = ("sidebar", "ranking", "recommend", "widget", "ad", "bread", "breadcrumb", "banner")
+_EXCLUDE_CLASS_RE = re.compile("|".join(map(re.escape, CLEAN_EXCLUDE_TOKENS)))
+
+# 一覧ページで使うのは a / link だけなので、それ以外は木を作らない
+LISTING_STRAINER = SoupStrainer(["a", "link"])
+
+def available_html_parsers() -> List[str]:
+    parsers = ["html.parser"]
+    if importlib.util.find_spec("lxml") is not None:
+        parsers.append("lxml")
+    return parsers
+
+def _class_excluded(t: Tag) -> bool:
+    attrs = getattr(t, "attrs", None)
+    if not isinstance(attrs, dict):
+        return False
+    cls_list = attrs.get("class") or []
+    if not isinstance(cls_list, (list, tuple)):
+        cls_list = [str(cls_list)]
+    cls = " ".join(map(str, cls_list)).lower()
+    return bool(_EXCLUDE_CLASS_RE.search(cls))
+
+def clean_soup(soup: Tag) -> None:
+    """ノイズ要素を除去（soup 全体でも、本文ノードの部分木でも可）"""
+    for t in soup.find_all(list(CLEAN_DROP_TAGS)):
+        try:
+            t.decompose()
+        except Exception:
+            pass
+
+    # find_all(True)で全tag。壊れ要素耐性をつける
+    for t in soup.find_all(True):
+        if not isinstance(t, Tag) or t.decomposed:
+            continue
+        if _class_excluded(t):
+            try:
+                t.decompose()
+            except Exception:
+                pass
+
+def _survives_clean(node: Tag) -> bool:
+    """clean_soup(全体) を通しても node が残るか（自身と祖先だけを見る）"""
+    for t in [node, *node.parents]:
+        if t.name in CLEAN_DROP_TAGS or _class_excluded(t):
+            return False
+    return True
+
+def extract_main_text(soup: BeautifulSoup, rule: Optional[SiteRule]) -> str:
+    """本文を(できれば)main/articleから抽出、だめなら全部のテキスト
+
+    参照実装（clean_soup 済みの soup を渡す）。本番の経路は _article_text_from_soup で、
+    tests/test_parsing.py が両者の結果が一致することを確かめている。
+    """
+    if rule:
+        for sel in rule.content_selectors:
+            try:
+                node = soup.select_one(sel)
+                if node:
+                    return node.get_text("\n", strip=True)
+            except Exception:
+                continue
+    return soup.get_text("\n", strip=True)
+
+def _article_text_from_soup(soup: BeautifulSoup, rule: Optional[SiteRule]) -> str:
+    """clean_soup → extract_main_text と同じ本文を返すが、先に content_selectors の本文ノードを特定し、
+    その部分木だけを掃除する。本文ノードが見つからない場合だけ全体を掃除する。
+    """
+    if rule:
+        for sel in rule.content_selectors:
+            try:
+                candidates = soup.select(sel)
+            except Exception:
+                continue
+            for node in candidates:
+                # 全体掃除で消えるノードは従来経路では選ばれない
+                if _survives_clean(node):
+                    clean_soup(node)
+                    return node.get_text("\n", strip=True)
+    clean_soup(soup)
+    return soup.get_text("\n", strip=True)
+
+def parse_listing_html(
+    html: str,
+    current_url: str,
+    rule: Optional[SiteRule],
+    link_limit: int = 80,
+    parser: str = "html.parser",
+) -> Tuple[List[str], Optional[str]]:
+    """一覧HTML→(記事URL一覧, 次ページURL)。a / link 要素だけを解析する"""
+    soup = BeautifulSoup(html, parser, parse_only=LISTING_STRAINER)
+    next_url = find_next_page_url(soup, current_url, rule)
+    links = extract_article_links_from_listing(soup, current_url, rule, link_limit=link_limit)
+    return links, next_url
+
+# ============================================================
+# Listing pages
+# ============================================================
+def find_next_page_url(soup: BeautifulSoup, current_url: str, rule: Optional[SiteRule]) -> Optional[str]:
+    # 1) rel=next
+    link_next = soup.find("link", rel="next")
+    if link_next and link_next.get("href") and is_valid_href(link_next["href"]):
+        joined = urllib.parse.urljoin(current_url, link_next["href"])
+        if same_domain(joined, current_url):
+            return joined
+
+    # 2) a[rel=next]
+    a_next = soup.find("a", rel=lambda v: v and "next" in str(v).lower(), href=True)
+    if a_next and is_valid_href(a_next["href"]):
+        joined = urllib.parse.urljoin(current_url, a_next["href"])
+        if same_domain(joined, current_url):
+            return joined
+
+    # 3) テキストヒント
+    tokens = rule.listing_next_hint_tokens if rule else ("次へ", "次の", "もっと見る", "Next", "More")
+    for a in soup.find_all("a", href=True):
+        try:
+            txt = a.get_text(strip=True)
+        except Exception:
+            continue
+        if any(t in txt for t in tokens):
+            href = a.get("href")
+            if href and is_valid_href(href):
+                joined = urllib.parse.urljoin(current_url, href)
+                if same_domain(joined, current_url):
+                    return joined
+    return None
+
+def listing_page_url(base_url: str, rule: Optional[SiteRule], page: int) -> Optional[str]:
+    """SiteRule.listing_page_param から一覧の page ページ目のURLを組み立てる（次ページ先読み用の予測）"""
+    if rule is None or not rule.listing_page_param or page < 1:
+        return None
+    param = rule.listing_page_param
+    parts = urllib.parse.urlsplit(base_url)
+    pairs = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if k != param]
+    if page > 1:
+        pairs.append((param, str(page)))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(pairs), fragment=""))
+
+def extract_article_links_from_listing(
+    soup: BeautifulSoup,
+    current_url: str,
+    rule: Optional[SiteRule],
+    link_limit: int = 80
+) -> List[str]:
+    """一覧ページから記事URLのみ厳密抽出（サイトルール適用）。URLは正規化して重複を除く"""
+    base_netloc = urllib.parse.urlsplit(current_url).netloc.lower()
+    out: List[str] = []
+    seen: Set[str] = set()
+    checked: Set[str] = set()  # 同じ href はページ内で何度も出てくるので1回だけ判定する
+
+    for a in soup.find_all("a", href=True):
+        href = a.get("href")
+        if href in checked or not is_valid_href(href):
+            continue
+        checked.add(href)
+        url = canonicalize_url(urllib.parse.urljoin(current_url, href))
+
+        if urllib.parse.urlsplit(url).netloc != base_netloc:
+            continue
+
+        # 最終ゲート：記事URL判定
+        if not is_article_url(url, rule):
+            continue
+
+        if url not in seen:
+            seen.add(url)
+            out.append(url)
+        if len(out) >= link_limit:
+            break
+
+    return out
+
+@dataclass
+class ParsedArticle:
+    text: str
+    # 構造化データ（JSON-LD・microdata・サイト別セレクタ）から読めたイベント（未正規化）
+    events: List[Dict] = field(default_factory=list)
+
+def parse_article_page(html: str, rule: Optional[SiteRule], parser: str = "html.parser", structured: bool = True) -> ParsedArticle:
+    """記事HTML→本文テキスト＋構造化イベント（1回の解析で両方。構造化データは掃除で消える script 内にあるので先に読む）"""
+    soup = BeautifulSoup(html, parser)
+    events = extract_structured_events(soup, rule) if structured else []
+    return ParsedArticle(_article_text_from_soup(soup, rule), events)
+
+def parse_listing_task(html: str, current_url: str, link_limit: int, parser: str) -> Tuple[List[str], Optional[str]]:
+    return parse_listing_html(html, current_url, get_site_rule(current_url), link_limit=link_limit, parser=parser)
+
+def parse_article_task(html: str, url: str, parser: str, structured: bool = True) -> ParsedArticle:
+    return parse_article_page(html, get_site_rule(url), parser=parser, structured=structured)
+
+# ============================================================
+# Process pool
+# ============================================================
+class ParsePool:
+    """HTML解析をプロセスプールで実行し、結果（URL一覧・次ページURL・本文テキスト）だけを受け取る
+
+    workers=0 なら呼び出しスレッドでそのまま解析する。ワーカーは spawn で起動するので、
+    Streamlit のスレッドを抱えたプロセスを fork することはない。
+    """
+
+    def __init__(self, workers: int = 0, parser: str = "html.parser"):
+        self.workers = max(0, int(workers))
+        self.parser = parser
+        self._ex: Optional[ProcessPoolExecutor] = None
+        if self.workers > 0:
+            self._ex = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def parse_listing(self, html: str, current_url: str, link_limit: int = 80) -> Tuple[List[str], Optional[str]]:
+        if self._ex is None:
+            return parse_listing_task(html, current_url, link_limit, self.parser)
+        return self._ex.submit(parse_listing_task, html, current_url, link_limit, self.parser).result()
+
+    def parse_article(self, html: str, url: str, structured: bool = True) -> ParsedArticle:
+        if self._ex is None:
+            return parse_article_task(html, url, self.parser, structured)
+        return self._ex.submit(parse_article_task, html, url, self.parser, structured).result()
+
+    def close(self) -> None:
+        if self._ex is not None:
+            self._ex.shutdown(wait=False, cancel_futures=True)
+            self._ex = None
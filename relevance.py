@@ -0,0 +1,84 @@
+"""AI抽出前の関連性フィルタ（イベント情報の手がかりが無い記事を Gemini に送らない）
+
+日付表記・会場語・イベント語の出現数から 0〜1 のスコアを出し、しきい値未満の記事は抽出をスキップする。
+新商品発表や決算発表のように日付も会場も出てこない記事は、AI に送っても何も取れないので
+ここで落とす。任意で分類器（text -> 0〜1 の確率を返す callable）を併用できる。
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from extraction import DATE_YMD_RE, DATE_SLASH_RE
+
+# 年なしの日付・曜日・時刻・期間表記（normalize_date の年月日パターンを補う）
+_DATE_EXTRA_PATTERNS = (
+    re.compile(r"(?<![\d年])\d{1,2}月\d{1,2}日"),
+    re.compile(r"[（(][月火水木金土日][・)）]"),
+    re.compile(r"(?<!\d)\d{1,2}:\d{2}\s*[~〜～-]"),
+    re.compile(r"(?:会期|開催期間|開催日|日時|期間)[：:\s]"),
+)
+
+VENUE_KEYWORDS: Tuple[str, ...] = (
+    "会場", "会館", "ホール", "アリーナ", "ドーム", "スタジアム", "公園", "広場", "特設",
+    "百貨店", "ショッピングセンター", "モール", "催事場", "ギャラリー", "美術館", "博物館",
+    "ビッグサイト", "幕張メッセ", "パシフィコ", "インテックス", "メッセ", "ポートメッセ",
+    "店頭", "各店", "店舗", "ホテル", "駅前", "オンライン開催",
+)
+
+EVENT_KEYWORDS: Tuple[str, ...] = (
+    "開催", "イベント", "フェス", "フェア", "祭", "マルシェ", "展示会", "展覧会", "博覧会", "催事",
+    "ポップアップ", "POPUP", "POP UP", "期間限定", "体験会", "試食会", "試飲会", "ワークショップ",
+    "セミナー", "説明会", "ライブ", "コンサート", "上映", "出展", "来場", "入場", "参加費", "先着",
+)
+
+# 記事全体がイベントと無関係であることを示しやすい語（減点のみ）
+NEGATIVE_KEYWORDS: Tuple[str, ...] = (
+    "決算", "業績", "株主", "株式", "配当", "人事異動", "役員", "資金調達", "業務提携", "資本提携",
+)
+
+# 本文の先頭だけを見る（長い記事でも採点コストを一定にする）
+SCORE_PREFIX_CHARS = 6000
+
+@dataclass
+class RelevanceScore:
+    score: float
+    date_hits: int
+    venue_hits: int
+    event_hits: int
+    negative_hits: int
+
+def _count_keywords(text: str, keywords: Tuple[str, ...]) -> int:
+    return sum(text.count(kw) for kw in keywords)
+
+def score_relevance(text: str) -> RelevanceScore:
+    """キーワード・日付パターンによるスコア（日付 0.4 / 会場 0.3 / イベント語 0.3、否定語で最大 -0.2）"""
+    t = (text or "")[:SCORE_PREFIX_CHARS]
+    date_hits = len(DATE_YMD_RE.findall(t)) + len(DATE_SLASH_RE.findall(t))
+    date_hits += sum(len(p.findall(t)) for p in _DATE_EXTRA_PATTERNS)
+    venue_hits = _count_keywords(t, VENUE_KEYWORDS)
+    event_hits = _count_keywords(t, EVENT_KEYWORDS)
+    negative_hits = _count_keywords(t, NEGATIVE_KEYWORDS)
+
+    score = (
+        0.4 * min(date_hits / 2, 1.0)
+        + 0.3 * min(venue_hits / 2, 1.0)
+        + 0.3 * min(event_hits / 3, 1.0)
+        - 0.2 * min(negative_hits / 2, 1.0)
+    )
+    return RelevanceScore(max(score, 0.0), date_hits, venue_hits, event_hits, negative_hits)
+
+class RelevanceFilter:
+    """しきい値未満の記事を抽出対象から外す。classifier を渡すとキーワードスコアと平均する（スレッドセーフ）"""
+
+    def __init__(self, threshold: float = 0.3, classifier: Optional[Callable[[str], float]] = None):
+        self.threshold = threshold
+        self.classifier = classifier
+
+    def score(self, text: str) -> float:
+        s = score_relevance(text).score
+        if self.classifier is not None:
+            s = (s + float(self.classifier(text))) / 2
+        return s
+
+    def is_relevant(self, text: str) -> bool:
+        return self.score(text) >= self.threshold
@@ -0,0 +1,266 @@
+"""クロール結果（イベント一覧）のファイル保存・ページ単位の読み出し・エクスポート
+
+結果はメモリ（セッション）に丸ごと持たず、ファイルに書いて必要なページだけを読む。
+実行中は JSON Lines に1記事ずつ追記し（中断しても読める）、完了時に pyarrow があれば
+Parquet（行グループ単位で書き出し）にまとめ直す。pyarrow は requirements.txt に含めている。
+無い環境では JSON Lines のまま使うが、その場合 ResultTable は全行をメモリに読む（大きな結果には向かない）。
+表示用の並べ替えキーとして、期間（date_info）の最初の日付を YYYY-MM-DD にした date_key を持つ。
+"""
+import csv
+import datetime
+import importlib.util
+import io
+import json
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from extraction import DATE_SLASH_RE, DATE_YMD_RE
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+RESULT_COLUMNS = ("date_info", "name", "place", "description", "source_label", "source_url", "also_source_urls")
+
+# 画面表示・CSV の列名（この順に並べる）
+DISPLAY_COLUMNS = {
+    "date_info": "期間",
+    "name": "イベント名",
+    "place": "場所",
+    "description": "概要",
+    "source_label": "情報源",
+    "source_url": "URL",
+    "also_source_urls": "他の掲載URL",
+}
+
+# Parquet の1行グループ・エクスポート時の1回の書き出しの行数
+ROW_GROUP_ROWS = 1000
+
+# 年の無い「3月1日」は、並べ替えキーを作った年として扱う
+_DATE_MD_RE = re.compile(r"(?<![\d年])(\d{1,2})月(\d{1,2})日")
+
+def date_sort_key(date_info: str, default_year: Optional[int] = None) -> str:
+    """期間表記の最初の日付 → "YYYY-MM-DD"（読めなければ ""。並べ替えでは末尾に回す）"""
+    text = date_info or ""
+    found = []
+    for m in DATE_YMD_RE.finditer(text):
+        found.append((m.start(), int(m.group(1)), int(m.group(2)), int(m.group(3))))
+    for m in DATE_SLASH_RE.finditer(text):
+        found.append((m.start(), int(m.group(1)), int(m.group(2)), int(m.group(3))))
+    if not found:
+        m = _DATE_MD_RE.search(text)
+        if m is None:
+            return ""
+        year = default_year or datetime.date.today().year
+        found.append((m.start(), year, int(m.group(1)), int(m.group(2))))
+    _, y, mo, d = min(found)
+    try:
+        return datetime.date(y, mo, d).isoformat()
+    except ValueError:
+        return ""
+
+def to_row(item: Dict) -> Dict:
+    """イベント → 保存する1行（列をそろえ、他の掲載URLは改行区切りの文字列にする）"""
+    row = {}
+    for col in RESULT_COLUMNS:
+        v = item.get(col)
+        if isinstance(v, list):
+            v = "\n".join(map(str, v))
+        row[col] = "" if v is None else str(v)
+    row["date_key"] = date_sort_key(row["date_info"])
+    return row
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([(col, pa.string()) for col in (*RESULT_COLUMNS, "date_key")])
+
+# ============================================================
+# Write
+# ============================================================
+class ResultWriter:
+    """実行中の結果の追記先（JSON Lines。1回の write ごとにフラッシュするので中断しても読める）"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+
+    def write(self, items: Iterable[Dict]) -> None:
+        for item in items:
+            self._f.write(json.dumps(to_row(item), ensure_ascii=False) + "\n")
+            self.count += 1
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+def write_result_file(base_path: str, items: List[Dict]) -> str:
+    """完了した結果を書き出し、書いたファイルのパスを返す（pyarrow があれば .parquet、無ければ .jsonl）"""
+    os.makedirs(os.path.dirname(base_path) or ".", exist_ok=True)
+    if HAS_PYARROW:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = base_path + ".parquet"
+        tmp = path + ".tmp"
+        schema = _arrow_schema()
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for start in range(0, len(items), ROW_GROUP_ROWS):
+                rows = [to_row(item) for item in items[start:start + ROW_GROUP_ROWS]]
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            if not items:
+                writer.write_table(schema.empty_table())
+    else:
+        path = base_path + ".jsonl"
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(to_row(item), ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return path
+
+# ============================================================
+# Read
+# ============================================================
+def _read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 書き込み途中で止まった最終行
+                    continue
+
+class ResultTable:
+    """結果ファイルの読み出し（絞り込み・並べ替え・ページ分割）
+
+    Parquet は pyarrow の列形式のまま持ち、表示するページの行だけを Python の dict にする。
+    Streamlit では st.cache_resource で（パス, 更新時刻）ごとに1つを全セッションで共有する。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            self._table = pq.read_table(path)
+            self._rows: Optional[List[Dict]] = None
+        else:
+            self._table = None
+            self._rows = list(_read_jsonl(path))
+
+    def __len__(self) -> int:
+        return self._table.num_rows if self._table is not None else len(self._rows)
+
+    def sources(self) -> List[str]:
+        if self._table is not None:
+            import pyarrow.compute as pc
+            return sorted(v for v in pc.unique(self._table["source_label"]).to_pylist() if v)
+        return sorted({r.get("source_label", "") for r in self._rows} - {""})
+
+    def _select(self, keyword: str, sources: Optional[List[str]], sort: str):
+        """条件に合う行の位置（並べ替え済み）"""
+        keyword = (keyword or "").strip()
+        if self._table is not None:
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            table = self._table
+            mask = None
+            if keyword:
+                for col in ("name", "place", "description"):
+                    m = pc.match_substring(table[col], keyword, ignore_case=True)
+                    mask = m if mask is None else pc.or_(mask, m)
+            if sources:
+                m = pc.is_in(table["source_label"], value_set=pa.array(sources, pa.string()))
+                mask = m if mask is None else pc.and_(mask, m)
+            idx = pa.array(range(table.num_rows), pa.int64())
+            if mask is not None:
+                idx = pc.filter(idx, pc.fill_null(mask, False))
+            if sort == "date":
+                # 日付の読めない行（date_key = ""）は末尾（"~" は数字より後に並ぶ）、同じ日付は取得順
+                keys = pc.take(table["date_key"], idx)
+                keys = pc.if_else(pc.equal(keys, ""), "~", keys)
+                order = pc.sort_indices(pa.table({"k": keys, "i": idx}), sort_keys=[("k", "ascending"), ("i", "ascending")])
+                idx = pc.take(idx, order)
+            return idx.to_pylist()
+
+        kw = keyword.lower()
+        positions = [
+            i for i, r in enumerate(self._rows)
+            if (not kw or any(kw in (r.get(c) or "").lower() for c in ("name", "place", "description")))
+            and (not sources or r.get("source_label") in sources)
+        ]
+        if sort == "date":
+            positions.sort(key=lambda i: (not self._rows[i].get("date_key"), self._rows[i].get("date_key", ""), i))
+        return positions
+
+    def _rows_at(self, positions: List[int]) -> List[Dict]:
+        if self._table is not None:
+            import pyarrow as pa
+            return self._table.take(pa.array(positions, pa.int64())).to_pylist() if positions else []
+        return [self._rows[i] for i in positions]
+
+    def query(
+        self,
+        keyword: str = "",
+        sources: Optional[List[str]] = None,
+        sort: str = "date",
+        page: int = 1,
+        page_size: int = 100,
+    ) -> Tuple[List[Dict], int]:
+        """(そのページの行, 条件に合う件数)。sort は "date"（期間の最初の日付順）か "arrival"（取得順）"""
+        positions = self._select(keyword, sources, sort)
+        start = max(page - 1, 0) * page_size
+        return self._rows_at(positions[start:start + page_size]), len(positions)
+
+    def iter_rows(self, sort: str = "date", batch_rows: int = ROW_GROUP_ROWS) -> Iterator[List[Dict]]:
+        positions = self._select("", None, sort)
+        for start in range(0, len(positions), batch_rows):
+            yield self._rows_at(positions[start:start + batch_rows])
+
+# ============================================================
+# Export
+# ============================================================
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+def _export_record(row: Dict) -> Dict:
+    """保存した1行 → エクスポートする1件（date_key を除き、他の掲載URLはリストに戻す）"""
+    r = {c: row.get(c) or "" for c in RESULT_COLUMNS}
+    r["also_source_urls"] = [u for u in r["also_source_urls"].split("\n") if u]
+    return r
+
+def export_path(path: str, fmt: str) -> str:
+    """エクスポート済みファイル（結果ファイルより新しければ作り直さない）"""
+    out = os.path.splitext(path)[0] + f".export.{fmt}"
+    if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path):
+        return out
+    table = ResultTable(path)
+    tmp = out + ".tmp"
+    if fmt == "csv":
+        # Excel で開けるよう BOM 付き UTF-8。列名は画面表示と同じ
+        with open(tmp, "w", encoding="utf-8_sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(DISPLAY_COLUMNS.values())
+            for rows in table.iter_rows():
+                writer.writerows([r.get(c, "") for c in DISPLAY_COLUMNS] for r in rows)
+    elif fmt == "jsonl":
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rows in table.iter_rows():
+                buf = io.StringIO()
+                for r in rows:
+                    buf.write(json.dumps(_export_record(r), ensure_ascii=False) + "\n")
+                f.write(buf.getvalue())
+    elif fmt == "parquet":
+        # JSON Lines と同じ列・順序（date_key は含めず、他の掲載URLはリスト）
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([
+            (c, pa.list_(pa.string()) if c == "also_source_urls" else pa.string()) for c in RESULT_COLUMNS
+        ])
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for rows in table.iter_rows():
+                rows = [_export_record(r) for r in rows]
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    else:
+        raise ValueError(f"unknown export format: {fmt}")
+    os.replace(tmp, out)
+    return out
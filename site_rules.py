@@ -0,0 +1,214 @@
+"""サイトごとのクロールルール（記事URL判定・本文セレクタ・アクセス制御など）
+
+ルールは netloc をキーにした索引で引き、除外パスはルールごとに1本の正規表現にまとめておく
+（一覧ページの全リンクに対して呼ばれるので、ルール数が増えても1件あたりの判定は定数時間）。
+追加のルールは TREND_APP_SITE_RULES で指定した JSON ファイルから読み込める。
+"""
+import argparse
+import json
+import os
+import re
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ============================================================
+# Site rules
+# ============================================================
+@dataclass(frozen=True)
+class SiteRule:
+    name: str
+    match_netloc: str
+    article_path_allow: re.Pattern
+    listing_next_hint_tokens: Tuple[str, ...] = ("次へ", "次の", "もっと見る", "Next", "NEXT", "More", "MORE")
+    # listingに混ざりがちな不要パス
+    deny_path_prefixes: Tuple[str, ...] = ("/ranking", "/tag", "/tags", "/category", "/categories", "/login", "/signup", "/account")
+    # 本文抽出の優先セレクタ
+    content_selectors: Tuple[str, ...] = ("article", "main", "div.article", "div#main", "div.content")
+    # ホスト単位のアクセス制御（None ならサイドバーの既定値）
+    min_interval_sec: Optional[float] = None
+    max_in_flight: Optional[int] = None
+    # HTTPキャッシュの鮮度（秒）。記事は None = 不変扱い（再検証しない）
+    listing_cache_ttl_sec: float = 600.0
+    article_cache_ttl_sec: Optional[float] = None
+    # RSS/Atom・サイトマップ（一覧URLのパスのプレフィックス, フィードURL）。"" は全一覧に適用。
+    # 一覧URLに合うフィードがあれば一覧ページの巡回の代わりにフィードから記事URLを集める
+    feed_urls: Tuple[Tuple[str, str], ...] = ()
+    # 一覧のページ番号のクエリパラメータ名（例 "page" → 2ページ目は ?page=2）。あれば次ページを先読みする
+    # （先読みしたページは、一覧から辿った次ページURLと一致したときだけ使う）
+    listing_page_param: Optional[str] = None
+    # 記事ページのイベント項目を直接読むセレクタ（(項目, CSSセレクタ)、項目は name / place / date_info / description）。
+    # JSON-LD・microdata が無いサイト向け。name と date_info か place が取れた記事は AI 抽出しない
+    event_field_selectors: Tuple[Tuple[str, str], ...] = ()
+    # deny_path_prefixes をまとめた正規表現（小文字化したパスの先頭に対して match）
+    deny_path_re: Optional[re.Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if isinstance(self.article_path_allow, str):
+            object.__setattr__(self, "article_path_allow", re.compile(self.article_path_allow))
+        if self.deny_path_prefixes:
+            pattern = "|".join(re.escape(p.lower()) for p in sorted(self.deny_path_prefixes, key=len, reverse=True))
+            object.__setattr__(self, "deny_path_re", re.compile(pattern))
+
+SITE_RULES: List[SiteRule] = [
+    SiteRule(
+        name="PRTIMES",
+        match_netloc="prtimes.jp",
+        article_path_allow=re.compile(r"^/main/html/rd/p/"),
+        deny_path_prefixes=(
+            "/ranking", "/company", "/categories", "/category", "/tag", "/tags",
+            "/gourmet", "/entertainment", "/fashion", "/beauty", "/sports", "/technology", "/topics",
+        ),
+        content_selectors=("article", "main", "div.main-contents", "div#main", "div.body", "div.content")
+    ),
+    SiteRule(
+        name="AtPress",
+        match_netloc="atpress.ne.jp",
+        article_path_allow=re.compile(r"^/news/\d+"),
+        deny_path_prefixes=("/ranking", "/tag", "/tags", "/category", "/categories", "/login", "/signup", "/account"),
+        content_selectors=("article", "main", "div#main", "div.newsDetail", "div.content")
+    ),
+]
+
+# ============================================================
+# Rule index
+# ============================================================
+_RULES_BY_NETLOC: Dict[str, SiteRule] = {}
+
+def register_site_rules(rules: Iterable[SiteRule]) -> None:
+    """ルールを索引に登録する（同じ match_netloc は後から登録したもので上書き）"""
+    for rule in rules:
+        _RULES_BY_NETLOC[rule.match_netloc.lower()] = rule
+    get_site_rule_for_netloc.cache_clear()
+
+def site_rule_from_dict(d: Dict) -> SiteRule:
+    """JSON の1要素 → SiteRule（配列はタプルに、article_path_allow は正規表現文字列）"""
+    kwargs = dict(d)
+    for key in ("listing_next_hint_tokens", "deny_path_prefixes", "content_selectors"):
+        if key in kwargs:
+            kwargs[key] = tuple(kwargs[key])
+    if "feed_urls" in kwargs:
+        kwargs["feed_urls"] = tuple(tuple(pair) for pair in kwargs["feed_urls"])
+    if "event_field_selectors" in kwargs:
+        # {"name": "h1.title", ...} の形でも書ける
+        selectors = kwargs["event_field_selectors"]
+        pairs = selectors.items() if isinstance(selectors, dict) else selectors
+        kwargs["event_field_selectors"] = tuple(tuple(pair) for pair in pairs)
+    return SiteRule(**kwargs)
+
+def load_site_rules(path: str) -> List[SiteRule]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [site_rule_from_dict(d) for d in data]
+
+@lru_cache(maxsize=4096)
+def get_site_rule_for_netloc(netloc: str) -> Optional[SiteRule]:
+    """完全一致 → 親ドメイン（www.atpress.ne.jp → atpress.ne.jp → ne.jp）の順に引く"""
+    host = netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    while host:
+        rule = _RULES_BY_NETLOC.get(host)
+        if rule is not None:
+            return rule
+        _, _, host = host.partition(".")
+    return None
+
+def get_site_rule(url: str) -> Optional[SiteRule]:
+    return get_site_rule_for_netloc(urllib.parse.urlsplit(url).netloc)
+
+def is_article_url(url: str, rule: Optional[SiteRule]) -> bool:
+    if not rule:
+        return True  # unknown site: allow (汎用運用)
+    path = urllib.parse.urlsplit(url).path or ""
+
+    if rule.deny_path_re is not None and rule.deny_path_re.match(path.lower()):
+        return False
+
+    return bool(rule.article_path_allow.search(path))
+
+register_site_rules(SITE_RULES)
+if os.environ.get("TREND_APP_SITE_RULES"):
+    register_site_rules(load_site_rules(os.environ["TREND_APP_SITE_RULES"]))
+
+# ============================================================
+# URL canonicalization
+# ============================================================
+# 計測・流入元のためだけのクエリ（同じ記事が別URLとして重複しないよう落とす）
+TRACKING_PARAMS = frozenset((
+    "fbclid", "gclid", "dclid", "yclid", "msclkid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "ref_src", "spm",
+))
+TRACKING_PARAM_PREFIXES = ("utm_",)
+
+def canonicalize_url(url: str) -> str:
+    """スキーム・ホストを小文字化し、既定ポート・フラグメント・計測用クエリ・末尾スラッシュを除く（クエリは並べ替え）"""
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+
+    query = parts.query
+    if query:
+        pairs = [
+            (k, v) for k, v in urllib.parse.parse_qsl(query, keep_blank_values=True)
+            if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PARAM_PREFIXES)
+        ]
+        query = urllib.parse.urlencode(sorted(pairs))
+
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))
+
+# ============================================================
+# Micro-benchmark（python site_rules.py --bench）
+# ============================================================
+def _bench(num_rules: int, num_urls: int) -> None:
+    import random
+
+    rng = random.Random(0)
+    rules = [
+        SiteRule(
+            name=f"site{i}",
+            match_netloc=f"site{i}.example.com",
+            article_path_allow=re.compile(r"^/news/\d+"),
+            deny_path_prefixes=tuple(f"/deny{j}" for j in range(20)),
+        )
+        for i in range(num_rules)
+    ]
+    register_site_rules(rules)
+    paths = ["/news/123", "/news/456?utm_source=x#top", "/deny7/abc", "/about/", "/tag/food"]
+    urls = [f"https://www.site{rng.randrange(num_rules)}.example.com{rng.choice(paths)}" for _ in range(num_urls)]
+
+    def linear(url: str) -> bool:
+        # 以前の実装（ルールの線形走査 + prefix ごとの startswith）
+        netloc = urllib.parse.urlparse(url).netloc.lower()
+        rule = next((r for r in rules if r.match_netloc in netloc), None)
+        low = (urllib.parse.urlparse(url).path or "").lower()
+        if rule is None:
+            return True
+        if any(low.startswith(p) for p in rule.deny_path_prefixes):
+            return False
+        return bool(rule.article_path_allow.search(urllib.parse.urlparse(url).path))
+
+    def indexed(url: str) -> bool:
+        return is_article_url(url, get_site_rule(url))
+
+    for name, fn in (("linear", linear), ("indexed", indexed), ("indexed+canonicalize", lambda u: indexed(canonicalize_url(u)))):
+        get_site_rule_for_netloc.cache_clear()
+        t = time.perf_counter()
+        hits = sum(fn(u) for u in urls)
+        dt = time.perf_counter() - t
+        print(f"{name:>22}: {dt * 1e6 / num_urls:8.2f} us/url  ({num_urls} urls, {num_rules} rules, article={hits})")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="サイトルール（記事URL判定）のマイクロベンチマーク")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--rules", type=int, default=500)
+    ap.add_argument("--urls", type=int, default=50_000)
+    args = ap.parse_args()
+    if args.bench:
+        _bench(args.rules, args.urls)
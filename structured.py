@@ -0,0 +1,183 @@
+"""構造化データ（JSON-LD・microdata・サイト別 CSS セレクタ）からのイベント抽出（AI を使わない経路）
+
+schema.org の Event（MusicEvent・ExhibitionEvent・Festival 等の派生型を含む）を記事HTMLから読み、
+AI 抽出と同じ name / place / date_info / description のレコードにする。ここで1件でも取れた記事は
+Gemini に送らない。開始日も会場も無いもの（名前だけの構造化データ）は採用せず、AI 抽出に任せる。
+
+解析プロセス（ParsePool）の中で呼ばれるので、google-genai を import する extraction には依存しない
+（日付の正規化は呼び出し側で normalize_extracted_items を通す）。
+"""
+import json
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from site_rules import SiteRule
+
+STRUCTURED_FIELDS = ("name", "place", "date_info", "description")
+
+# description は AI 抽出の「概要（短めに）」に揃える
+DESCRIPTION_MAX_CHARS = 300
+
+_EVENT_TYPE_RE = re.compile(r"(?:Event|Festival)$")
+_MICRODATA_EVENT_RE = re.compile(r"schema\.org/\w*(?:Event|Festival)\b", re.I)
+_ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})")
+
+# ============================================================
+# Field helpers
+# ============================================================
+def _clip(text: str, limit: int = DESCRIPTION_MAX_CHARS) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+def _is_event_type(value) -> bool:
+    types = value if isinstance(value, list) else [value]
+    return any(isinstance(t, str) and _EVENT_TYPE_RE.search(t.rsplit("/", 1)[-1]) for t in types)
+
+def format_event_date(start: Optional[str], end: Optional[str] = None) -> str:
+    """ISO 8601（2025-03-01T10:00+09:00 等）の開始・終了 → YYYY年MM月DD日〜YYYY年MM月DD日"""
+    def ymd(v: Optional[str]) -> str:
+        m = _ISO_DATE_RE.match((v or "").strip())
+        if not m:
+            return (v or "").strip()
+        return f"{m.group(1)}年{m.group(2).zfill(2)}月{m.group(3).zfill(2)}日"
+
+    s, e = ymd(start), ymd(end)
+    if s and e and e != s:
+        return f"{s}〜{e}"
+    return s or e
+
+def _address_text(address) -> str:
+    if isinstance(address, str):
+        return address.strip()
+    if isinstance(address, dict):
+        parts = [address.get(k) for k in ("addressRegion", "addressLocality", "streetAddress")]
+        return "".join(str(p).strip() for p in parts if p)
+    return ""
+
+def _place_text(location) -> str:
+    if isinstance(location, list):
+        return " / ".join(p for p in (_place_text(loc) for loc in location) if p)
+    if isinstance(location, str):
+        return location.strip()
+    if not isinstance(location, dict):
+        return ""
+    name = str(location.get("name") or "").strip()
+    address = _address_text(location.get("address"))
+    if not name and not address and "VirtualLocation" in str(location.get("@type")):
+        return "オンライン"
+    if name and address and address not in name:
+        return f"{name}（{address}）"
+    return name or address
+
+def _record(name, place, date_info, description) -> Optional[Dict]:
+    name = _clip(str(name or ""), 200)
+    date_info = str(date_info or "").strip()
+    place = str(place or "").strip()
+    # 名前だけのものは採用しない（いつ・どこが無ければ AI 抽出の方が多く拾える）
+    if not name or not (date_info or place):
+        return None
+    return {"name": name, "place": place, "date_info": date_info, "description": _clip(str(description or ""))}
+
+# ============================================================
+# JSON-LD
+# ============================================================
+def _iter_jsonld_nodes(data) -> Iterator[Dict]:
+    """@graph・配列・入れ子（NewsArticle の about / subjectOf 等）も含めてオブジェクトを順に返す"""
+    if isinstance(data, list):
+        for v in data:
+            yield from _iter_jsonld_nodes(v)
+    elif isinstance(data, dict):
+        yield data
+        for v in data.values():
+            if isinstance(v, (dict, list)):
+                yield from _iter_jsonld_nodes(v)
+
+def extract_jsonld_events(soup: BeautifulSoup) -> List[Dict]:
+    out: List[Dict] = []
+    for script in soup.find_all("script", attrs={"type": re.compile(r"application/ld\+json", re.I)}):
+        raw = script.string or script.get_text()
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        for node in _iter_jsonld_nodes(data):
+            if not _is_event_type(node.get("@type")):
+                continue
+            rec = _record(
+                node.get("name"),
+                _place_text(node.get("location")),
+                format_event_date(node.get("startDate"), node.get("endDate")),
+                node.get("description"),
+            )
+            if rec is not None:
+                out.append(rec)
+    return out
+
+# ============================================================
+# Microdata
+# ============================================================
+def _itemprop_value(scope: Tag, prop: str) -> Tuple[str, Optional[Tag]]:
+    """scope 直属の itemprop（入れ子の itemscope、例えば location の name は除く）の値"""
+    for node in scope.find_all(attrs={"itemprop": re.compile(rf"(?:^|\s){prop}(?:\s|$)")}):
+        if node.find_parent(lambda t: t is scope or t.has_attr("itemscope")) is not scope:
+            continue
+        for attr in ("content", "datetime"):
+            if node.get(attr):
+                return str(node[attr]).strip(), node
+        return node.get_text(" ", strip=True), node
+    return "", None
+
+def extract_microdata_events(soup: BeautifulSoup) -> List[Dict]:
+    out: List[Dict] = []
+    for scope in soup.find_all(attrs={"itemtype": _MICRODATA_EVENT_RE}):
+        name, _ = _itemprop_value(scope, "name")
+        start, _ = _itemprop_value(scope, "startDate")
+        end, _ = _itemprop_value(scope, "endDate")
+        description, _ = _itemprop_value(scope, "description")
+        place, loc = _itemprop_value(scope, "location")
+        if loc is not None and loc.has_attr("itemscope"):
+            loc_name, _ = _itemprop_value(loc, "name")
+            loc_addr, _ = _itemprop_value(loc, "address")
+            place = f"{loc_name}（{loc_addr}）" if loc_name and loc_addr else (loc_name or loc_addr or place)
+        rec = _record(name, place, format_event_date(start, end), description)
+        if rec is not None:
+            out.append(rec)
+    return out
+
+# ============================================================
+# Per-site CSS selectors
+# ============================================================
+def extract_selector_event(soup: BeautifulSoup, rule: Optional[SiteRule]) -> List[Dict]:
+    """SiteRule.event_field_selectors（(項目, CSSセレクタ) の組）で1記事1件のイベントとして読む"""
+    if rule is None or not rule.event_field_selectors:
+        return []
+    values: Dict[str, str] = {}
+    for field_name, selector in rule.event_field_selectors:
+        if field_name not in STRUCTURED_FIELDS or field_name in values:
+            continue
+        try:
+            node = soup.select_one(selector)
+        except Exception:
+            continue
+        if node is not None:
+            text = node.get("content") or node.get("datetime") or node.get_text(" ", strip=True)
+            if text:
+                values[field_name] = str(text).strip()
+    rec = _record(values.get("name"), values.get("place"), values.get("date_info"), values.get("description"))
+    return [rec] if rec is not None else []
+
+def extract_structured_events(soup: BeautifulSoup, rule: Optional[SiteRule]) -> List[Dict]:
+    """JSON-LD → microdata → サイト別セレクタの順に試し、最初に取れたものを返す（掃除前の soup を渡す）"""
+    events = extract_jsonld_events(soup) or extract_microdata_events(soup) or extract_selector_event(soup, rule)
+
+    seen = set()
+    out: List[Dict] = []
+    for ev in events:
+        key = (ev["name"], ev["date_info"])
+        if key not in seen:
+            seen.add(key)
+            out.append(ev)
+    return out
@@ -0,0 +1,106 @@
+"""チャンク分割・LLM 呼び出しのリトライ判定・バッチ抽出の失敗時の扱い"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from google.genai import errors as genai_errors
+
+from extraction import (
+    ExtractionBatcher, ExtractionIncomplete, LLMCallError, LLMEngine,
+    estimate_tokens, is_retryable_llm_error, split_text_into_chunks,
+)
+from fake_llm import FakeAPIError, FakeGenaiClient
+
+def _overlap(prev: str, nxt: str) -> str:
+    """nxt の先頭と一致する prev の末尾（最長）"""
+    for n in range(min(len(prev), len(nxt)), 0, -1):
+        if prev.endswith(nxt[:n]):
+            return nxt[:n]
+    return ""
+
+def test_chunks_overlap_at_sentence_boundaries():
+    sentences = [f"第{i:03d}回の告知は会期と会場を含みます。" for i in range(300)]
+    chunks = list(split_text_into_chunks("".join(sentences), max_tokens=200, overlap_tokens=40))
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 200 for c in chunks)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        shared = _overlap(prev, nxt)
+        # 文単位で重なり、重なりは overlap_tokens 以内
+        assert shared and shared.endswith("。") and 0 < estimate_tokens(shared) <= 40
+    # どの文もいずれかのチャンクに丸ごと入る
+    assert all(any(s in c for c in chunks) for s in sentences)
+
+def test_chunks_overlap_when_text_has_no_punctuation():
+    text = "".join(chr(0x3042 + i % 80) for i in range(2500))
+    chunks = list(split_text_into_chunks(text, max_tokens=1000, overlap_tokens=100))
+    assert [len(c) for c in chunks] == [1000, 1000, 700]
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev[-100:] == nxt[:100]
+    assert chunks[0] + "".join(c[100:] for c in chunks[1:]) == text
+
+def _engine(client: FakeGenaiClient, max_retries: int = 2) -> LLMEngine:
+    return LLMEngine(client, "fake-model", 0.0, max_retries=max_retries, base_delay=0.0, max_delay=0.0)
+
+@pytest.mark.parametrize("error", [
+    httpx.ReadTimeout("read timed out"),
+    httpx.ConnectError("connection refused"),
+    httpx.RemoteProtocolError("server disconnected"),
+    genai_errors.APIError(None, {}),
+    FakeAPIError(429),
+    FakeAPIError(503),
+    TimeoutError(),
+])
+def test_transient_errors_are_retryable(error):
+    assert is_retryable_llm_error(error)
+
+@pytest.mark.parametrize("error", [FakeAPIError(400), FakeAPIError(403), ValueError("bad prompt")])
+def test_permanent_errors_are_not_retryable(error):
+    assert not is_retryable_llm_error(error)
+
+def test_read_timeout_is_retried():
+    client = FakeGenaiClient(latency=0, jitter=0, scripted_errors=[httpx.ReadTimeout("read timed out")])
+    engine = _engine(client)
+    assert engine.generate_json("本文: テスト") != ""
+    assert client.calls == 2
+    assert engine.retries == 1
+
+def test_retries_exhausted_raises_llm_call_error():
+    client = FakeGenaiClient(latency=0, jitter=0, scripted_errors=[httpx.ConnectError("refused")] * 3)
+    engine = _engine(client, max_retries=2)
+    with pytest.raises(LLMCallError):
+        engine.generate_json("本文: テスト")
+    assert client.calls == 3
+
+def _article(i: int) -> str:
+    return f"記事{i}：2025年3月{i + 1}日から東京ビッグサイトで春のスイーツフェアを開催します。" * 5
+
+def _extract_all(batcher: ExtractionBatcher, texts):
+    def run(text):
+        try:
+            return batcher.extract(text)
+        except ExtractionIncomplete as e:
+            return e
+    with ThreadPoolExecutor(len(texts)) as pool:
+        return list(pool.map(run, texts))
+
+def test_failed_batch_call_fails_all_entries_without_fallback():
+    client = FakeGenaiClient(latency=0, jitter=0, error_rate=1.0, error_codes=(503,))
+    engine = _engine(client, max_retries=2)
+    batcher = ExtractionBatcher(engine, datetime.date(2025, 1, 1), max_batch_items=3, linger_sec=5.0)
+    results = _extract_all(batcher, [_article(i) for i in range(3)])
+    assert all(isinstance(r, ExtractionIncomplete) for r in results)
+    # バッチ1回分（初回＋リトライ2回）だけ。記事ごとの個別呼び出しはしない
+    assert client.calls == 3
+    assert engine.dropped_chunks == 3
+    assert batcher.fallbacks == 0
+
+def test_unparsable_batch_response_falls_back_per_article():
+    def responder(prompt: str) -> str:
+        return "not json" if "=== ARTICLE" in prompt else '[{"name": "春のスイーツフェア", "place": "", "date_info": ""}]'
+    client = FakeGenaiClient(latency=0, jitter=0, responder=responder)
+    batcher = ExtractionBatcher(_engine(client), datetime.date(2025, 1, 1), max_batch_items=3, linger_sec=5.0)
+    results = _extract_all(batcher, [_article(i) for i in range(3)])
+    assert all(r and r[0]["name"] == "春のスイーツフェア" for r in results)
+    assert client.calls == 1 + 3
+    assert batcher.fallbacks == 3
@@ -0,0 +1,61 @@
+"""記事本文抽出のゴールデンテスト
+
+parse_article_page（本文ノードを先に特定し、その部分木だけを掃除する経路）が、
+従来経路（ページ全体を clean_soup → extract_main_text）と同じ本文を返すことを確かめる。
+"""
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from parsing import available_html_parsers, clean_soup, extract_main_text, parse_article_page
+from site_rules import SITE_RULES
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+PRTIMES_RULE, ATPRESS_RULE = SITE_RULES[0], SITE_RULES[1]
+
+CASES = [
+    ("prtimes_article.html", PRTIMES_RULE),
+    ("atpress_article.html", ATPRESS_RULE),
+    ("no_content_node.html", PRTIMES_RULE),
+    ("prtimes_article.html", None),
+]
+
+def _read(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+def _reference_text(html: str, rule, parser: str) -> str:
+    soup = BeautifulSoup(html, parser)
+    clean_soup(soup)
+    return extract_main_text(soup, rule)
+
+@pytest.mark.parametrize("parser", available_html_parsers())
+@pytest.mark.parametrize("name,rule", CASES)
+def test_article_text_matches_reference(name, rule, parser):
+    html = _read(name)
+    text = parse_article_page(html, rule, parser=parser, structured=False).text
+    assert text == _reference_text(html, rule, parser)
+
+def test_prtimes_body_without_noise():
+    text = parse_article_page(_read("prtimes_article.html"), PRTIMES_RULE, structured=False).text
+    assert "東京ビッグサイト 西1ホール" in text
+    assert "※入場無料" in text
+    for noise in ("広告：今だけ送料無料", "trackImpression", "おすすめのリリース", "1位の記事", "ランキング外のおすすめ記事"):
+        assert noise not in text
+
+def test_atpress_skips_article_under_excluded_ancestor():
+    # 最初の article はサイドバーの中なので選ばれず、main が本文になる
+    text = parse_article_page(_read("atpress_article.html"), ATPRESS_RULE, structured=False).text
+    assert text.startswith("クラフトビールフェス2025 開催決定")
+    assert "サイドバーに置かれた別のニュース" not in text
+    assert "200種類以上" in text
+    for noise in ("バナー広告", "JavaScript を有効にしてください", "シェア", "icon"):
+        assert noise not in text
+
+def test_falls_back_to_whole_page_when_no_content_node_survives():
+    text = parse_article_page(_read("no_content_node.html"), PRTIMES_RULE, structured=False).text
+    assert "県内30の酒蔵" in text
+    assert "サイドバー内の article" not in text
+    assert "ホーム" not in text and "フッター" not in text